@@ -0,0 +1,210 @@
+"""
+Time-aware availability: weekly time-slot bitmaps for paid hours and bans
+
+The week is split into 15-minute slots (672). Every distinct rule is
+compiled once into a packed bitmap of those slots:
+
+- paid hours per tariff group, from `avgiftstid` (via `parse_avgiftstid`)
+- night parking bans per feature, from `nattparkeringsforbud`
+
+Each feature only stores which rule applies to it, so "is this spot paid
+/ banned at T" is one bit lookup per rule and a gather per feature, and
+can be used as a vectorized filter in `rank_parking`.
+
+`python availability.py` checks the compiled bitmaps and the minute-level
+calendar of TariffTable against hand-written windows for every
+`avgiftstid` in `takstgruppe_lookup.json`.
+"""
+import sys
+from datetime import timedelta
+
+import numpy as np
+
+from tariff_engine import MINUTES_PER_DAY, MINUTES_PER_WEEK, TariffTable, oslo_now, parse_avgiftstid
+
+SLOT_MINUTES = 15
+SLOTS_PER_WEEK = MINUTES_PER_WEEK // SLOT_MINUTES
+
+# The data only says whether a ban exists ('Ja'), not when it applies;
+# bans are taken to cover these hours every night
+NIGHT_BAN = 'Kl. 00:00-07:00'
+
+# "Overnight" for the legal-overnight filter: this evening until the next morning
+OVERNIGHT_FROM = 18 * 60
+OVERNIGHT_MINUTES = 14 * 60
+
+# Paid windows (weekday, start minute, end minute) of every avgiftstid in
+# takstgruppe_lookup.json, written out by hand for `check_tariff_file`;
+# None means no schedule
+EXPECTED_WINDOWS = {
+    'Kl. 09:00-20:00 (man-lør)': [(day, 9 * 60, 20 * 60) for day in range(6)],
+    'Kl. 09:00-20:00 (man-søn)': [(day, 9 * 60, 20 * 60) for day in range(7)],
+    'Kl. 13:00-20:00 (man-fre) og 09:00-20:00 (lør) ':
+        [(day, 13 * 60, 20 * 60) for day in range(5)] + [(5, 9 * 60, 20 * 60)],
+    'Kl. 00-24': [(day, 0, 24 * 60) for day in range(7)],
+    'Døgnet rundt': [(day, 0, 24 * 60) for day in range(7)],
+    None: None,
+}
+
+# Rule numbers shared by every model
+NO_RULE = 0        # never paid / never banned
+UNKNOWN_RULE = -1  # no parseable schedule
+
+
+def windows_to_slots(windows):
+    """Boolean (SLOTS_PER_WEEK,) array: slots overlapping any (weekday, start, end) window"""
+    minutes = np.zeros(MINUTES_PER_WEEK, dtype=bool)
+    for day, start, end in windows:
+        minutes[day * MINUTES_PER_DAY + start:day * MINUTES_PER_DAY + end] = True
+    return minutes.reshape(SLOTS_PER_WEEK, SLOT_MINUTES).any(axis=1)
+
+
+def compile_rules(texts):
+    """
+    Packed bitmaps for rule texts. Returns (bitmaps, rule_of): bitmaps is a
+    (R, SLOTS_PER_WEEK / 8) uint8 array whose row 0 is the empty rule, and
+    rule_of maps each text to its row, or UNKNOWN_RULE if it can't be parsed.
+    Identical schedules share a row.
+    """
+    rows = [np.zeros(SLOTS_PER_WEEK, dtype=bool)]
+    seen = {rows[0].tobytes(): NO_RULE}
+    rule_of = {}
+    for text in texts:
+        if text in rule_of:
+            continue
+        try:
+            slots = windows_to_slots(parse_avgiftstid(text))
+        except ValueError:
+            rule_of[text] = UNKNOWN_RULE
+            continue
+        key = slots.tobytes()
+        if key not in seen:
+            seen[key] = len(rows)
+            rows.append(slots)
+        rule_of[text] = seen[key]
+    return np.packbits(np.array(rows), axis=1), rule_of
+
+
+def week_slot(when):
+    """Slot number of a naive Oslo-local datetime"""
+    return (when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute) // SLOT_MINUTES
+
+
+def bit_set(bitmaps, rules, slot):
+    """Bit `slot` of each rule's bitmap; UNKNOWN_RULE gives False"""
+    rules = np.asarray(rules)
+    bits = (bitmaps[np.maximum(rules, 0), slot >> 3] >> (7 - (slot & 7))) & 1
+    return (bits == 1) & (rules >= 0)
+
+
+def any_bit(bitmaps, slot, n_slots):
+    """Per rule: is any bit set in the n_slots slots from `slot` (wrapping around the week)?"""
+    slots = np.unpackbits(bitmaps, axis=1, count=SLOTS_PER_WEEK)
+    window = (slot + np.arange(min(n_slots, SLOTS_PER_WEEK))) % SLOTS_PER_WEEK
+    return slots[:, window].any(axis=1)
+
+
+class AvailabilityModel:
+    """Paid-hours and ban rules compiled for the rows of one parking DataFrame"""
+
+    def __init__(self, parking_df, tariff_table=None):
+        self.size = len(parking_df)
+
+        # Paid hours: one rule per tariff group's avgiftstid
+        texts = [info.get('avgiftstid') for info in tariff_table.info] if tariff_table is not None else []
+        self.paid_bitmaps, paid_rule_of = compile_rules(texts)
+        group_rules = np.array([paid_rule_of[text] for text in texts] + [UNKNOWN_RULE], dtype=np.int16)
+        if tariff_table is not None and 'takstgruppe1' in parking_df:
+            # Unknown groups (-1) pick the trailing UNKNOWN_RULE
+            self.paid_rule = group_rules[tariff_table.lookup(parking_df['takstgruppe1'].to_numpy())]
+        else:
+            self.paid_rule = np.full(self.size, UNKNOWN_RULE, dtype=np.int16)
+
+        # Bans: features flagged 'Ja' get the night ban, everything else none
+        self.ban_bitmaps, ban_rule_of = compile_rules([NIGHT_BAN])
+        banned = (parking_df['nattparkeringsforbud'] == 'Ja').to_numpy() if 'nattparkeringsforbud' in parking_df \
+            else np.zeros(self.size, dtype=bool)
+        self.ban_rule = np.where(banned, ban_rule_of[NIGHT_BAN], NO_RULE).astype(np.int16)
+
+    def paid_at(self, when=None):
+        """True where parking is paid at `when` (default: now); False if free or unknown"""
+        return bit_set(self.paid_bitmaps, self.paid_rule, week_slot(when or oslo_now()))
+
+    def free_at(self, when=None):
+        """True where the schedule is known and nothing is charged at `when`"""
+        return (self.paid_rule >= 0) & ~self.paid_at(when)
+
+    def banned_at(self, when=None):
+        return bit_set(self.ban_bitmaps, self.ban_rule, week_slot(when or oslo_now()))
+
+    def allowed_during(self, start, minutes):
+        """True where no ban applies at any time in [start, start + minutes)"""
+        first = week_slot(start)
+        last = week_slot(start + timedelta(minutes=max(minutes, 1) - 1))
+        n_slots = (last - first) % SLOTS_PER_WEEK + 1 + SLOTS_PER_WEEK * (minutes // MINUTES_PER_WEEK)
+        return ~any_bit(self.ban_bitmaps, first, n_slots)[self.ban_rule]
+
+
+def overnight_start(when=None):
+    """Start of the coming (or current) overnight stay"""
+    when = when or oslo_now()
+    evening = when.replace(hour=OVERNIGHT_FROM // 60, minute=OVERNIGHT_FROM % 60, second=0, microsecond=0)
+    # Past midnight but still night: the stay started yesterday evening
+    if when.hour * 60 + when.minute < (OVERNIGHT_FROM + OVERNIGHT_MINUTES) % MINUTES_PER_DAY:
+        evening -= timedelta(days=1)
+    return evening
+
+
+# Filter predicates for rank_parking, for DataFrames the model was built from
+def free_now(model, when=None):
+    def predicate(df):
+        if len(df) != model.size:
+            raise ValueError("availability model does not match the DataFrame")
+        return model.free_at(when)
+    return predicate
+
+
+def legal_overnight(model, when=None):
+    def predicate(df):
+        if len(df) != model.size:
+            raise ValueError("availability model does not match the DataFrame")
+        return model.allowed_during(overnight_start(when), OVERNIGHT_MINUTES)
+    return predicate
+
+
+def check_tariff_file(filepath='takstgruppe_lookup.json'):
+    """
+    Check every avgiftstid in the tariff file against EXPECTED_WINDOWS: the
+    compiled bitmap must set exactly the expected slots and TariffTable
+    must charge exactly the expected minutes. Returns the number of groups
+    checked; raises AssertionError on a mismatch or an avgiftstid missing
+    from the table.
+    """
+    table = TariffTable.from_file(filepath)
+    bitmaps, rule_of = compile_rules(info.get('avgiftstid') for info in table.info)
+    slots = np.arange(SLOTS_PER_WEEK)
+    for g, info in enumerate(table.info):
+        text = info.get('avgiftstid')
+        assert text in EXPECTED_WINDOWS, f"no expected windows for {text!r}"
+        windows = EXPECTED_WINDOWS[text]
+        if windows is None:
+            assert rule_of[text] == UNKNOWN_RULE and not table.has_windows[g], text
+            continue
+
+        expected = np.zeros(MINUTES_PER_WEEK, dtype=bool)
+        for day, start, end in windows:
+            expected[day * MINUTES_PER_DAY + start:day * MINUTES_PER_DAY + end] = True
+        paid = np.diff(table.paid_cumulative[g]) > 0
+        assert np.array_equal(paid, expected), \
+            f"{text!r}: TariffTable differs at minute {np.flatnonzero(paid != expected)[0]}"
+
+        bits = bit_set(bitmaps, np.full(SLOTS_PER_WEEK, rule_of[text]), slots)
+        expected_slots = expected.reshape(SLOTS_PER_WEEK, SLOT_MINUTES).any(axis=1)
+        assert np.array_equal(bits, expected_slots), \
+            f"{text!r}: bitmap differs at slot {np.flatnonzero(bits != expected_slots)[0]}"
+    return len(table)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else 'takstgruppe_lookup.json'
+    print(f"✓ {check_tariff_file(path)} tariff groups match the expected paid windows")
@@ -0,0 +1,248 @@
+"""
+Batch nearest-parking queries for many origins
+
+Reads origins (CSV or Parquet with `lat`/`lon` and an optional `id` column)
+in chunks, answers k-nearest parking plus tariff info for every origin on a
+process pool (blocked distance matrices, or the spatial index for large
+datasets), and streams the results to CSV or Parquet in input order.
+Each worker loads the parking data and its lookup structures once; at
+most a few chunks are in flight, so memory stays bounded for any input size.
+Origins that are not finite get no rows; the summary counts them.
+
+Usage:
+    python batch_query.py origins.csv results.csv [-k 5] [--workers 8] [--stay 120] [--at 2026-01-05T10:00]
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from parking_core import EARTH_RADIUS_M, compact_features, integer_columns, load_parking_data, load_tariff_data
+from parking_store import DEFAULT_STORE, load_parking_store, store_is_current
+from spatial_index import ParkingIndex
+from tariff_engine import TariffTable, oslo_now
+
+# Attribute columns copied into every result row
+RESULT_COLUMNS = ['objectid', 'globalid', 'beregnet_antall', 'takstgruppe1', 'beboerparkeringssone']
+
+# Above this many features, per-origin index lookups beat a full distance matrix
+MATRIX_MAX_FEATURES = 20000
+# Distance-matrix cells per block, bounding worker memory (~16 MB of float64)
+MATRIX_BLOCK_CELLS = 2_000_000
+
+# Per-process state, set up once by _init_worker
+_worker = {}
+
+
+def load_features(data_path='parking_data.json', store_path=DEFAULT_STORE):
+    """Parking features for batch work, from the compiled store when current"""
+    if store_path and store_is_current(store_path, data_path):
+        df = load_parking_store(store_path, columns=RESULT_COLUMNS)
+    else:
+        df = load_parking_data(data_path)
+    if df is None:
+        raise FileNotFoundError(data_path)
+    return compact_features(df, RESULT_COLUMNS, coordinate_dtype=np.float64).reset_index(drop=True)
+
+
+def _init_worker(data_path, store_path, tariff_path, k, stay_minutes, start, method):
+    df = load_features(data_path, store_path)
+    tariff_data = load_tariff_data(tariff_path)
+    tariff_table = TariffTable(tariff_data) if tariff_data else None
+
+    # Tariff info is computed once per feature, not per result row
+    tariff = pd.DataFrame(index=df.index)
+    if tariff_table is not None and 'takstgruppe1' in df:
+        group = tariff_table.lookup(df['takstgruppe1'].to_numpy())
+        info = [tariff_table.info[g] if g >= 0 else {} for g in group]
+        tariff['avgiftstid'] = [i.get('avgiftstid') for i in info]
+        tariff['maks_tid'] = [i.get('maks_tid') for i in info]
+        tariff['price_bensin'] = tariff_table.price(group, stay_minutes, start=start, fuel='bensin')
+        tariff['price_elbil'] = tariff_table.price(group, stay_minutes, start=start, fuel='elbil')
+
+    if method == 'auto':
+        method = 'matrix' if len(df) <= MATRIX_MAX_FEATURES else 'index'
+
+    _worker.update(
+        features=integer_columns(pd.concat([df, tariff], axis=1)),
+        method=method,
+        k=k,
+    )
+    if method == 'index':
+        _worker['index'] = ParkingIndex.from_dataframe(df)
+    else:
+        lat_rad = np.radians(df['lat'].to_numpy(dtype=np.float64))
+        _worker.update(lat_rad=lat_rad, lon_rad=np.radians(df['lon'].to_numpy(dtype=np.float64)),
+                       cos_lat=np.cos(lat_rad))
+
+
+def _matrix_knn(lats, lons, k):
+    """k nearest per origin from blocked (origins x features) haversine matrices"""
+    lat_rad, lon_rad, cos_lat = _worker['lat_rad'], _worker['lon_rad'], _worker['cos_lat']
+    k = min(k, len(lat_rad))
+    block = max(1, MATRIX_BLOCK_CELLS // max(len(lat_rad), 1))
+
+    positions = np.empty((len(lats), k), dtype=np.intp)
+    distances = np.empty((len(lats), k))
+    for start in range(0, len(lats), block):
+        o_lat = np.radians(lats[start:start + block])[:, None]
+        o_lon = np.radians(lons[start:start + block])[:, None]
+        a = np.sin((lat_rad - o_lat) / 2) ** 2 + np.cos(o_lat) * cos_lat * np.sin((lon_rad - o_lon) / 2) ** 2
+        d = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+        top = np.argpartition(d, k - 1, axis=1)[:, :k] if k < d.shape[1] else np.tile(np.arange(k), (len(d), 1))
+        top_d = np.take_along_axis(d, top, axis=1)
+        order = np.argsort(top_d, axis=1, kind='stable')
+        positions[start:start + block] = np.take_along_axis(top, order, axis=1)
+        distances[start:start + block] = np.take_along_axis(top_d, order, axis=1)
+    return positions, distances
+
+
+def _query_chunk(origins):
+    """k nearest features for each (id, lat, lon) row of a chunk"""
+    features, k = _worker['features'], _worker['k']
+
+    lats = origins['lat'].to_numpy(dtype=np.float64)
+    lons = origins['lon'].to_numpy(dtype=np.float64)
+    rows = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons))
+    if not len(rows) or not len(features):
+        return pd.DataFrame()
+
+    if _worker['method'] == 'matrix':
+        found, dist = _matrix_knn(lats[rows], lons[rows], k)
+        positions = found.ravel()
+        distances = dist.ravel()
+        origin_rows = np.repeat(rows, found.shape[1])
+        ranks = np.tile(np.arange(1, found.shape[1] + 1), len(rows))
+    else:
+        index = _worker['index']
+        results = [index.knn(lats[row], lons[row], k) for row in rows]
+        positions = np.concatenate([found for found, _ in results])
+        distances = np.concatenate([dist for _, dist in results])
+        origin_rows = np.repeat(rows, [len(found) for found, _ in results])
+        ranks = np.concatenate([np.arange(1, len(found) + 1) for found, _ in results])
+
+    result = features.iloc[positions].reset_index(drop=True)
+    result.insert(0, 'distance', np.round(distances, 1))
+    result.insert(0, 'rank', ranks)
+    result.insert(0, 'origin_id', origins['id'].to_numpy()[origin_rows])
+    return result
+
+
+def read_origins(path, chunk_size):
+    """Yield DataFrames of origins with 'id', 'lat', 'lon'"""
+    offset = 0
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("Reading Parquet needs pyarrow (pip install pyarrow)")
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size))
+    else:
+        chunks = pd.read_csv(path, chunksize=chunk_size)
+
+    for chunk in chunks:
+        chunk = chunk.rename(columns=str.lower)
+        if 'id' not in chunk:
+            chunk['id'] = np.arange(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield chunk[['id', 'lat', 'lon']]
+
+
+class ResultWriter:
+    """Append result chunks to a CSV or Parquet file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        self._writer = None
+        self._wrote_header = False
+
+    def write(self, df):
+        if df.empty:
+            return
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            df.to_csv(self.path, mode='a' if self._wrote_header else 'w', header=not self._wrote_header, index=False)
+            self._wrote_header = True
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def run_batch(origins_path, output_path, k=5, workers=None, chunk_size=5000, stay_minutes=60, start=None,
+              method='auto', data_path='parking_data.json', store_path=DEFAULT_STORE, tariff_path='takstgruppe_lookup.json'):
+    """
+    Answer every origin in `origins_path` and write results to `output_path`.
+    Returns (origins processed, origins skipped for non-finite coordinates).
+    """
+    workers = workers or os.cpu_count() or 1
+    start = start or oslo_now()
+    writer = ResultWriter(output_path)
+    processed = skipped = 0
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(data_path, store_path, tariff_path, k, stay_minutes, start, method),
+    ) as pool:
+        # Bounded window of in-flight chunks, written in submission order
+        pending = deque()
+        for chunk in read_origins(origins_path, chunk_size):
+            pending.append(pool.submit(_query_chunk, chunk))
+            processed += len(chunk)
+            skipped += int((~(np.isfinite(chunk['lat'].to_numpy(dtype=np.float64)) &
+                              np.isfinite(chunk['lon'].to_numpy(dtype=np.float64)))).sum())
+            if len(pending) >= 2 * workers:
+                writer.write(pending.popleft().result())
+        while pending:
+            writer.write(pending.popleft().result())
+
+    writer.close()
+    return processed, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nearest parking for a file of origins")
+    parser.add_argument('origins', help="CSV or .parquet with lat, lon and optional id columns")
+    parser.add_argument('output', help="Results file (.csv or .parquet)")
+    parser.add_argument('-k', type=int, default=5, help="Parking spots per origin")
+    parser.add_argument('--workers', type=int, default=None, help="Processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--stay', type=int, default=60, help="Planned stay in minutes, for prices")
+    parser.add_argument('--at', type=datetime.fromisoformat, default=None,
+                        help="Arrival time for prices, Oslo local (default: now)")
+    parser.add_argument('--method', choices=['auto', 'matrix', 'index'], default='auto',
+                        help="Blocked distance matrix (small datasets) or spatial index (large ones)")
+    parser.add_argument('--data', default='parking_data.json')
+    parser.add_argument('--store', default=DEFAULT_STORE)
+    parser.add_argument('--tariffs', default='takstgruppe_lookup.json')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    processed, skipped = run_batch(args.origins, args.output, k=args.k, workers=args.workers,
+                                   chunk_size=args.chunk_size, stay_minutes=args.stay, start=args.at,
+                                   method=args.method, data_path=args.data, store_path=args.store,
+                                   tariff_path=args.tariffs)
+    elapsed = time.perf_counter() - started
+    print(f"✓ {processed} origins in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.0f}/s) -> {args.output}")
+    if skipped:
+        print(f"  {skipped} origins without finite coordinates were skipped")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
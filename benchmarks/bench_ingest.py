@@ -0,0 +1,143 @@
+"""
+Benchmark: peak memory of loading ArcGIS JSON exports
+
+Builds synthetic exports by replicating `parking_data.json` (new objectids,
+coordinates shifted a little per copy), split into overlapping "zone"
+files. Each loader runs in its own process and reports its peak RSS over
+the RSS after imports:
+
+- json: `json.load` + `features_to_dataframe` + `compact_features` per file
+  (the old path), concatenated and de-duplicated
+- stream: `stream_parking_data` over all zone files at once
+
+Usage:
+    python benchmarks/bench_ingest.py [--copies 10 50 200] [--zones 3] [--json out.json]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Zone files share this fraction of their features with the next zone
+OVERLAP = 0.05
+
+
+def write_exports(source, copies, zones, directory):
+    """Write `zones` files holding `copies` shifted copies of the source features; returns the paths"""
+    with open(source, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    features = data['features']
+    meta = {key: value for key, value in data.items() if key != 'features'}
+    step = max(int(max(f['attributes']['objectid'] for f in features)) + 1, 1)
+
+    def shifted(feature, copy):
+        shift = 0.002 * copy
+        geometry = json.loads(json.dumps(feature['geometry']))
+        for key in ('rings', 'paths'):
+            for part in geometry.get(key, []):
+                for point in part:
+                    point[0] += shift
+        if 'x' in geometry:
+            geometry['x'] += shift
+        attributes = dict(feature['attributes'], objectid=feature['attributes']['objectid'] + copy * step)
+        return {'attributes': attributes, 'geometry': geometry}
+
+    per_zone = copies / zones
+    paths = []
+    for zone in range(zones):
+        first = int(zone * per_zone)
+        last = min(copies, int((zone + 1) * per_zone + max(1, OVERLAP * per_zone)))
+        path = os.path.join(directory, f"zone_{zone}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(meta)[:-1] + ', "features": [')
+            for copy in range(first, last):
+                for i, feature in enumerate(features):
+                    if copy > first or i:
+                        f.write(',')
+                    f.write(json.dumps(shifted(feature, copy), ensure_ascii=False))
+            f.write(']}')
+        paths.append(path)
+    return paths
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(method, paths):
+    """Load `paths` with one method and print rows, time and peak RSS as JSON"""
+    import pandas as pd
+    from parking_core import compact_features, features_to_dataframe
+    from parking_stream import stream_parking_data
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if method == 'json':
+        frames = []
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                features = json.load(f).get('features', [])
+            frames.append(compact_features(features_to_dataframe(features)))
+            del features
+        df = pd.concat(frames, ignore_index=True).drop_duplicates('objectid')
+    else:
+        df, _ = stream_parking_data(paths)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'rows': len(df),
+        'seconds': round(elapsed, 2),
+        'peak_mb': round(peak_rss_mb() - baseline, 1),
+        'frame_mb': round(df.memory_usage(deep=True).sum() / 2 ** 20, 1),
+    }))
+
+
+def run(copies, zones, source):
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_exports(source, copies, zones, directory)
+        json_mb = sum(os.path.getsize(path) for path in paths) / 2 ** 20
+        result = {'copies': copies, 'zones': zones, 'json_mb': round(json_mb, 1)}
+        for method in ('json', 'stream'):
+            output = subprocess.run([sys.executable, __file__, '--child', method, *paths],
+                                    capture_output=True, text=True, check=True, cwd=ROOT).stdout
+            result[method] = json.loads(output.strip().splitlines()[-1])
+        assert result['json']['rows'] == result['stream']['rows'], "loaders disagree on the row count"
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--copies', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--zones', type=int, default=3)
+    parser.add_argument('--source', default=os.path.join(ROOT, 'parking_data.json'))
+    parser.add_argument('--json', help="Write the results to this file")
+    parser.add_argument('--child', nargs='+', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1:])
+        return
+
+    results = []
+    print(f"{'rows':>8} {'JSON MB':>8} | {'json.load MB':>12} {'s':>6} | {'stream MB':>9} {'s':>6} | {'frame MB':>8}")
+    for copies in args.copies:
+        result = run(copies, args.zones, args.source)
+        results.append(result)
+        old, new = result['json'], result['stream']
+        print(f"{new['rows']:>8} {result['json_mb']:>8} | {old['peak_mb']:>12} {old['seconds']:>6} | "
+              f"{new['peak_mb']:>9} {new['seconds']:>6} | {new['frame_mb']:>8}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+Benchmark: data and query pipeline, headless
+
+Builds synthetic datasets by replicating `parking_data.json` (each copy is
+shifted to a random spot around Oslo and given fresh ids), then times:
+
+- load: `load_parking_data` from JSON, and compile + open of the columnar store
+- query: `find_nearest_parking` and a filtered, priced `rank_parking`
+  (latency percentiles over random origins)
+- map: `create_map` for 50 results and the clustered overview, built and rendered
+- pricing: `format_pricing_info`
+- memory: tracemalloc peak while loading, DataFrame size full vs.
+  `compact_features`, and process max RSS
+
+Results can be written as JSON and compared against an earlier run.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--scales 1 10 100 1000] [--json out.json] [--compare old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+
+from parking_core import (  # noqa: E402
+    capacity_at_least,
+    compact_features,
+    create_map,
+    create_overview_map,
+    find_nearest_parking,
+    format_pricing_info,
+    get_tariff_info,
+    load_parking_data,
+    load_tariff_data,
+    prepare_coordinates,
+    rank_parking,
+)
+from parking_store import compile_parking_data, load_parking_store  # noqa: E402
+from tariff_engine import TariffTable  # noqa: E402
+
+SOURCE = os.path.join(ROOT, 'parking_data.json')
+TARIFFS = os.path.join(ROOT, 'takstgruppe_lookup.json')
+
+# Copies are shifted within roughly the Oslo byggesone
+SHIFT_LAT = 0.06
+SHIFT_LON = 0.15
+
+
+def make_synthetic_dataset(target, scale, seed=0, source=SOURCE):
+    """Write `scale` shifted copies of the source features to `target`, one feature at a time"""
+    with open(source, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    features = data.pop('features')
+    rng = np.random.default_rng(seed)
+
+    with open(target, 'w', encoding='utf-8') as out:
+        out.write(json.dumps(data, ensure_ascii=False)[:-1] + ', "features": [')
+        first = True
+        next_id = 1
+        for copy in range(scale):
+            dlat, dlon = (0.0, 0.0) if copy == 0 else (rng.uniform(-SHIFT_LAT, SHIFT_LAT), rng.uniform(-SHIFT_LON, SHIFT_LON))
+            for feature in features:
+                attrs = dict(feature['attributes'])
+                attrs['objectid'] = next_id
+                attrs['globalid'] = '{' + str(uuid.UUID(int=next_id)).upper() + '}'
+                next_id += 1
+                rings = [[[x + dlon, y + dlat] for x, y in ring] for ring in feature['geometry']['rings']]
+                if not first:
+                    out.write(',')
+                out.write(json.dumps({'attributes': attrs, 'geometry': {'rings': rings}}, ensure_ascii=False))
+                first = False
+        out.write(']}')
+
+
+def percentiles_ms(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p95_ms': round(float(np.percentile(samples, 95)), 3),
+        'p99_ms': round(float(np.percentile(samples, 99)), 3),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_scale(scale, workdir, n_queries=200, seed=0):
+    path = os.path.join(workdir, f'parking_x{scale}.json')
+    store_path = os.path.join(workdir, f'parking_x{scale}.pkstore')
+    make_synthetic_dataset(path, scale, seed=seed)
+
+    result = {'scale': scale, 'json_mb': round(os.path.getsize(path) / 1e6, 1)}
+
+    # Load
+    df, load_s = timed(load_parking_data, path)
+    result['features'] = len(df)
+    result['load_json_s'] = round(load_s, 3)
+    result['frame_mb'] = round(df.memory_usage(deep=True).sum() / 1e6, 2)
+    result['compact_frame_mb'] = round(compact_features(df).memory_usage(deep=True).sum() / 1e6, 2)
+    _, compile_s = timed(compile_parking_data, path, store_path)
+    result['store_compile_s'] = round(compile_s, 3)
+    _, store_load_s = timed(load_parking_store, store_path)
+    result['store_load_s'] = round(store_load_s, 4)
+
+    tracemalloc.start()
+    load_parking_data(path)
+    result['load_json_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+    tracemalloc.reset_peak()
+    store_df = load_parking_store(store_path, columns=['takstgruppe1', 'beregnet_antall'])
+    store_df['lat'].sum()
+    result['load_store_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+    tracemalloc.stop()
+    del store_df
+
+    # Queries
+    coords = prepare_coordinates(df)
+    tariff_table = TariffTable.from_file(TARIFFS)
+    rng = np.random.default_rng(seed + 1)
+    origins = list(zip(rng.uniform(59.89, 59.95, n_queries), rng.uniform(10.70, 10.82, n_queries)))
+
+    samples = [timed(find_nearest_parking, lat, lon, df, 10, coords=coords)[1] for lat, lon in origins]
+    result['nearest_query'] = percentiles_ms(samples)
+
+    filters = [capacity_at_least(3)]
+    weights = {'distance': 1.0, 'cost': 5.0, 'capacity': 10.0}
+    samples = [timed(rank_parking, lat, lon, df, 10, coords=coords, filters=filters, weights=weights,
+                     tariff_table=tariff_table)[1] for lat, lon in origins]
+    result['ranked_query'] = percentiles_ms(samples)
+
+    # Map building, including the HTML render st_folium would do
+    tariff_data = load_tariff_data(TARIFFS)
+    lat, lon = origins[0]
+    nearest = find_nearest_parking(lat, lon, df, 50, coords=coords)
+    samples = [timed(lambda: create_map((lat, lon), nearest, tariff_data=tariff_data).get_root().render())[1]
+               for _ in range(5)]
+    result['map_50_markers'] = percentiles_ms(samples)
+    html, overview_s = timed(lambda: create_overview_map((lat, lon), df, mode='cluster', tariff_data=tariff_data).get_root().render())
+    result['overview_map_s'] = round(overview_s, 3)
+    result['overview_map_kb'] = round(len(html.encode('utf-8')) / 1024, 1)
+
+    # Pricing text
+    tariff_info = get_tariff_info(df['takstgruppe1'].iloc[0], tariff_data)
+    samples = [timed(format_pricing_info, tariff_info)[1] for _ in range(200)]
+    result['format_pricing'] = percentiles_ms(samples)
+
+    os.remove(path)
+    os.remove(store_path)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print current vs. baseline for the headline numbers"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {r['scale']: r for r in json.load(f)['results']}
+
+    metrics = [
+        ('load_json_s', lambda r: r['load_json_s']),
+        ('nearest p50 ms', lambda r: r['nearest_query']['p50_ms']),
+        ('ranked p50 ms', lambda r: r['ranked_query']['p50_ms']),
+        ('map 50 p50 ms', lambda r: r['map_50_markers']['p50_ms']),
+        ('load peak MB', lambda r: r['load_json_peak_mb']),
+        ('compact frame MB', lambda r: r['compact_frame_mb']),
+    ]
+    print(f"\nCompared with {baseline_path}:")
+    for r in results:
+        old = baseline.get(r['scale'])
+        if old is None:
+            continue
+        for name, get in metrics:
+            try:
+                before, after = get(old), get(r)
+            except KeyError:
+                continue
+            change = (after / before - 1) * 100 if before else float('nan')
+            print(f"  x{r['scale']:<5} {name:16s} {before:>10} -> {after:>10}  ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--json', help="Write results to this file")
+    parser.add_argument('--compare', help="Earlier --json output to compare against")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'scale':>6} {'features':>9} {'JSON MB':>8} {'load s':>7} {'store s':>8} {'nearest p50':>12} "
+              f"{'ranked p50':>11} {'map50 p50':>10} {'peak MB':>8}")
+        for scale in args.scales:
+            r = run_scale(scale, workdir, n_queries=args.queries)
+            results.append(r)
+            print(f"{r['scale']:>6} {r['features']:>9} {r['json_mb']:>8} {r['load_json_s']:>7} {r['store_load_s']:>8} "
+                  f"{r['nearest_query']['p50_ms']:>12} {r['ranked_query']['p50_ms']:>11} "
+                  f"{r['map_50_markers']['p50_ms']:>10} {r['load_json_peak_mb']:>8}")
+
+    output = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Benchmark: walking-distance re-ranking over a street graph
+
+Writes a synthetic OSM extract per size: a street grid around Grünerløkka
+cut by a river that only a few footbridges cross, plus ways and nodes that
+must not end up in the graph (a motorway, a foot=no street, loose POI
+nodes). It is compiled with `build_street_graph`, then:
+
+- `parse_osm_ways` must keep only the nodes of walkable ways
+- `StreetGraph.distances_to` is checked against Bellman-Ford over the
+  whole graph, with and without a distance limit
+- `rerank_by_walking` of WALK_CANDIDATES haversine-preselected spots is
+  timed from random user positions against RERANK_BUDGET_MS, and its
+  walking distances are checked against Bellman-Ford
+
+Usage:
+    python benchmarks/bench_routing.py [--sizes 20 50 100] [--queries 200] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_pipeline import percentiles_ms  # noqa: E402
+from spatial_index import haversine_many  # noqa: E402
+from street_routing import (  # noqa: E402
+    WALK_CANDIDATES,
+    StreetGraph,
+    build_street_graph,
+    parse_osm_ways,
+    rerank_by_walking,
+)
+
+# South-west corner of the grid and the block size
+START = (59.9180, 10.7500)
+BLOCK_M = 60.0
+
+# A footbridge crosses the river every this many streets
+BRIDGE_EVERY = 8
+
+# Re-ranking the candidates has to fit in an interactive update
+RERANK_BUDGET_MS = 20.0
+
+
+def grid_position(i, j):
+    return (START[0] + i * BLOCK_M / 111320,
+            START[1] + j * BLOCK_M / (111320 * np.cos(np.radians(START[0]))))
+
+
+def write_osm(path, size):
+    """
+    Write a size x size street grid with a river between the middle rows.
+    Returns the ids of the nodes walkable ways reference.
+    """
+    river = size // 2
+
+    def node_id(i, j):
+        return 1 + i * size + j
+
+    walkable = {node_id(i, j) for i in range(size) for j in range(size)}
+    extra = 1 + size * size
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+        for i in range(size):
+            for j in range(size):
+                lat, lon = grid_position(i, j)
+                f.write(f'  <node id="{node_id(i, j)}" lat="{lat:.7f}" lon="{lon:.7f}"/>\n')
+        # Nodes that only the motorway uses, and POIs outside any way
+        motorway = []
+        for j in range(size):
+            lat, lon = grid_position(river + 0.5, j)
+            f.write(f'  <node id="{extra}" lat="{lat:.7f}" lon="{lon:.7f}"/>\n')
+            motorway.append(extra)
+            extra += 1
+        for j in range(0, size, 3):
+            lat, lon = grid_position(0.3, j + 0.5)
+            f.write(f'  <node id="{extra}" lat="{lat:.7f}" lon="{lon:.7f}">\n'
+                    f'    <tag k="amenity" v="cafe"/>\n  </node>\n')
+            extra += 1
+
+        ways = [([node_id(i, j) for j in range(size)], {'highway': 'residential'}) for i in range(size)]
+        for j in range(size):
+            ways.append(([node_id(i, j) for i in range(river)], {'highway': 'residential'}))
+            ways.append(([node_id(i, j) for i in range(river, size)], {'highway': 'residential'}))
+            if j % BRIDGE_EVERY == BRIDGE_EVERY // 2:
+                ways.append(([node_id(river - 1, j), node_id(river, j)], {'highway': 'footway', 'bridge': 'yes'}))
+            elif j % BRIDGE_EVERY == 0:
+                # A road bridge pedestrians may not use
+                ways.append(([node_id(river - 1, j), node_id(river, j)], {'highway': 'residential', 'foot': 'no'}))
+        ways.append((motorway, {'highway': 'motorway'}))
+
+        for way_id, (refs, tags) in enumerate(ways, start=1):
+            f.write(f'  <way id="{way_id}">\n')
+            f.writelines(f'    <nd ref="{ref}"/>\n' for ref in refs)
+            f.writelines(f'    <tag k="{k}" v="{v}"/>\n' for k, v in tags.items())
+            f.write('  </way>\n')
+        f.write('</osm>\n')
+    return walkable
+
+
+def bellman_ford(graph, source):
+    """Shortest-path meters from `source` to every node, relaxing all edges until nothing changes"""
+    tail = np.repeat(np.arange(len(graph)), np.diff(graph.indptr))
+    weights = graph.weights.astype(np.float64)
+    dist = np.full(len(graph), np.inf)
+    dist[source] = 0.0
+    while True:
+        relaxed = dist.copy()
+        np.minimum.at(relaxed, graph.indices, dist[tail] + weights)
+        if np.array_equal(relaxed, dist):
+            return dist
+        dist = relaxed
+
+
+def check_dijkstra(graph, rng, n_sources=5):
+    nodes = np.arange(len(graph))
+    for source in rng.choice(len(graph), n_sources, replace=False):
+        brute = bellman_ford(graph, int(source))
+        dijkstra = graph.distances_to(int(source), nodes)
+        assert np.allclose(dijkstra, brute, rtol=1e-9), "Dijkstra differs from Bellman-Ford"
+        limit = float(np.median(brute[np.isfinite(brute)]))
+        limited = graph.distances_to(int(source), nodes, limit=limit)
+        within = brute <= limit
+        assert np.allclose(limited[within], brute[within], rtol=1e-9), "limited Dijkstra misses reachable nodes"
+        assert not np.isfinite(limited[brute > limit * 1.01]).any(), "limited Dijkstra goes past the limit"
+
+
+def run(size, workdir, n_queries, n=10, seed=0):
+    rng = np.random.default_rng(seed)
+    osm_path = os.path.join(workdir, f'grid_{size}.osm')
+    graph_path = os.path.join(workdir, f'grid_{size}.npz')
+    walkable = write_osm(osm_path, size)
+
+    nodes, _ = parse_osm_ways(osm_path)
+    assert set(nodes) == walkable, "parse_osm_ways kept nodes outside walkable ways"
+
+    start = time.perf_counter()
+    n_nodes, n_edges = build_street_graph(osm_path, graph_path)
+    build_s = time.perf_counter() - start
+    graph = StreetGraph.load(graph_path)
+    check_dijkstra(graph, rng)
+
+    # Parking spots scattered over the grid, snapped once like data_snapshot does
+    n_spots = 10 * size
+    (lat0, lon0), (lat1, lon1) = grid_position(0, 0), grid_position(size - 1, size - 1)
+    spots = pd.DataFrame({'lat': rng.uniform(lat0, lat1, n_spots), 'lon': rng.uniform(lon0, lon1, n_spots)})
+    spots['street_node'], spots['street_snap_m'] = graph.snap(spots['lat'].to_numpy(), spots['lon'].to_numpy())
+
+    samples = []
+    for lat, lon in zip(rng.uniform(lat0, lat1, n_queries), rng.uniform(lon0, lon1, n_queries)):
+        distance = haversine_many(lat, lon, spots['lat'].to_numpy(), spots['lon'].to_numpy())
+        top = np.argsort(distance, kind='stable')[:WALK_CANDIDATES]
+        ranked = spots.iloc[top].assign(distance=distance[top], score=distance[top])
+
+        start = time.perf_counter()
+        result = rerank_by_walking(lat, lon, ranked, graph, n)
+        samples.append(time.perf_counter() - start)
+
+        if len(samples) <= 5:
+            (user_node,), (user_snap,) = graph.snap([lat], [lon])
+            expected = (bellman_ford(graph, int(user_node))[result['street_node'].to_numpy()]
+                        + float(user_snap) + result['street_snap_m'].to_numpy(dtype=np.float64))
+            assert np.allclose(result['distance'].to_numpy(), expected, rtol=1e-6), "walking distance differs"
+
+    timings = percentiles_ms(samples)
+    return {
+        'grid': size,
+        'nodes': n_nodes,
+        'edges': n_edges,
+        'build_s': round(build_s, 3),
+        'rerank': timings,
+        'rerank_max_ms': round(max(samples) * 1000, 3),
+        'within_budget': round(float(np.mean(np.asarray(samples) * 1000 <= RERANK_BUDGET_MS)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20, 50, 100])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--json', help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"budget {RERANK_BUDGET_MS:.0f} ms to re-rank {WALK_CANDIDATES} candidates")
+    print(f"{'nodes':>7} {'edges':>7} {'build s':>8} | {'p50 ms':>7} {'p95':>7} {'p99':>7} {'max':>7} | "
+          f"{'in budget':>9}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            r = run(size, workdir, args.queries)
+            results.append(r)
+            t = r['rerank']
+            print(f"{r['nodes']:>7} {r['edges']:>7} {r['build_s']:>8.2f} | {t['p50_ms']:>7.2f} {t['p95_ms']:>7.2f} "
+                  f"{t['p99_ms']:>7.2f} {r['rerank_max_ms']:>7.2f} | {r['within_budget']:>9.0%}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
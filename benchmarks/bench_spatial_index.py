@@ -0,0 +1,129 @@
+"""
+Benchmark: spatial index query latency from 10^3 to 10^6 features
+
+Synthetic features are spread uniformly over a box around Oslo sentrum.
+Compares the grid index against the brute-force vector scan used by
+`find_nearest_parking`, times corridor searches along 300-vertex routes, and
+checks that knn stays bounded for queries far outside the data.
+
+Usage:
+    python benchmarks/bench_spatial_index.py [--sizes 1000 10000 100000 1000000] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spatial_index import ParkingIndex, haversine_many  # noqa: E402
+
+# Roughly the Oslo byggesone
+MIN_LAT, MAX_LAT = 59.85, 59.98
+MIN_LON, MAX_LON = 10.60, 10.90
+
+
+def percentiles_us(samples):
+    samples = np.asarray(samples) * 1e6
+    return {
+        'p50_us': round(float(np.percentile(samples, 50)), 1),
+        'p95_us': round(float(np.percentile(samples, 95)), 1),
+        'p99_us': round(float(np.percentile(samples, 99)), 1),
+    }
+
+
+def time_queries(fn, queries):
+    samples = []
+    for lat, lon in queries:
+        start = time.perf_counter()
+        fn(lat, lon)
+        samples.append(time.perf_counter() - start)
+    return percentiles_us(samples)
+
+
+def random_route(rng, n_vertices=300, step_m=10):
+    """A wandering route starting inside the box, about n_vertices * step_m long"""
+    heading = np.cumsum(rng.normal(0, 0.3, n_vertices)) + rng.uniform(0, 2 * np.pi)
+    dlat = np.cos(heading) * step_m / 111320
+    dlon = np.sin(heading) * step_m / (111320 * np.cos(np.radians(59.92)))
+    return (rng.uniform(MIN_LAT + 0.02, MAX_LAT - 0.02) + np.cumsum(dlat),
+            rng.uniform(MIN_LON + 0.04, MAX_LON - 0.04) + np.cumsum(dlon))
+
+
+def run(size, n_queries=500, k=10, radius=300, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(MIN_LAT, MAX_LAT, size)
+    lons = rng.uniform(MIN_LON, MAX_LON, size)
+    queries = list(zip(rng.uniform(MIN_LAT, MAX_LAT, n_queries), rng.uniform(MIN_LON, MAX_LON, n_queries)))
+
+    start = time.perf_counter()
+    index = ParkingIndex(lats, lons)
+    build_s = time.perf_counter() - start
+
+    # Sanity check against brute force before timing
+    for lat, lon in queries[:20]:
+        positions, _ = index.knn(lat, lon, k)
+        brute = np.argsort(haversine_many(lat, lon, lats, lons), kind='stable')[:k]
+        assert set(positions) == set(brute), "knn disagrees with brute force"
+
+    def brute_knn(lat, lon):
+        d = haversine_many(lat, lon, lats, lons)
+        top = np.argpartition(d, k - 1)[:k]
+        return top[np.argsort(d[top])]
+
+    # Far from the data: (0, 0) from a geocoder miss, and Trondheim
+    far_queries = [(0.0, 0.0), (63.43, 10.40)]
+    for lat, lon in far_queries:
+        positions, _ = index.knn(lat, lon, k)
+        brute = np.argsort(haversine_many(lat, lon, lats, lons), kind='stable')[:k]
+        assert set(positions) == set(brute), "far knn disagrees with brute force"
+
+    routes = [random_route(rng) for _ in range(min(n_queries, 50))]
+
+    def per_vertex(route_lats, route_lons):
+        # What the corridor search replaces: a radius query per route vertex
+        return np.unique(np.concatenate([index.within_radius(lat, lon, 100)[0]
+                                         for lat, lon in zip(route_lats, route_lons)]))
+
+    return {
+        'features': size,
+        'cell_size_m': round(index.cell_size, 1),
+        'build_ms': round(build_s * 1000, 1),
+        'knn': time_queries(lambda lat, lon: index.knn(lat, lon, k), queries),
+        'within_radius': time_queries(lambda lat, lon: index.within_radius(lat, lon, radius), queries),
+        'bbox': time_queries(lambda lat, lon: index.bbox(lat - 0.002, lon - 0.004, lat + 0.002, lon + 0.004), queries),
+        'knn_far': time_queries(lambda lat, lon: index.knn(lat, lon, k), far_queries * 5),
+        'brute_force_knn': time_queries(brute_knn, queries[:100]),
+        'route_100m': time_queries(lambda route_lats, route_lons: index.along_route(route_lats, route_lons, 100), routes),
+        'route_per_vertex': time_queries(per_vertex, routes[:10]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--json', help="Write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'features':>9} {'cell m':>7} {'build ms':>9} {'knn p50':>9} {'knn p99':>9} "
+          f"{'far p99':>9} {'radius p50':>11} {'bbox p50':>9} {'brute p50':>10} {'route p50':>10} {'per-vertex':>11}  (µs)")
+    for size in args.sizes:
+        r = run(size, n_queries=args.queries)
+        results.append(r)
+        print(f"{r['features']:>9} {r['cell_size_m']:>7} {r['build_ms']:>9} {r['knn']['p50_us']:>9} "
+              f"{r['knn']['p99_us']:>9} {r['knn_far']['p99_us']:>9} {r['within_radius']['p50_us']:>11} {r['bbox']['p50_us']:>9} "
+              f"{r['brute_force_knn']['p50_us']:>10} {r['route_100m']['p50_us']:>10} "
+              f"{r['route_per_vertex']['p50_us']:>11}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark: per-update latency of GPS tracking mode
+
+Replays simulated GPS traces (walking and driving, one fix per second with
+a few meters of noise) over 1x, 10x and 100x the dataset and times each
+update two ways:
+
+- full: `rank_parking` over the whole dataset, `create_map`, render
+- tracking: `Tracker.rank` on the kept candidates, the same base map plus
+  the `MarkerLayer` (reused when the marker diff is empty), render
+
+Every tracking result is checked against `rank_parking`. Reports latency
+percentiles, how often the candidate set was rebuilt and how often a new
+marker layer had to be sent, against `gps_tracking.UPDATE_BUDGET_MS`.
+
+Usage:
+    python benchmarks/bench_tracking.py [--scales 1 10 100] [--fixes 300] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_pipeline import TARIFFS, make_synthetic_dataset, percentiles_ms  # noqa: E402
+from gps_tracking import UPDATE_BUDGET_MS, Tracker  # noqa: E402
+from parking_core import (  # noqa: E402
+    build_popup_fragments,
+    capacity_at_least,
+    create_base_map,
+    create_map,
+    load_tariff_data,
+    prepare_coordinates,
+    rank_parking,
+)
+from parking_stream import stream_parking_data  # noqa: E402
+from tariff_engine import TariffTable  # noqa: E402
+
+# Meters per one-second fix
+SPEEDS = {'walk': 1.4, 'drive': 10.0}
+GPS_NOISE_M = 3.0
+
+# Start of the traces: Grünerløkka, where the real data is
+START = (59.9225, 10.7590)
+
+
+def gps_trace(rng, n_fixes, step_m):
+    """Wandering trace with GPS noise, one fix per `step_m` meters"""
+    heading = np.cumsum(rng.normal(0, 0.15, n_fixes)) + rng.uniform(0, 2 * np.pi)
+    north = np.cumsum(np.cos(heading) * step_m) + rng.normal(0, GPS_NOISE_M, n_fixes)
+    east = np.cumsum(np.sin(heading) * step_m) + rng.normal(0, GPS_NOISE_M, n_fixes)
+    return (START[0] + north / 111320,
+            START[1] + east / (111320 * np.cos(np.radians(START[0]))))
+
+
+def replay(trace, df, coords, tariff_table, tariff_data, popup_fragments, n=10):
+    """Time both update paths over one trace; returns (full samples, tracking samples, tracker, pushes)"""
+    filters = [capacity_at_least(1)]
+    weights = {'distance': 1.0, 'cost': 5.0}
+    options = dict(weights=weights, tariff_table=tariff_table, stay_minutes=60)
+
+    full = []
+    for lat, lon in zip(*trace):
+        start = time.perf_counter()
+        nearest = rank_parking(lat, lon, df, n, coords=coords, filters=filters, **options)
+        create_map((lat, lon), nearest, tariff_data=tariff_data, popup_fragments=popup_fragments).get_root().render()
+        full.append(time.perf_counter() - start)
+
+    tracker = Tracker()
+    tracking = []
+    pushes = 0
+    for lat, lon in zip(*trace):
+        start = time.perf_counter()
+        nearest = tracker.rank(lat, lon, df, n, coords=coords, filters=filters, query_key=('bench',), **options)
+        m = create_base_map(tracker.map_center)
+        previous = tracker.layer
+        layer = tracker.marker_layer((lat, lon), nearest, tariff_data=tariff_data, popup_fragments=popup_fragments)
+        layer.add_to(m)
+        m.get_root().render()
+        tracking.append(time.perf_counter() - start)
+        pushes += layer is not previous
+
+        # Same spots in the same order as a full ranking from the position the tracker last ranked at
+        expected = rank_parking(*tracker.last_fix, df, n, coords=coords, filters=filters, start=tracker.priced_at, **options)
+        assert np.array_equal(nearest['objectid'].to_numpy(), expected['objectid'].to_numpy()), "tracking result differs"
+    return full, tracking, tracker, pushes
+
+
+def run_scale(scale, workdir, n_fixes, seed=0):
+    path = os.path.join(workdir, f'parking_x{scale}.json')
+    make_synthetic_dataset(path, scale, seed=seed)
+    df, _ = stream_parking_data(path)
+    coords = prepare_coordinates(df)
+    tariff_data = load_tariff_data(TARIFFS)
+    tariff_table = TariffTable(tariff_data)
+    popup_fragments = build_popup_fragments(df, tariff_data)
+
+    result = {'scale': scale, 'features': len(df)}
+    rng = np.random.default_rng(seed)
+    for mode, step_m in SPEEDS.items():
+        trace = gps_trace(rng, n_fixes, step_m)
+        full, tracking, tracker, pushes = replay(trace, df, coords, tariff_table, tariff_data, popup_fragments)
+        result[mode] = {
+            'full': percentiles_ms(full),
+            'tracking': percentiles_ms(tracking),
+            'reanchor_rate': round(tracker.reanchors / n_fixes, 3),
+            'jitter_skip_rate': round(tracker.skipped / n_fixes, 3),
+            'push_rate': round(pushes / n_fixes, 3),
+            'within_budget': round(float(np.mean(np.asarray(tracking) * 1000 <= UPDATE_BUDGET_MS)), 3),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--fixes', type=int, default=300)
+    parser.add_argument('--json', help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"budget {UPDATE_BUDGET_MS:.0f} ms per update")
+    print(f"{'features':>9} {'mode':>6} | {'full p50':>8} {'p95':>7} | {'track p50':>9} {'p95':>7} | "
+          f"{'re-anchor':>9} {'push':>5} {'in budget':>9}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in args.scales:
+            result = run_scale(scale, workdir, args.fixes)
+            results.append(result)
+            for mode in SPEEDS:
+                r = result[mode]
+                print(f"{result['features']:>9} {mode:>6} | {r['full']['p50_ms']:>8.2f} {r['full']['p95_ms']:>7.2f} | "
+                      f"{r['tracking']['p50_ms']:>9.2f} {r['tracking']['p95_ms']:>7.2f} | "
+                      f"{r['reanchor_rate']:>9.1%} {r['push_rate']:>5.0%} {r['within_budget']:>9.0%}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Load generator for query_service.py
+
+Fires /nearest requests at random origins around Grünerløkka from many
+concurrent clients and reports throughput and latency percentiles.
+
+Usage:
+    python query_service.py &
+    python benchmarks/load_service.py [--url http://127.0.0.1:8765] [--clients 50] [--requests 5000]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+
+async def client(http, url, origins, latencies, errors, query):
+    for lat, lon in origins:
+        start = time.perf_counter()
+        try:
+            await http.fetch(f"{url}/nearest?lat={lat:.6f}&lon={lon:.6f}&{query}")
+        except (HTTPClientError, OSError):
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(url, clients, requests, query, seed=0):
+    AsyncHTTPClient.configure(None, max_clients=clients)
+    http = AsyncHTTPClient()
+    rng = np.random.default_rng(seed)
+    origins = list(zip(rng.uniform(59.915, 59.935, requests), rng.uniform(10.745, 10.775, requests)))
+
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client(http, url, origins[i::clients], latencies, errors, query) for i in range(clients)
+    ))
+    elapsed = time.perf_counter() - started
+
+    samples = np.asarray(latencies) * 1000
+    return {
+        'requests': requests,
+        'clients': clients,
+        'errors': len(errors),
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(samples, 50)), 2) if len(samples) else None,
+        'p95_ms': round(float(np.percentile(samples, 95)), 2) if len(samples) else None,
+        'p99_ms': round(float(np.percentile(samples, 99)), 2) if len(samples) else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8765')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--query', default='n=10', help="Extra query string, e.g. 'n=10&rank=cheapest'")
+    parser.add_argument('--json', help="Write results to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.url.rstrip('/'), args.clients, args.requests, args.query))
+    print(f"{result['requests']} requests, {result['clients']} clients: {result['throughput_rps']} req/s, "
+          f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms, "
+          f"{result['errors']} errors")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
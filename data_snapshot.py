@@ -0,0 +1,232 @@
+"""
+Versioned, hot-reloadable data snapshots
+
+A DataSnapshot bundles everything derived from one version of the data
+files (DataFrame, coordinates, spatial index, geometry, tariff tables,
+popup fragments, street segments, availability rules and the optional street graph). SnapshotManager builds a
+new snapshot on a background thread whenever `parking_data.json`, the
+compiled store, `takstgruppe_lookup.json` or `street_graph.npz` changes, validates it, and swaps it in with a
+single reference assignment. A reader takes `manager.current` once and
+uses that snapshot for the whole request, so it sees either the old or the
+new version, never a mix.
+"""
+import os
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+import numpy as np
+
+from availability import AvailabilityModel
+from instrumentation import stage
+from parking_core import (
+    FEATURE_COLUMNS,
+    build_popup_fragments,
+    file_signature,
+    load_tariff_data,
+    prepare_coordinates,
+)
+from parking_store import DEFAULT_STORE, ParkingStore, store_is_current
+from parking_stream import stream_parking_data
+from spatial_index import ParkingIndex
+from street_routing import DEFAULT_GRAPH, StreetGraph
+from street_segments import build_segments
+from tariff_engine import TariffTable
+
+# Seconds between checks of the data files
+POLL_INTERVAL_S = 2.0
+
+# A new dataset with fewer than this fraction of the current features is
+# treated as a broken download and not swapped in
+MIN_KEEP_FRACTION = 0.5
+
+DataSnapshot = namedtuple('DataSnapshot', [
+    'version',          # 1, 2, ... per manager
+    'signature',        # file signatures the snapshot was built from
+    'loaded_at',        # time.time() when it was built
+    'parking_df',       # read-only DataFrame, compacted to the needed columns
+    'coords',           # prepare_coordinates(parking_df), read-only arrays
+    'index',            # ParkingIndex over parking_df
+    'geometry',         # GeometryBatch aligned with parking_df
+    'tariff_data',      # raw tariff lookup dict, or None
+    'tariff_table',     # TariffTable, or None
+    'popup_fragments',  # build_popup_fragments(parking_df, tariff_data)
+    'street_graph',     # StreetGraph, or None without a graph file
+    'segments',         # StreetSegments: parking_df grouped by strekningsid
+    'availability',     # AvailabilityModel: paid-hours and ban bitmaps per row
+])
+
+
+class SnapshotError(ValueError):
+    """New data files failed validation"""
+
+
+def data_signature(data_path, store_path, tariff_path, graph_path=None):
+    return (file_signature(data_path), store_path and file_signature(store_path), file_signature(tariff_path),
+            graph_path and file_signature(graph_path))
+
+
+def load_snapshot(data_path='parking_data.json', store_path=DEFAULT_STORE,
+                  tariff_path='takstgruppe_lookup.json', version=1, signature=None, columns=FEATURE_COLUMNS,
+                  graph_path=DEFAULT_GRAPH):
+    """
+    Build a complete snapshot from the data files. Raises on unreadable data.
+    Only `columns` (plus lat/lon) are kept; from JSON they are also
+    compacted, while store columns stay memory-mapped and shared between
+    processes. With a street graph, every feature gets its nearest graph
+    node ('street_node') and the distance to it ('street_snap_m').
+    """
+    if signature is None:
+        signature = data_signature(data_path, store_path, tariff_path, graph_path)
+
+    if store_path and store_is_current(store_path, data_path):
+        with stage('load.store'):
+            store = ParkingStore(store_path)
+            parking_df = store.to_dataframe([c for c in columns if c in store.column_names])
+            geometry = store.geometry_batch()
+    else:
+        with stage('load.json'):
+            parking_df, geometry = stream_parking_data(data_path, columns, keep_geometry=True)
+
+    with stage('load.index'):
+        coords = prepare_coordinates(parking_df)
+        for array in coords.values():
+            array.setflags(write=False)
+        index = ParkingIndex.from_dataframe(parking_df)
+
+    with stage('load.tariffs'):
+        tariff_data = load_tariff_data(tariff_path)
+        tariff_table = TariffTable(tariff_data) if tariff_data else None
+
+    with stage('load.popups'):
+        popup_fragments = build_popup_fragments(parking_df, tariff_data)
+
+    with stage('load.segments'):
+        segments = build_segments(parking_df, geometry)
+
+    with stage('load.availability'):
+        availability = AvailabilityModel(parking_df, tariff_table)
+
+    street_graph = None
+    if graph_path and os.path.exists(graph_path):
+        with stage('load.street_graph'):
+            street_graph = StreetGraph.load(graph_path)
+            nodes, snap_m = street_graph.snap(parking_df['lat'].to_numpy(dtype=np.float64),
+                                              parking_df['lon'].to_numpy(dtype=np.float64))
+            parking_df = parking_df.assign(street_node=nodes, street_snap_m=snap_m)
+
+    return DataSnapshot(
+        version=version,
+        signature=signature,
+        loaded_at=time.time(),
+        parking_df=parking_df,
+        coords=coords,
+        index=index,
+        geometry=geometry,
+        tariff_data=tariff_data,
+        tariff_table=tariff_table,
+        popup_fragments=popup_fragments,
+        street_graph=street_graph,
+        segments=segments,
+        availability=availability,
+    )
+
+
+def validate_snapshot(snapshot, previous=None):
+    """Raise SnapshotError if a snapshot should not replace `previous`"""
+    df = snapshot.parking_df
+    missing = [c for c in ('lat', 'lon', 'takstgruppe1') if c not in df]
+    if missing:
+        raise SnapshotError(f"parking data is missing columns: {', '.join(missing)}")
+    if not len(df) or not df['lat'].notna().any():
+        raise SnapshotError("parking data has no located features")
+    if previous is not None and len(df) < MIN_KEEP_FRACTION * len(previous.parking_df):
+        raise SnapshotError(f"parking data shrank from {len(previous.parking_df)} to {len(df)} features")
+    if previous is not None and previous.tariff_table is not None and snapshot.tariff_table is None:
+        raise SnapshotError("tariff data could not be loaded")
+
+
+class SnapshotManager:
+    """
+    Holds the current DataSnapshot and replaces it when the files change.
+    The first snapshot is loaded synchronously; later ones by `start()`'s
+    background thread, off the request path.
+    """
+
+    def __init__(self, data_path='parking_data.json', store_path=DEFAULT_STORE,
+                 tariff_path='takstgruppe_lookup.json', interval=POLL_INTERVAL_S, columns=FEATURE_COLUMNS,
+                 graph_path=DEFAULT_GRAPH):
+        self.data_path = data_path
+        self.graph_path = graph_path
+        self.columns = columns
+        self.store_path = store_path
+        self.tariff_path = tariff_path
+        self.interval = interval
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._pending = None
+        self._thread = None
+        self._stop = threading.Event()
+
+        try:
+            self.current = load_snapshot(data_path, store_path, tariff_path, columns=columns, graph_path=graph_path)
+        except FileNotFoundError:
+            self.current = None
+
+    def _signature(self):
+        return data_signature(self.data_path, self.store_path, self.tariff_path, self.graph_path)
+
+    def check(self):
+        """
+        Reload if the files changed and have stayed unchanged for one poll
+        (so a file that is still being copied is not parsed). Returns True if
+        a new snapshot was swapped in.
+        """
+        signature = self._signature()
+        current = self.current
+        if current is not None and signature == current.signature:
+            self._pending = None
+            return False
+        if signature != self._pending:
+            self._pending = signature
+            return False
+        return self.reload(signature)
+
+    def reload(self, signature=None):
+        """Build, validate and swap in a new snapshot now. Returns True on success."""
+        with self._lock:
+            signature = signature or self._signature()
+            current = self.current
+            try:
+                snapshot = load_snapshot(self.data_path, self.store_path, self.tariff_path,
+                                         version=(current.version + 1) if current else 1, signature=signature,
+                                         columns=self.columns, graph_path=self.graph_path)
+                validate_snapshot(snapshot, current)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                # Don't retry the same broken files on every poll
+                if current is not None:
+                    self.current = current._replace(signature=signature)
+                return False
+            self.last_error = None
+            self._pending = None
+            self.current = snapshot
+            return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                traceback.print_exc()
+
+    def start(self):
+        """Start the background watcher (idempotent). Returns self."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='snapshot-watcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,167 @@
+"""
+GPS tracking mode: cheap updates while the user is moving
+
+Every GPS fix reruns the app. Instead of ranking the whole dataset and
+building a new map each time, a Tracker keeps, per session:
+
+- a candidate set around an anchor position: every row that can rank in
+  the top n anywhere within TRACK_RADIUS_M of the anchor (the bound from
+  `query_cache.candidate_rows`). Fixes inside that radius only re-rank
+  those candidates, with the same result as `rank_parking`; moving
+  further, or changing the query, re-anchors.
+- the markers last shown, so an update is described as a MarkerDiff
+  (added, removed, recoloured, relabelled). The base map stays the same
+  (centered on `map_center`, the first fix; `st_folium(center=...)` pans
+  it) and a new marker layer is only pushed to `st_folium` when the diff
+  is not empty or the user marker has moved.
+
+Each update, from ranking to handing the map to `st_folium`, is timed
+against UPDATE_BUDGET_MS.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from parking_core import MarkerLayer, distance_color, feature_keys, parking_markers, rank_parking
+from query_cache import TTL_S, candidate_rows
+from spatial_index import haversine_many
+from tariff_engine import oslo_now
+
+# Re-rank the kept candidates while within this distance of the anchor
+TRACK_RADIUS_M = 150.0
+
+# Fixes closer than this to the last one are GPS jitter: nothing is recomputed
+JITTER_M = 5.0
+
+# Marker distance labels are refreshed when they are off by this much
+LABEL_STEP_M = 10.0
+
+# Server-side time for one update (rank, diff, marker layer and st_folium)
+UPDATE_BUDGET_MS = 25.0
+
+MarkerDiff = namedtuple('MarkerDiff', ['added', 'removed', 'recoloured', 'relabelled'])
+
+
+def diff_markers(previous, current):
+    """
+    MarkerDiff between two {key: (colour, distance)} states; each field is
+    a list of keys. Distances count as changed from LABEL_STEP_M on.
+    """
+    added = [key for key in current if key not in previous]
+    removed = [key for key in previous if key not in current]
+    recoloured = []
+    relabelled = []
+    for key, (colour, distance) in current.items():
+        if key not in previous:
+            continue
+        old_colour, old_distance = previous[key]
+        if colour != old_colour:
+            recoloured.append(key)
+        elif abs(distance - old_distance) >= LABEL_STEP_M:
+            relabelled.append(key)
+    return MarkerDiff(added, removed, recoloured, relabelled)
+
+
+def marker_state(nearest):
+    """{key: (colour, distance)} of a ranked DataFrame"""
+    distances = nearest['distance'].to_numpy()
+    return {key: (distance_color(distance), float(distance))
+            for key, distance in zip(feature_keys(nearest).tolist(), distances)}
+
+
+class Tracker:
+    """Candidate set, marker state and timings of one tracking session"""
+
+    def __init__(self, radius_m=TRACK_RADIUS_M, ttl_s=TTL_S):
+        self.radius_m = radius_m
+        self.ttl_s = ttl_s
+        self.anchor = None
+        self.map_center = None
+        self.last_fix = None
+        self.query_key = None
+        self.expires = 0.0
+        self.priced_at = None
+        self.candidates = None
+        self.candidate_coords = None
+        self.nearest = None
+        self.markers = {}
+        self.layer = None
+        self.shown_user = None
+        self.updates = 0
+        self.reanchors = 0
+        self.skipped = 0
+        self.over_budget = 0
+        self.last_ms = 0.0
+        self.last_diff = MarkerDiff([], [], [], [])
+
+    def stats(self):
+        return {
+            'updates': self.updates,
+            'reanchors': self.reanchors,
+            'jitter_skipped': self.skipped,
+            'candidates': 0 if self.candidates is None else len(self.candidates),
+            'last_update_ms': round(self.last_ms, 2),
+            'over_budget': self.over_budget,
+        }
+
+    def _distance(self, a, b):
+        return float(haversine_many(a[0], a[1], np.array([b[0]]), np.array([b[1]]))[0])
+
+    def rank(self, user_lat, user_lon, df, n=10, coords=None, filters=(), query_key=(), weights=None,
+             tariff_table=None, stay_minutes=60, fuel='bensin'):
+        """
+        Same result as `rank_parking(...)` with the filters applied, priced
+        at the time of the last re-anchor (at most `ttl_s` ago), from the
+        kept candidates while the user stays near the anchor. `query_key`
+        must identify everything but the position (data version, n, filters,
+        weights, ...).
+        """
+        fix = (user_lat, user_lon)
+        now = time.monotonic()
+        fresh = self.query_key == query_key and now < self.expires
+        if fresh and self.nearest is not None and self._distance(self.last_fix, fix) < JITTER_M:
+            self.skipped += 1
+            return self.nearest
+
+        if not fresh or self._distance(self.anchor, fix) > self.radius_m:
+            # Candidates and re-ranks are priced at the same time, or the bound wouldn't hold
+            self.priced_at = oslo_now()
+            self.candidates, self.candidate_coords = candidate_rows(
+                user_lat, user_lon, self.radius_m, df, n, coords, filters, weights,
+                tariff_table, stay_minutes, fuel, self.priced_at)
+            self.anchor = fix
+            self.query_key = query_key
+            self.expires = now + self.ttl_s
+            self.reanchors += 1
+
+        self.last_fix = fix
+        self.map_center = self.map_center or fix
+        self.nearest = rank_parking(user_lat, user_lon, self.candidates, n, coords=self.candidate_coords,
+                                    weights=weights, tariff_table=tariff_table, stay_minutes=stay_minutes, fuel=fuel,
+                                    start=self.priced_at)
+        return self.nearest
+
+    def marker_layer(self, user_location, nearest, tariff_data=None, popup_fragments=None):
+        """
+        FeatureGroup with the current markers for `st_folium(feature_group_to_add=...)`.
+        The previous layer is returned unchanged when the diff is empty, so
+        the browser has nothing to redraw.
+        """
+        current = marker_state(nearest)
+        self.last_diff = diff_markers(self.markers, current)
+        user_moved = self.shown_user is None or self._distance(self.shown_user, user_location) >= LABEL_STEP_M
+        if self.layer is None or user_moved or any(self.last_diff):
+            self.layer = MarkerLayer(parking_markers(user_location, nearest, tariff_data=tariff_data,
+                                                     popup_fragments=popup_fragments))
+            self.markers = current
+            self.shown_user = tuple(user_location)
+        return self.layer
+
+    def finish_update(self, started):
+        """Record the time since `started` (perf_counter) for this update; returns it in ms"""
+        self.last_ms = (time.perf_counter() - started) * 1000
+        self.updates += 1
+        if self.last_ms > UPDATE_BUDGET_MS:
+            self.over_budget += 1
+        return self.last_ms
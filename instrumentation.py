@@ -0,0 +1,229 @@
+"""
+Stage timing, memory snapshots and an optional sampling profiler
+
+Wrap hot-path stages in `stage(name)`; durations go into per-stage
+histograms shared by every session in the process. Controlled by
+environment variables:
+
+    PARKING_PROFILE=5          sample stacks of threads inside a stage every 5 ms
+    PARKING_TRACEMALLOC=1      trace Python allocations for memory snapshots
+    PARKING_METRICS_FILE=path  write the report (JSON) there at exit
+
+The report is also shown on the app's hidden debug page (`?debug=1`).
+"""
+import atexit
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open
+BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Recent samples kept per stage for percentiles
+RECENT_SAMPLES = 1000
+
+
+class StageStats:
+    """Latency histogram plus a window of recent samples for one stage"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def add(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.recent.append(ms)
+
+    def histogram(self):
+        """{bucket label: count} for non-empty buckets"""
+        labels = [f"<={b}ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        return {label: n for label, n in zip(labels, self.buckets) if n}
+
+    def summary(self):
+        recent = sorted(self.recent)
+
+        def percentile(p):
+            return round(recent[min(int(p / 100 * len(recent)), len(recent) - 1)], 3) if recent else None
+
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else None,
+            'p50_ms': percentile(50),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+            'max_ms': round(self.max_ms, 3),
+            'histogram': self.histogram(),
+        }
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of threads that are inside a timed stage and
+    counts them as folded stacks ("file:function;file:function"), the
+    input format of flamegraph tools.
+    """
+
+    def __init__(self, metrics, interval_s=0.005, max_depth=40):
+        self.metrics = metrics
+        self.interval_s = interval_s
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            active = self.metrics.active_threads()
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for ident, stage_name in active.items():
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.samples[stage_name + ';' + ';'.join(reversed(stack))] += 1
+
+    def top(self, n=20):
+        """Most sampled leaf functions as (function, samples)"""
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(n)
+
+    def dump_folded(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Metrics:
+    """Process-wide stage timings; safe to use from every session's thread"""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._active = {}
+        self.profiler = None
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block; nested stages are recorded separately"""
+        ident = threading.get_ident()
+        outer = self._active.get(ident)
+        self._active[ident] = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            if outer is None:
+                self._active.pop(ident, None)
+            else:
+                self._active[ident] = outer
+            self.record(name, ms)
+
+    def record(self, name, ms):
+        """Add a duration measured elsewhere"""
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.add(ms)
+
+    def active_threads(self):
+        """{thread id: innermost stage} for threads currently inside a stage"""
+        return dict(self._active)
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+        if self.profiler is not None:
+            self.profiler.samples.clear()
+
+    def report(self, top_allocations=10):
+        with self._lock:
+            stages = {name: stats.summary() for name, stats in sorted(self.stages.items())}
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'stages': stages,
+            'memory': memory_snapshot(top_allocations),
+        }
+        if self.profiler is not None:
+            report['profile_top'] = self.profiler.top()
+        return report
+
+    def dump(self, path):
+        """Write the report as JSON, plus folded stacks next to it when profiling"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+        if self.profiler is not None:
+            self.profiler.dump_folded(os.path.splitext(path)[0] + '.folded')
+
+
+def max_rss_mb():
+    """Peak resident set size of the process in MB, or None without the `resource` module"""
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS, kilobytes on Linux
+    scale = 2 ** 20 if sys.platform == 'darwin' else 2 ** 10
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def memory_snapshot(top=10):
+    """Process max RSS (not on Windows), plus traced Python memory and top allocation sites when tracemalloc runs"""
+    snapshot = {}
+    if resource is not None:
+        snapshot['max_rss_mb'] = max_rss_mb()
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot['traced_mb'] = round(current / 1e6, 1)
+        snapshot['traced_peak_mb'] = round(peak / 1e6, 1)
+        stats = tracemalloc.take_snapshot().statistics('lineno')[:top]
+        snapshot['top_allocations'] = [
+            {'where': f"{os.path.basename(s.traceback[0].filename)}:{s.traceback[0].lineno}",
+             'mb': round(s.size / 1e6, 2), 'blocks': s.count}
+            for s in stats
+        ]
+    return snapshot
+
+
+METRICS = Metrics()
+stage = METRICS.stage
+
+if os.environ.get('PARKING_TRACEMALLOC') and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+if os.environ.get('PARKING_PROFILE'):
+    METRICS.profiler = SamplingProfiler(METRICS, interval_s=float(os.environ['PARKING_PROFILE']) / 1000).start()
+
+if os.environ.get('PARKING_METRICS_FILE'):
+    atexit.register(METRICS.dump, os.environ['PARKING_METRICS_FILE'])
@@ -0,0 +1,199 @@
+"""
+List View rendered as one HTML component
+
+Instead of one `st.markdown` card, pricing expander and `st.button` per
+spot, the whole list goes to the browser as a single component: compact
+JSON rows plus a small template that draws one page of cards at a time.
+Paging, pricing details and "Navigate" links all work client-side, so
+they don't rerun the script.
+"""
+import html
+import json
+import re
+
+import numpy as np
+import pandas as pd
+
+from parking_core import format_pricing_info, get_tariff_info
+from tariff_engine import format_minutes
+
+PAGE_SIZE = 10
+# Component height in pixels; cards beyond it scroll inside the component
+LIST_HEIGHT = 760
+
+BADGES = [
+    (200, "Very Close", "#28a745"),   # Green
+    (500, "Close", "#fd7e14"),        # Orange
+    (np.inf, "Moderate", "#007bff"),  # Blue
+]
+
+
+def markdown_to_html(text):
+    """The small markdown subset `format_pricing_info` produces: bold, italics, '- ' lists, paragraphs"""
+    out = []
+    in_list = False
+    for line in text.split('\n'):
+        stripped = line.strip()
+        item = stripped.startswith('- ')
+        if in_list and not item:
+            out.append('</ul>')
+            in_list = False
+        if not stripped:
+            continue
+        body = html.escape(stripped[2:] if item else stripped)
+        body = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', body)
+        body = re.sub(r'\*(.+?)\*', r'<i>\1</i>', body)
+        if item:
+            if not in_list:
+                out.append('<ul>')
+                in_list = True
+            out.append(f'<li>{body}</li>')
+        else:
+            out.append(f'<p>{body}</p>')
+    if in_list:
+        out.append('</ul>')
+    return ''.join(out)
+
+
+def _column(df, name):
+    return df[name].to_numpy(dtype=object) if name in df else np.full(len(df), None, dtype=object)
+
+
+def parking_list_items(nearest, tariff_data=None, stay_minutes=60):
+    """
+    Rows for the list component plus pricing HTML per tariff group.
+    Pricing text is formatted once per group, not once per spot.
+    """
+    distances = nearest['distance'].to_numpy(dtype=np.float64)
+    band = np.searchsorted([limit for limit, _, _ in BADGES], distances, side='right')
+    band = np.minimum(band, len(BADGES) - 1)
+
+    names = _column(nearest, 'GATENAVN')
+    for fallback in ('name', 'NAME'):
+        missing = pd.isna(names)
+        names[missing] = _column(nearest, fallback)[missing]
+    names[pd.isna(names)] = 'Street Parking'
+
+    capacity, kind = _column(nearest, 'KAPASITET'), _column(nearest, 'TYPE')
+    zone, comment = _column(nearest, 'beboerparkeringssone'), _column(nearest, 'KOMMENTAR')
+    cost = _column(nearest, 'cost')
+    takst = _column(nearest, 'takstgruppe1')
+    missing = pd.isna(takst)
+    takst[missing] = _column(nearest, 'takstgruppe1_code')[missing]
+    stay = format_minutes(stay_minutes)
+    # Present when ranked by street segment
+    segment_spots = nearest['segment_spots'].to_numpy() if 'segment_spots' in nearest else None
+    segment_spaces = _column(nearest, 'segment_spaces')
+    chainage = _column(nearest, 'chainage')
+
+    pricing = {}
+    items = []
+    for i in range(len(nearest)):
+        details = []
+        if pd.notna(chainage[i]):
+            along = f"{chainage[i]:.0f} m" if chainage[i] < 1000 else f"{chainage[i] / 1000:.1f} km"
+            details.append(f"🧭 {along} along the route")
+        if segment_spots is not None:
+            spots = 'spot' if segment_spots[i] == 1 else 'spots'
+            details.append(f"🛣️ {segment_spots[i]} {spots}, {segment_spaces[i]:.0f} spaces")
+        if pd.notna(capacity[i]):
+            details.append(f"🚗 {capacity[i]} spaces")
+        if pd.notna(kind[i]):
+            details.append(f"📋 {kind[i]}")
+        if pd.notna(zone[i]):
+            details.append(f"🏠 Zone {zone[i]}")
+        if pd.notna(comment[i]):
+            details.append(f"ℹ️ {comment[i]}")
+        if pd.notna(cost[i]):
+            details.append(f"💰 ~{cost[i]:.0f} kr for {stay}")
+
+        group = key = None
+        if tariff_data and pd.notna(takst[i]) and takst[i]:
+            group = str(int(takst[i])) if isinstance(takst[i], (int, float, np.number)) else str(takst[i])
+            key = f"{group}|{pd.notna(zone[i])}"
+            if key not in pricing:
+                tariff_info = get_tariff_info(takst[i], tariff_data)
+                pricing[key] = markdown_to_html(format_pricing_info(tariff_info, pd.notna(zone[i]))) if tariff_info else None
+            if not pricing[key]:
+                group = key = None
+
+        distance_m = distances[i]
+        _, label, color = BADGES[band[i]]
+        items.append({
+            'name': str(names[i]),
+            'distance': f"{distance_m:.0f}m" if distance_m < 1000 else f"{distance_m / 1000:.1f}km",
+            'badge': label,
+            'color': color,
+            'details': ' • '.join(details) if details else 'Street parking',
+            'takst': group,
+            'pricing': key,
+            'lat': float(nearest['lat'].iat[i]),
+            'lon': float(nearest['lon'].iat[i]),
+        })
+    return items, {key: value for key, value in pricing.items() if value}
+
+
+TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><style>
+  body { margin: 0; font-family: "Source Sans Pro", sans-serif; color: #31333f; }
+  .parking-card { background-color: rgba(128, 128, 128, 0.1); border-radius: 10px; padding: 1rem;
+                  margin: 0.5rem 0; border-left: 4px solid #0066cc; }
+  .parking-card h3 { margin: 0 0 0.5rem 0; color: #0066cc; }
+  .row { display: flex; align-items: center; gap: 10px; margin-bottom: 0.5rem; }
+  .badge { color: white; padding: 4px 12px; border-radius: 12px; font-weight: bold; font-size: 0.9rem; }
+  .distance { font-size: 1.1rem; font-weight: bold; }
+  .details { margin: 0; opacity: 0.8; }
+  details { margin-top: 0.5rem; } summary { cursor: pointer; }
+  a.nav { display: block; margin-top: 0.75rem; text-align: center; background-color: #0066cc; color: white;
+          padding: 0.6rem; border-radius: 8px; text-decoration: none; }
+  .pager { display: flex; justify-content: space-between; align-items: center; margin: 0.5rem 0; }
+  .pager button { background-color: #0066cc; color: white; border: 0; border-radius: 8px; padding: 0.4rem 1rem; }
+  .pager button:disabled { opacity: 0.4; }
+  @media (prefers-color-scheme: dark) {
+    body { color: #fafafa; }
+    .parking-card { background-color: rgba(255, 255, 255, 0.05); }
+  }
+</style></head><body>
+<div id="list"></div>
+<div class="pager"><button id="prev">‹ Forrige</button><span id="page"></span><button id="next">Neste ›</button></div>
+<script>
+const items = __ITEMS__;
+const pricing = __PRICING__;
+const pageSize = __PAGE_SIZE__;
+const esc = s => String(s).replace(/[&<>"']/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c]));
+let page = 0;
+function card(item) {
+  const maps = `https://www.google.com/maps/dir/?api=1&destination=${item.lat},${item.lon}`;
+  const price = item.pricing ? `<details><summary>💰 Pricing Details (Takstgruppe ${esc(item.takst)})</summary>${pricing[item.pricing]}</details>` : '';
+  return `<div class="parking-card"><h3>🅿️ ${esc(item.name)}</h3>
+    <div class="row"><span class="badge" style="background-color: ${item.color}">${item.badge}</span>
+    <span class="distance">📍 ${item.distance}</span></div>
+    <p class="details">${esc(item.details)}</p>${price}
+    <a class="nav" href="${maps}" target="_blank" rel="noopener">🗺️ Navigate to ${esc(item.name)}</a></div>`;
+}
+function render() {
+  const pages = Math.max(1, Math.ceil(items.length / pageSize));
+  // Only the current page is in the DOM
+  document.getElementById('list').innerHTML = items.slice(page * pageSize, (page + 1) * pageSize).map(card).join('');
+  document.getElementById('page').textContent = `${page + 1} / ${pages}`;
+  document.getElementById('prev').disabled = page === 0;
+  document.getElementById('next').disabled = page >= pages - 1;
+  window.scrollTo(0, 0);
+}
+document.getElementById('prev').onclick = () => { page -= 1; render(); };
+document.getElementById('next').onclick = () => { page += 1; render(); };
+render();
+</script></body></html>
+"""
+
+
+def parking_list_html(items, pricing, page_size=PAGE_SIZE):
+    """Self-contained HTML document for `st.components.v1.html`"""
+    # Keep "</script>" inside strings from ending the script block
+    def as_js(value):
+        return json.dumps(value, ensure_ascii=False).replace('</', '<\\/')
+
+    return (TEMPLATE
+            .replace('__ITEMS__', as_js(items))
+            .replace('__PRICING__', as_js(pricing))
+            .replace('__PAGE_SIZE__', str(int(page_size))))
@@ -0,0 +1,795 @@
+"""
+Oslo Parking Finder - core logic
+
+Data loading, distance queries, ranking, tariff formatting and map
+building, with no Streamlit dependency. `parking_finder_app.py` is the UI
+on top of this module; benchmarks and batch tools import it directly.
+"""
+import base64
+import json
+import os
+import re
+from math import radians, cos, sin, asin, sqrt
+
+import folium
+import numpy as np
+import pandas as pd
+import xyzservices
+from branca.element import Template
+from folium.plugins import FastMarkerCluster
+
+from parking_geometry import GEOM_PATH, GEOM_RING, attribute_columns, collect_geometry, feature_locations
+
+
+# Convert the image to a base64 string
+def image_to_base64(image_path):
+    with open(image_path, "rb") as img_file:
+        return base64.b64encode(img_file.read()).decode('utf-8')
+
+
+def file_signature(filepath):
+    """(mtime_ns, size) of a file, or None if it is missing. Used as a cache key."""
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def load_tariff_data(filepath='takstgruppe_lookup.json'):
+    """Load tariff/pricing information"""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            tariff_data = json.load(f)
+        return tariff_data
+    except FileNotFoundError:
+        return {}
+
+def get_tariff_info(takstgruppe, tariff_data):
+    """Get detailed pricing info for a tariff group"""
+    if not tariff_data or not takstgruppe:
+        return None
+    
+    # Convert to string and try to find match
+    takst_str = str(int(takstgruppe)) if isinstance(takstgruppe, (int, float)) else str(takstgruppe)
+    
+    return tariff_data.get(takst_str)
+
+def format_pricing_info(tariff_info, is_resident=False):
+    """Format tariff information for display"""
+    if not tariff_info:
+        return "Ingen prisinformasjon tilgjengelig"
+    
+    if is_resident:
+        # Resident parking info
+        output = f"**{tariff_info.get('name', 'Beboerparkering')}**\n\n"
+        
+        if 'description' in tariff_info:
+            output += f"ℹ️ {tariff_info['description']}\n\n"
+        
+        if 'avgiftstid' in tariff_info:
+            output += f"🕐 **Avgiftstid:** {tariff_info['avgiftstid']}\n\n"
+        
+        if 'note' in tariff_info:
+            output += f"📝 {tariff_info['note']}\n\n"
+        
+        if 'annual_fee' in tariff_info:
+            fees = tariff_info['annual_fee']
+            output += "💰 **Årlig avgift:**\n"
+            for zone, price in fees.items():
+                if zone != 'currency' and zone != 'note':
+                    output += f"  - {zone.replace('_', ' ').title()}: {price} {fees.get('currency', 'NOK')}/år\n"
+            if 'note' in fees:
+                output += f"\n*{fees['note']}*\n"
+        
+        return output
+    
+    # Regular parking info
+    output = f"**{tariff_info.get('name', 'Parkering')}**\n\n"
+    
+    if 'zone' in tariff_info:
+        output += f"📍 **Sone:** {tariff_info['zone']}\n\n"
+    
+    if 'avgiftstid' in tariff_info:
+        output += f"🕐 **Avgiftstid:** {tariff_info['avgiftstid']}\n\n"
+    
+    if 'maks_tid' in tariff_info:
+        output += f"⏱️ **Maks tid:** {tariff_info['maks_tid']}\n\n"
+    
+    # Pricing for regular cars
+    if 'prices_bensin_diesel' in tariff_info:
+        output += "💰 **Pris bensin/diesel/hybrid/ladbar hybrid:**\n"
+        prices = tariff_info['prices_bensin_diesel']
+        for duration, price in prices.items():
+            if duration != 'currency':
+                hours = duration.replace('h', ' time' if duration == '1h' else ' timer')
+                output += f"  - {hours}: {price} {prices.get('currency', 'NOK')}\n"
+        output += "\n"
+    
+    # Pricing for electric cars
+    if 'prices_elbil' in tariff_info:
+        output += "⚡ **Pris elbil:**\n"
+        prices = tariff_info['prices_elbil']
+        for duration, price in prices.items():
+            if duration != 'currency':
+                hours = duration.replace('h', ' time' if duration == '1h' else ' timer')
+                output += f"  - {hours}: {price} {prices.get('currency', 'NOK')}\n"
+        output += "\n"
+    
+    return output
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate the great circle distance between two points 
+    on the earth (specified in decimal degrees) in meters
+    """
+    # Convert decimal degrees to radians 
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    
+    # Haversine formula 
+    dlon = lon2 - lon1 
+    dlat = lat2 - lat1 
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a)) 
+    
+    # Radius of earth in meters
+    r = 6371000
+    return c * r
+
+
+def load_parking_data(filepath='parking_data.json'):
+    """Load parking data from JSON file"""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        
+        return features_to_dataframe(data.get('features', []))
+    
+    except FileNotFoundError:
+        return None
+
+
+def features_to_dataframe(features, batch=None):
+    """
+    One row per ArcGIS feature with a usable geometry: lat/lon plus attributes.
+    Pass `batch` if `collect_geometry(features)` has already been run.
+    """
+    # Reduce all geometry in one batch (polygon centroids, path midpoints, points)
+    if batch is None:
+        batch = collect_geometry(features)
+    lon, lat = feature_locations(batch)
+    
+    # Build attribute columns directly instead of a list of row dicts
+    attrs = attribute_columns([features[i].get('attributes', {}) for i in batch.feature_index])
+    return pd.DataFrame({'lat': lat, 'lon': lon, **attrs})
+
+
+# Attribute columns the app, services and filters read; everything else is
+# only kept when asked for
+FEATURE_COLUMNS = ['objectid', 'beregnet_antall', 'p_type', 'takstgruppe1',
+                   'beboerparkeringssone', 'nattparkeringsforbud', 'strekningsid']
+
+# Low-cardinality columns held as categoricals
+CATEGORY_COLUMNS = {'takstgruppe1', 'beboerparkeringssone', 'nattparkeringsforbud'}
+
+# Whole-number ids and counts; compact_features keeps them as floats when
+# some are missing, `integer_columns` turns them back into ints for output
+INTEGER_COLUMNS = ['objectid', 'beregnet_antall', 'strekningsid', 'segment_spaces', 'segment_spots']
+
+
+def _smallest_int(values):
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if not len(values) or (values.min() >= info.min and values.max() <= info.max):
+            return values.astype(dtype)
+
+
+def compact_features(df, columns=FEATURE_COLUMNS, coordinate_dtype=np.float32):
+    """
+    Typed, minimal copy of a parking DataFrame: 'lat'/'lon' plus the `columns`
+    that exist. Categories for low-cardinality columns, the smallest int for
+    whole numbers, float32 for nullable counts and ids (exact below 2**24;
+    `integer_columns` turns them back into ints for output). float32
+    coordinates are within 0.25 m around Oslo (latitude steps of 0.42 m,
+    longitude steps of 0.05 m); distances are still computed in float64 by
+    `prepare_coordinates`.
+    """
+    compact = {
+        'lat': df['lat'].to_numpy(dtype=coordinate_dtype),
+        'lon': df['lon'].to_numpy(dtype=coordinate_dtype),
+    }
+    for name in columns:
+        if name not in df or name in compact:
+            continue
+        column = df[name]
+        if name in CATEGORY_COLUMNS or isinstance(column.dtype, pd.CategoricalDtype):
+            compact[name] = column.astype('category')
+        elif column.dtype.kind in 'iu':
+            compact[name] = _smallest_int(column.to_numpy())
+        elif column.dtype.kind == 'f':
+            values = column.to_numpy()
+            finite = values[~np.isnan(values)]
+            whole = np.array_equal(finite, np.round(finite))
+            if whole and not np.isnan(values).any():
+                compact[name] = _smallest_int(values.astype(np.int64))
+            elif whole and (not len(finite) or np.abs(finite).max() < 2 ** 24):
+                compact[name] = values.astype(np.float32)
+            else:
+                compact[name] = values
+        else:
+            compact[name] = column.to_numpy()
+    return pd.DataFrame(compact, index=df.index)
+
+
+def integer_columns(df, columns=INTEGER_COLUMNS):
+    """
+    Copy of df with the float `columns` as pandas nullable ints, so ids and
+    counts are written as 50759 rather than 50759.0. For output only: the
+    ranking code reads those columns as floats.
+    """
+    return df.assign(**{name: df[name].round().astype('Int64') for name in columns
+                        if name in df and df[name].dtype.kind == 'f'})
+
+
+def load_parking_geometry(filepath='parking_data.json'):
+    """Full feature geometry (GeometryBatch) aligned with `load_parking_data` rows"""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return collect_geometry(data.get('features', []))
+    except FileNotFoundError:
+        return None
+
+
+EARTH_RADIUS_M = 6371000
+
+
+def prepare_coordinates(df):
+    """
+    Precompute the arrays used by the distance kernel: contiguous float64
+    lat/lon in radians plus cos(lat). Build once per loaded DataFrame.
+    """
+    lat_rad = np.ascontiguousarray(np.radians(df['lat'].to_numpy(dtype=np.float64)))
+    lon_rad = np.ascontiguousarray(np.radians(df['lon'].to_numpy(dtype=np.float64)))
+    return {
+        'lat_rad': lat_rad,
+        'lon_rad': lon_rad,
+        'cos_lat': np.cos(lat_rad),
+    }
+
+
+def haversine_vector(user_lat, user_lon, coords):
+    """Haversine distance in meters from one point to every precomputed coordinate"""
+    lat1 = radians(user_lat)
+    lon1 = radians(user_lon)
+    
+    dlat = coords['lat_rad'] - lat1
+    dlon = coords['lon_rad'] - lon1
+    a = np.sin(dlat / 2) ** 2 + cos(lat1) * coords['cos_lat'] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def nearest_indices(distances, n):
+    """Positions of the n smallest distances, ordered nearest first"""
+    n = min(n, len(distances))
+    if n <= 0:
+        return np.empty(0, dtype=np.intp)
+    if n < len(distances):
+        # O(N) partial selection, then only sort the n winners
+        candidates = np.argpartition(distances, n - 1)[:n]
+    else:
+        candidates = np.arange(len(distances))
+    return candidates[np.argsort(distances[candidates], kind='stable')]
+
+
+def find_nearest_parking(user_lat, user_lon, df, n=10, coords=None):
+    """Find n nearest parking locations"""
+    if coords is None:
+        coords = prepare_coordinates(df)
+    
+    distances = haversine_vector(user_lat, user_lon, coords)
+    order = nearest_indices(distances, n)
+    
+    # Only the n result rows are copied
+    nearest = df.iloc[order].copy()
+    nearest['distance'] = distances[order]
+    return nearest
+
+
+def parse_route(text):
+    """
+    Route vertices from text: "lat, lon" pairs separated by newlines or ';'.
+    Returns (lats, lons) arrays; raises ValueError for malformed input.
+    """
+    lats, lons = [], []
+    for chunk in re.split(r'[;\n]+', text.strip()):
+        if not chunk.strip():
+            continue
+        parts = [part for part in re.split(r'[,\s]+', chunk.strip()) if part]
+        if len(parts) != 2:
+            raise ValueError(f"expected 'lat, lon', got {chunk.strip()!r}")
+        lat, lon = float(parts[0]), float(parts[1])
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f"coordinates out of range: {chunk.strip()!r}")
+        lats.append(lat)
+        lons.append(lon)
+    return np.array(lats, dtype=np.float64), np.array(lons, dtype=np.float64)
+
+
+def parking_along_route(route_lats, route_lons, df, index, meters=150, filters=()):
+    """
+    Parking within `meters` of a route (polyline of lat/lon vertices, e.g.
+    GPS fixes or a planned route), in the order they are passed.
+    `index` is the ParkingIndex built from `df`; `filters` are the same
+    predicates as for `rank_parking`. Adds 'distance' (to the route) and
+    'chainage' (meters along the route).
+    """
+    positions, distances, chainage = index.along_route(route_lats, route_lons, meters)
+    if filters:
+        mask = np.ones(len(df), dtype=bool)
+        for predicate in filters:
+            mask &= predicate(df)
+        keep = mask[positions]
+        positions, distances, chainage = positions[keep], distances[keep], chainage[keep]
+    
+    along = df.iloc[positions].copy()
+    along['distance'] = distances
+    along['chainage'] = chainage
+    return along
+
+
+# Filter predicates for rank_parking: each takes the full DataFrame and
+# returns a boolean mask over all rows
+def capacity_at_least(spaces):
+    def predicate(df):
+        return df['beregnet_antall'].fillna(0).to_numpy() >= spaces
+    return predicate
+
+
+def in_resident_zone(zone):
+    def predicate(df):
+        return (df['beboerparkeringssone'] == zone).to_numpy()
+    return predicate
+
+
+def tariff_group_in(groups):
+    groups = [float(g) for g in groups]
+    def predicate(df):
+        return np.isin(df['takstgruppe1'].to_numpy(dtype=np.float64), groups)
+    return predicate
+
+
+def no_night_parking_ban(df):
+    if 'nattparkeringsforbud' not in df:
+        return np.ones(len(df), dtype=bool)
+    return (df['nattparkeringsforbud'] != 'Ja').to_numpy()
+
+
+def score_parking(user_lat, user_lon, df, coords=None, filters=(), weights=None,
+                  tariff_table=None, stay_minutes=60, fuel='bensin', start=None):
+    """
+    Per-row score used by `rank_parking` (lower is better); rows excluded by
+    `filters` or without a location score NaN.
+    Returns (score, distances, costs); costs is None without a tariff table.
+    """
+    if coords is None:
+        coords = prepare_coordinates(df)
+    if weights is None:
+        weights = {'distance': 1.0}
+    
+    distances = haversine_vector(user_lat, user_lon, coords)
+    score = weights.get('distance', 1.0) * distances
+    
+    costs = None
+    if tariff_table is not None and 'takstgruppe1' in df:
+        costs = tariff_table.price_for(df['takstgruppe1'].to_numpy(), stay_minutes, start=start, fuel=fuel)
+        if weights.get('cost'):
+            score = score + weights['cost'] * np.where(np.isnan(costs), np.inf, costs)
+    
+    if weights.get('capacity') and 'beregnet_antall' in df:
+        score = score - weights['capacity'] * df['beregnet_antall'].fillna(0).to_numpy()
+    
+    # Rows without a location (e.g. features removed by a sync) never rank
+    mask = np.isfinite(distances)
+    for predicate in filters:
+        mask &= predicate(df)
+    
+    return np.where(mask, score, np.nan), distances, costs
+
+
+def rank_parking(user_lat, user_lon, df, n=10, coords=None, filters=(), weights=None,
+                 tariff_table=None, stay_minutes=60, fuel='bensin', start=None):
+    """
+    Rank parking by a weighted score in one vectorized pass.
+    
+    `filters` are predicates (see `capacity_at_least` etc.) combined with AND.
+    `weights` maps scoring terms to meters-equivalent weights:
+      - 'distance': per meter (default 1)
+      - 'cost': per krone for the planned stay (needs `tariff_table`);
+        spots without a known price rank last
+      - 'capacity': bonus per parking space
+    Returns the n best rows with 'distance', 'score' and, if priced, 'cost'.
+    """
+    score, distances, costs = score_parking(user_lat, user_lon, df, coords, filters, weights,
+                                            tariff_table, stay_minutes, fuel, start)
+    
+    # Excluded rows sort after everything else and are cut from the result
+    included = ~np.isnan(score)
+    order = nearest_indices(np.where(included, score, np.inf), min(n, int(included.sum())))
+    
+    ranked = df.iloc[order].copy()
+    ranked['distance'] = distances[order]
+    ranked['score'] = score[order]
+    if costs is not None:
+        ranked['cost'] = costs[order]
+    return ranked
+
+
+def feature_keys(df):
+    """Stable per-feature key: objectid, then globalid, then the row index"""
+    for column in ('objectid', 'globalid'):
+        if column in df:
+            return df[column].to_numpy()
+    return df.index.to_numpy()
+
+
+def tariff_popup_html(takst_field, tariff_info):
+    """Popup HTML block for one tariff group"""
+    popup_text = f"<br><b>💰 Takstgruppe {takst_field}</b><br>"
+    
+    if 'avgiftstid' in tariff_info:
+        popup_text += f"🕐 {tariff_info['avgiftstid']}<br>"
+    
+    if 'maks_tid' in tariff_info:
+        popup_text += f"⏱️ Maks: {tariff_info['maks_tid']}<br>"
+    
+    # Show first few prices
+    if 'prices_bensin_diesel' in tariff_info:
+        prices = tariff_info['prices_bensin_diesel']
+        popup_text += f"<br><b>Bensin/Diesel:</b><br>"
+        count = 0
+        for duration, price in prices.items():
+            if duration != 'currency' and count < 3:
+                popup_text += f"  {duration}: {price} kr<br>"
+                count += 1
+    
+    popup_text += f"<small>Click parking for full details</small><br>"
+    return popup_text
+
+
+def build_popup_fragments(parking_df, tariff_data=None):
+    """
+    Precompute the static popup/tooltip HTML for every feature.
+    Returns {feature key: (head, tail, tooltip name)}; the distance line
+    goes between head and tail. Tariff blocks are built once per group and
+    shared between features.
+    """
+    tariff_blocks = {}
+    fragments = {}
+    
+    for key, (idx, row) in zip(feature_keys(parking_df), parking_df.iterrows()):
+        # Customize popup based on available fields
+        head = f"<b>🅿️ Street Parking</b><br>"
+        
+        # Oslo-specific field names (Norwegian)
+        if 'GATENAVN' in row and pd.notna(row['GATENAVN']):
+            head += f"<b>{row['GATENAVN']}</b><br>"
+        elif 'name' in row and pd.notna(row['name']):
+            head += f"<b>{row['name']}</b><br>"
+        elif 'NAME' in row and pd.notna(row['NAME']):
+            head += f"<b>{row['NAME']}</b><br>"
+        
+        tail = ""
+        
+        # Add capacity if available
+        if 'KAPASITET' in row and pd.notna(row['KAPASITET']):
+            tail += f"🚗 Capacity: {row['KAPASITET']} spaces<br>"
+        
+        # Add type if available
+        if 'TYPE' in row and pd.notna(row['TYPE']):
+            tail += f"📋 Type: {row['TYPE']}<br>"
+        
+        # Add resident zone if available
+        if 'beboerparkeringssone' in row and pd.notna(row['beboerparkeringssone']):
+            tail += f"🏘️ Resident Zone: {row['beboerparkeringssone']}<br>"
+        
+        # Add tariff information if available
+        if tariff_data:
+            takst_field = None
+            if 'takstgruppe1' in row and pd.notna(row['takstgruppe1']):
+                takst_field = row['takstgruppe1']
+            elif 'takstgruppe1_code' in row and pd.notna(row['takstgruppe1_code']):
+                takst_field = row['takstgruppe1_code']
+            
+            if takst_field:
+                if takst_field not in tariff_blocks:
+                    tariff_info = get_tariff_info(takst_field, tariff_data)
+                    tariff_blocks[takst_field] = tariff_popup_html(takst_field, tariff_info) if tariff_info else ""
+                tail += tariff_blocks[takst_field]
+        
+        # Add comments if available
+        if 'KOMMENTAR' in row and pd.notna(row['KOMMENTAR']):
+            tail += f"<br>ℹ️ {row['KOMMENTAR']}<br>"
+        
+        # Get name for tooltip
+        name = row.get('GATENAVN', row.get('name', row.get('NAME', 'Parking')))
+        fragments[key] = (head, tail, f"{name}")
+    
+    return fragments
+
+
+# Resolved once: looking 'OpenStreetMap' up by name scans every xyzservices
+# provider and was most of the cost of creating a map
+OSM_TILES = xyzservices.providers.query_name('OpenStreetMap Mapnik')
+
+
+def osm_map(**kwargs):
+    """folium.Map with OpenStreetMap tiles, same as tiles='OpenStreetMap'"""
+    m = folium.Map(tiles=None, **kwargs)
+    folium.TileLayer(OSM_TILES, name='openstreetmap').add_to(m)
+    return m
+
+
+def distance_color(distance):
+    """Marker colour for a distance in meters"""
+    if distance < 200:
+        return 'green'
+    elif distance < 500:
+        return 'orange'
+    return 'blue'
+
+
+def create_base_map(user_location):
+    """Folium map with the legend but no markers, centered on the user or Oslo"""
+    center_lat = user_location[0] if user_location else 59.9139
+    center_lon = user_location[1] if user_location else 10.7522
+    
+    m = osm_map(
+        location=[center_lat, center_lon],
+        zoom_start=14
+    )
+    
+    # Add legend
+    legend_html = '''
+    <div style="
+        position: fixed; 
+        bottom: 50px; 
+        left: 50px; 
+        width: 220px; 
+        height: auto; 
+        background-color: rgba(255, 255, 255, 0.95);
+        backdrop-filter: blur(10px);
+        border: 1px solid rgba(128, 128, 128, 0.3); 
+        border-radius: 8px; 
+        z-index: 9999; 
+        font-size: 14px;
+        padding: 12px;
+        box-shadow: 0 2px 8px rgba(0,0,0,0.15);
+        color: #000;
+    ">
+        <h4 style="margin: 0 0 10px 0; font-size: 16px; color: #000;">🅿️ Parking Legend</h4>
+        <div style="margin: 5px 0;">
+            <i class="fa fa-map-marker fa-2x" style="color: red;"></i>
+            <span style="margin-left: 10px;">Your Location</span>
+        </div>
+        <div style="margin: 5px 0;">
+            <i class="fa fa-circle" style="color: green; font-size: 18px;"></i>
+            <span style="margin-left: 10px;">< 200m away</span>
+        </div>
+        <div style="margin: 5px 0;">
+            <i class="fa fa-circle" style="color: orange; font-size: 18px;"></i>
+            <span style="margin-left: 10px;">200-500m away</span>
+        </div>
+        <div style="margin: 5px 0;">
+            <i class="fa fa-circle" style="color: blue; font-size: 18px;"></i>
+            <span style="margin-left: 10px;">> 500m away</span>
+        </div>
+    </div>
+    
+    <style>
+        @media (prefers-color-scheme: dark) {
+            .leaflet-container {
+                background: #1a1a1a !important;
+            }
+        }
+    </style>
+    '''
+    m.get_root().html.add_child(folium.Element(legend_html))
+    return m
+
+
+def parking_markers(user_location, parking_df, show_user=True, tariff_data=None, popup_fragments=None):
+    """(lat, lon, colour, icon, popup HTML, popup max width, tooltip) for the user and every parking row"""
+    markers = []
+    if show_user and user_location:
+        markers.append((user_location[0], user_location[1], 'red', 'user', "Your Location", '100%', "You are here"))
+    
+    # Static HTML comes from the render cache so only the distance-dependent
+    # parts are formatted here
+    if popup_fragments is None:
+        popup_fragments = build_popup_fragments(parking_df, tariff_data)
+    
+    keys = feature_keys(parking_df)
+    distances = parking_df['distance'].to_numpy() if 'distance' in parking_df else None
+    for i, (key, lat, lon) in enumerate(zip(keys, parking_df['lat'].to_numpy(), parking_df['lon'].to_numpy())):
+        head, tail, name = popup_fragments[key]
+        
+        # Color by distance if available
+        if distances is not None:
+            distance = distances[i]
+            popup_text = f"{head}📍 {distance:.0f}m away<br>{tail}"
+            tooltip_text = f"{name} - {distance:.0f}m"
+            color = distance_color(distance)
+        else:
+            popup_text = head + tail
+            tooltip_text = f"{name}"
+            color = 'blue'
+        markers.append((float(lat), float(lon), color, 'parking', popup_text, 300, tooltip_text))
+    return markers
+
+
+def add_parking_markers(target, user_location, parking_df, show_user=True, tariff_data=None, popup_fragments=None):
+    """Add the user and parking markers to a map or feature group"""
+    for lat, lon, color, icon, popup_text, max_width, tooltip_text in parking_markers(
+            user_location, parking_df, show_user, tariff_data, popup_fragments):
+        folium.Marker(
+            [lat, lon],
+            popup=folium.Popup(popup_text, max_width=max_width),
+            icon=folium.Icon(color=color, icon=icon, prefix='fa'),
+            tooltip=tooltip_text
+        ).add_to(target)
+    return target
+
+
+class MarkerLayer(folium.FeatureGroup):
+    """
+    FeatureGroup of `parking_markers`, written as one script. Each
+    folium.Marker renders its icon, popup and tooltip through separate
+    templates; here the same Leaflet calls run in a loop over the marker
+    data, so the layer renders in about the time of one template.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup({}){% if this._parent %}.addTo({{ this._parent.get_name() }}){% endif %};
+            var {{ this.get_name() }}_markers = {{ this.data }};
+            {{ this.get_name() }}_markers.forEach(function (m) {
+                var popup = L.popup({"maxWidth": m[5]}).setContent(
+                    '<div style="width: 100.0%; height: 100.0%;">' + m[4] + '</div>');
+                L.marker([m[0], m[1]], {})
+                    .setIcon(L.AwesomeMarkers.icon(
+                        {"extraClasses": "fa-rotate-0", "icon": m[3], "iconColor": "white", "markerColor": m[2], "prefix": "fa"}))
+                    .bindPopup(popup)
+                    .bindTooltip('<div>' + m[6] + '</div>', {"sticky": true})
+                    .addTo({{ this.get_name() }});
+            });
+        {% endmacro %}
+    """)
+
+    def __init__(self, markers, name="Parking"):
+        super().__init__(name=name)
+        self.markers = markers
+        # Data goes into a <script>: keep '</' from closing it
+        self.data = json.dumps(markers).replace('</', '<\\/')
+
+
+def create_map(user_location, parking_df, show_user=True, tariff_data=None, popup_fragments=None):
+    """Create a folium map with parking locations"""
+    m = create_base_map(user_location)
+    return add_parking_markers(m, user_location, parking_df, show_user, tariff_data, popup_fragments)
+
+
+def _nullable(value):
+    """JSON-friendly attribute value (NaN -> None, numpy scalars -> Python)"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+def parking_geojson(parking_df, geometry, precision=6):
+    """
+    GeoJSON FeatureCollection of the actual parking polygons/paths.
+    `geometry` is the GeometryBatch aligned with `parking_df` rows.
+    """
+    # One rounding + tolist for all vertices, then slice per part
+    vertices = np.round(np.asarray(geometry.vertices), precision).tolist()
+    part_offsets = np.asarray(geometry.part_offsets)
+    feature_parts = np.asarray(geometry.feature_parts)
+    kinds = np.asarray(geometry.kinds)
+    
+    capacity = parking_df['beregnet_antall'].to_numpy() if 'beregnet_antall' in parking_df else None
+    zone = parking_df['beboerparkeringssone'].to_numpy() if 'beboerparkeringssone' in parking_df else None
+    takst = parking_df['takstgruppe1'].to_numpy() if 'takstgruppe1' in parking_df else None
+    
+    features = []
+    for i, key in enumerate(feature_keys(parking_df)):
+        parts = [vertices[part_offsets[p]:part_offsets[p + 1]] for p in range(feature_parts[i], feature_parts[i + 1])]
+        if kinds[i] == GEOM_RING:
+            shape = {'type': 'Polygon', 'coordinates': parts}
+        elif kinds[i] == GEOM_PATH:
+            shape = {'type': 'MultiLineString', 'coordinates': parts}
+        else:
+            shape = {'type': 'Point', 'coordinates': parts[0][0]}
+        features.append({
+            'type': 'Feature',
+            'id': _nullable(key),
+            'geometry': shape,
+            'properties': {
+                'capacity': _nullable(capacity[i]) if capacity is not None else None,
+                'zone': _nullable(zone[i]) if zone is not None else None,
+                'takstgruppe': _nullable(takst[i]) if takst is not None else None,
+            },
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def create_overview_map(user_location, parking_df, geometry=None, mode='cluster', tariff_data=None):
+    """
+    Map of all parking as one client-side layer instead of one folium.Marker per row.
+    mode='cluster' ships a compact [lat, lon, ...] array to a browser-side
+    marker cluster; mode='polygons' draws the actual street polygons from
+    `geometry`. Popups are built in the browser only when opened.
+    """
+    center_lat = user_location[0] if user_location else 59.9139
+    center_lon = user_location[1] if user_location else 10.7522
+    
+    m = osm_map(
+        location=[center_lat, center_lon],
+        zoom_start=14,
+        prefer_canvas=True
+    )
+    
+    if user_location:
+        folium.Marker(
+            user_location,
+            popup="Your Location",
+            icon=folium.Icon(color='red', icon='user', prefix='fa'),
+            tooltip="You are here"
+        ).add_to(m)
+    
+    if mode == 'polygons' and geometry is not None:
+        folium.GeoJson(
+            parking_geojson(parking_df, geometry),
+            name="Parking",
+            style_function=lambda feature: {'color': '#0066cc', 'weight': 2, 'fillOpacity': 0.4},
+            highlight_function=lambda feature: {'weight': 4, 'fillOpacity': 0.7},
+            tooltip=folium.GeoJsonTooltip(fields=['capacity'], aliases=['🚗 Spaces:']),
+            popup=folium.GeoJsonPopup(
+                fields=['capacity', 'zone', 'takstgruppe'],
+                aliases=['🚗 Spaces', '🏘️ Resident Zone', '💰 Takstgruppe']
+            ),
+        ).add_to(m)
+        return m
+    
+    # Tariff HTML is shipped once per group and looked up when a popup opens
+    tariff_blocks = {}
+    if tariff_data and 'takstgruppe1' in parking_df:
+        for takst_field in parking_df['takstgruppe1'].dropna().unique():
+            tariff_info = get_tariff_info(takst_field, tariff_data)
+            if tariff_info:
+                tariff_blocks[str(_nullable(takst_field))] = tariff_popup_html(_nullable(takst_field), tariff_info)
+    
+    capacity = parking_df['beregnet_antall'] if 'beregnet_antall' in parking_df else pd.Series(None, index=parking_df.index)
+    zone = parking_df['beboerparkeringssone'] if 'beboerparkeringssone' in parking_df else pd.Series(None, index=parking_df.index)
+    takst = parking_df['takstgruppe1'] if 'takstgruppe1' in parking_df else pd.Series(None, index=parking_df.index)
+    data = [
+        [round(float(lat), 6), round(float(lon), 6), _nullable(c), _nullable(z), None if t is None or pd.isna(t) else str(_nullable(t))]
+        for lat, lon, c, z, t in zip(parking_df['lat'], parking_df['lon'], capacity, zone, takst)
+    ]
+    
+    callback = """
+    var tariffBlocks = %s;
+    var callback = function (row) {
+        var marker = L.marker(new L.LatLng(row[0], row[1]));
+        marker.bindPopup(function () {
+            var html = "<b>🅿️ Street Parking</b><br>";
+            if (row[2] !== null) { html += "🚗 Capacity: " + row[2] + " spaces<br>"; }
+            if (row[3] !== null) { html += "🏘️ Resident Zone: " + row[3] + "<br>"; }
+            if (row[4] !== null && tariffBlocks[row[4]]) { html += tariffBlocks[row[4]]; }
+            return html;
+        }, {maxWidth: 300});
+        return marker;
+    };
+    """ % json.dumps(tariff_blocks, ensure_ascii=False)
+    
+    FastMarkerCluster(data, callback=callback, name="Parking").add_to(m)
+    return m
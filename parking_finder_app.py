@@ -1,16 +1,43 @@
 """
 Oslo Parking Finder - Mobile-Friendly Streamlit App
 FIXED: GPS location now persists using session_state
+
+UI only; data loading, queries and map building live in parking_core.py
 """
+import json
+import os
+import time
+
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
-import numpy as np
-import json
-from math import radians, cos, sin, asin, sqrt
-import folium
 from streamlit_folium import st_folium
 from streamlit_geolocation import streamlit_geolocation
-import base64
+
+from availability import free_now, legal_overnight, overnight_start, week_slot
+from data_snapshot import SnapshotManager
+from gps_tracking import UPDATE_BUDGET_MS, Tracker
+from instrumentation import METRICS, stage
+from list_view import LIST_HEIGHT, parking_list_html, parking_list_items
+from parking_core import (
+    capacity_at_least,
+    create_base_map,
+    create_map,
+    create_overview_map,
+    file_signature,
+    parking_along_route,
+    parse_route,
+)
+from query_cache import QueryCache
+from static_assets import MANIFEST, STATIC_DIR, asset_url, compact_html, thumbnail_data_uri
+from street_routing import WALK_CANDIDATES, rerank_by_walking
+from street_segments import rank_segments, segment_members
+from tariff_engine import format_minutes, oslo_now
+
+rerun_started = time.perf_counter()
+
+# GPS fixes kept per session for the route search
+GPS_TRAIL_LENGTH = 500
 
 # Configure page for mobile
 st.set_page_config(
@@ -21,21 +48,22 @@ st.set_page_config(
 )
 
 
-# Convert the image to a base64 string
-def image_to_base64(image_path):
-    with open(image_path, "rb") as img_file:
-        return base64.b64encode(img_file.read()).decode('utf-8')
+# Process-wide caches: built once, shared by every session, and rebuilt
+# only when the file signature changes. Callers must treat results as read-only.
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _cached_avatar_src(image_path, signature):
+    # Fingerprinted static file from `python static_assets.py`, else a small inlined thumbnail
+    return asset_url(image_path) or thumbnail_data_uri(image_path)
 
-# Load your image from a local path
-image_path = (r"cartoon.JPG")
-# Get the base64 string of the image
-image_base64 = image_to_base64(image_path)
 
-# Display your image and name in the top right corner
-st.markdown(
-    f"""
-    <style>
-    .header {{
+def cached_avatar_src(image_path):
+    return _cached_avatar_src(image_path, (file_signature(image_path), file_signature(os.path.join(STATIC_DIR, MANIFEST))))
+
+
+# Page styles, templated once per process and sent as a single block
+PAGE_STYLE = compact_html("""
+<style>
+    .header {
         position: absolute;  /* Fix the position */
         top: 20px;  /* Adjust as needed */
         right: 20px;  /* Align to the right */
@@ -46,33 +74,20 @@ st.markdown(
         flex-direction: column; /* Stack items vertically */
         text-align: center; /* Ensures text is centrally aligned */
         z-index: 999;
-    }}
-    .header img {{
+    }
+    .header img {
         border-radius: 50%;
         width: 50px;
         height: 50px;
         margin-bottom: 5px; /* Space between image and text */
         box-shadow: 0 2px 4px rgba(0,0,0,0.2);
-    }}
-    .header-text {{
+    }
+    .header-text {
         font-size: 12px;
         font-weight: normal; /* Regular weight for text */
         text-align: center;
         opacity: 0.8;
-    }}
-    </style>
-    <div class="header">
-        <img src="data:image/jpeg;base64,{image_base64}" alt="Mohsen Askar">
-        <div class="header-text">Developed by: Mohsen Askar</div>
-    </div>
-    """,
-    unsafe_allow_html=True
-)
-
-
-# Custom CSS for mobile-friendly design (theme-aware)
-st.markdown("""
-<style>
+    }
     .main > div {
         padding-top: 2rem;
     }
@@ -88,349 +103,114 @@ st.markdown("""
         padding: 0.75rem;
         border-radius: 8px;
     }
-    .parking-card {
-        background-color: var(--background-color, rgba(128, 128, 128, 0.1));
-        border-radius: 10px;
-        padding: 1rem;
-        margin: 0.5rem 0;
-        border-left: 4px solid #0066cc;
-    }
-    
-    /* Dark mode support */
-    @media (prefers-color-scheme: dark) {
-        .parking-card {
-            background-color: rgba(255, 255, 255, 0.05);
-        }
-    }
 </style>
-""", unsafe_allow_html=True)
-
+""")
+
+# Distance colour legend shown above the results
+COLOR_LEGEND = compact_html("""
+<div style="
+    background: linear-gradient(135deg, rgba(0, 102, 204, 0.1) 0%, rgba(0, 102, 204, 0.05) 100%);
+    padding: 15px; 
+    border-radius: 10px; 
+    margin-bottom: 20px;
+    border: 1px solid rgba(0, 102, 204, 0.2);
+">
+    <h4 style="margin: 0 0 10px 0;">🎨 Color Guide</h4>
+    <div style="display: flex; gap: 20px; flex-wrap: wrap;">
+        <div>
+            <span style="color: red; font-size: 20px;">●</span>
+            <strong>Your Location</strong>
+        </div>
+        <div>
+            <span style="color: green; font-size: 20px;">●</span>
+            <strong>Very Close</strong> (&lt; 200m)
+        </div>
+        <div>
+            <span style="color: orange; font-size: 20px;">●</span>
+            <strong>Close</strong> (200-500m)
+        </div>
+        <div>
+            <span style="color: blue; font-size: 20px;">●</span>
+            <strong>Moderate</strong> (&gt; 500m)
+        </div>
+    </div>
+</div>
+""")
 
-def load_tariff_data(filepath='takstgruppe_lookup.json'):
-    """Load tariff/pricing information"""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            tariff_data = json.load(f)
-        return tariff_data
-    except FileNotFoundError:
-        return {}
+# Load your image from a local path
+image_path = (r"cartoon.JPG")
 
-def get_tariff_info(takstgruppe, tariff_data):
-    """Get detailed pricing info for a tariff group"""
-    if not tariff_data or not takstgruppe:
-        return None
-    
-    # Convert to string and try to find match
-    takst_str = str(int(takstgruppe)) if isinstance(takstgruppe, (int, float)) else str(takstgruppe)
-    
-    return tariff_data.get(takst_str)
+# Display your image and name in the top right corner
+st.markdown(
+    PAGE_STYLE + f"""<div class="header"><img src="{cached_avatar_src(image_path)}" alt="Mohsen Askar">"""
+    """<div class="header-text">Developed by: Mohsen Askar</div></div>""",
+    unsafe_allow_html=True
+)
 
-def format_pricing_info(tariff_info, is_resident=False):
-    """Format tariff information for display"""
-    if not tariff_info:
-        return "Ingen prisinformasjon tilgjengelig"
-    
-    if is_resident:
-        # Resident parking info
-        output = f"**{tariff_info.get('name', 'Beboerparkering')}**\n\n"
-        
-        if 'description' in tariff_info:
-            output += f"ℹ️ {tariff_info['description']}\n\n"
-        
-        if 'avgiftstid' in tariff_info:
-            output += f"🕐 **Avgiftstid:** {tariff_info['avgiftstid']}\n\n"
-        
-        if 'note' in tariff_info:
-            output += f"📝 {tariff_info['note']}\n\n"
-        
-        if 'annual_fee' in tariff_info:
-            fees = tariff_info['annual_fee']
-            output += "💰 **Årlig avgift:**\n"
-            for zone, price in fees.items():
-                if zone != 'currency' and zone != 'note':
-                    output += f"  - {zone.replace('_', ' ').title()}: {price} {fees.get('currency', 'NOK')}/år\n"
-            if 'note' in fees:
-                output += f"\n*{fees['note']}*\n"
-        
-        return output
-    
-    # Regular parking info
-    output = f"**{tariff_info.get('name', 'Parkering')}**\n\n"
-    
-    if 'zone' in tariff_info:
-        output += f"📍 **Sone:** {tariff_info['zone']}\n\n"
-    
-    if 'avgiftstid' in tariff_info:
-        output += f"🕐 **Avgiftstid:** {tariff_info['avgiftstid']}\n\n"
-    
-    if 'maks_tid' in tariff_info:
-        output += f"⏱️ **Maks tid:** {tariff_info['maks_tid']}\n\n"
-    
-    # Pricing for regular cars
-    if 'prices_bensin_diesel' in tariff_info:
-        output += "💰 **Pris bensin/diesel/hybrid/ladbar hybrid:**\n"
-        prices = tariff_info['prices_bensin_diesel']
-        for duration, price in prices.items():
-            if duration != 'currency':
-                hours = duration.replace('h', ' time' if duration == '1h' else ' timer')
-                output += f"  - {hours}: {price} {prices.get('currency', 'NOK')}\n"
-        output += "\n"
-    
-    # Pricing for electric cars
-    if 'prices_elbil' in tariff_info:
-        output += "⚡ **Pris elbil:**\n"
-        prices = tariff_info['prices_elbil']
-        for duration, price in prices.items():
-            if duration != 'currency':
-                hours = duration.replace('h', ' time' if duration == '1h' else ' timer')
-                output += f"  - {hours}: {price} {prices.get('currency', 'NOK')}\n"
-        output += "\n"
-    
-    return output
 
-def haversine_distance(lat1, lon1, lat2, lon2):
+@st.cache_resource(show_spinner="Loading parking data...")
+def data_manager():
     """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees) in meters
+    Parking and tariff data shared by every session. A background thread
+    rebuilds it when the files change and swaps the new version in whole.
     """
-    # Convert decimal degrees to radians 
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    
-    # Haversine formula 
-    dlon = lon2 - lon1 
-    dlat = lat2 - lat1 
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a)) 
-    
-    # Radius of earth in meters
-    r = 6371000
-    return c * r
-
-
-def load_parking_data(filepath='parking_data.json'):
-    """Load parking data from JSON file"""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Extract features into a DataFrame
-        features = data.get('features', [])
-        
-        parking_list = []
-        for feature in features:
-            attrs = feature.get('attributes', {})
-            geom = feature.get('geometry', {})
-            
-            # Get coordinates (handle different geometry types)
-            if 'x' in geom and 'y' in geom:
-                # Point geometry
-                lon, lat = geom['x'], geom['y']
-            elif 'paths' in geom and len(geom['paths']) > 0:
-                # Polyline - use midpoint of first path (street parking segments)
-                coords = geom['paths'][0]
-                if len(coords) > 0:
-                    # Calculate midpoint
-                    mid_idx = len(coords) // 2
-                    lon, lat = coords[mid_idx][0], coords[mid_idx][1]
-                else:
-                    continue
-            elif 'rings' in geom and len(geom['rings']) > 0:
-                # Polygon - use centroid
-                coords = geom['rings'][0]
-                lon = np.mean([c[0] for c in coords])
-                lat = np.mean([c[1] for c in coords])
-            else:
-                continue
-            
-            parking_list.append({
-                'lat': lat,
-                'lon': lon,
-                **attrs  # Include all attributes
-            })
-        
-        return pd.DataFrame(parking_list)
-    
-    except FileNotFoundError:
-        return None
+    return SnapshotManager().start()
+
+
+@st.cache_resource(show_spinner=False)
+def query_cache():
+    """Ranked results shared by every session, keyed on a ~150 m location cell"""
+    return QueryCache()
+
+
+def show_debug_page(manager):
+    """Hidden page (?debug=1): stage timings, memory, caches and profile"""
+    st.title("🛠️ Debug")
+    snapshot = manager.current
+    if snapshot is not None:
+        st.caption(f"Data version {snapshot.version}, loaded {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.loaded_at))}")
+    if manager.last_error:
+        st.warning(f"Last reload failed: {manager.last_error}")
+
+    report = METRICS.report()
+    st.subheader("⏱️ Stages")
+    if report['stages']:
+        st.dataframe(pd.DataFrame(report['stages']).T.drop(columns='histogram'), use_container_width=True)
+        name = st.selectbox("Histogram", list(report['stages']))
+        st.bar_chart(pd.Series(report['stages'][name]['histogram'], name='count'))
+    else:
+        st.info("No stages timed yet.")
 
+    st.subheader("🔁 Query cache")
+    st.json(query_cache().stats())
+    st.subheader("🧠 Memory")
+    st.json(report['memory'])
+    if 'profile_top' in report:
+        st.subheader("🔥 Profile (most sampled functions)")
+        st.dataframe(pd.DataFrame(report['profile_top'], columns=['function', 'samples']), use_container_width=True)
 
-def find_nearest_parking(user_lat, user_lon, df, n=10):
-    """Find n nearest parking locations"""
-    df = df.copy()
-    df['distance'] = df.apply(
-        lambda row: haversine_distance(user_lat, user_lon, row['lat'], row['lon']),
-        axis=1
-    )
-    df = df.sort_values('distance')
-    return df.head(n)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("⬇️ Download report", json.dumps(report, indent=2), file_name="parking_metrics.json")
+    with col2:
+        if st.button("🧹 Reset timings"):
+            METRICS.reset()
+            st.rerun()
 
 
-def create_map(user_location, parking_df, show_user=True, tariff_data=None):
-    """Create a folium map with parking locations"""
-    
-    # Create map centered on user location or Oslo
-    center_lat = user_location[0] if user_location else 59.9139
-    center_lon = user_location[1] if user_location else 10.7522
-    
-    m = folium.Map(
-        location=[center_lat, center_lon],
-        zoom_start=14,
-        tiles='OpenStreetMap'
-    )
-    
-    # Add legend
-    legend_html = '''
-    <div style="
-        position: fixed; 
-        bottom: 50px; 
-        left: 50px; 
-        width: 220px; 
-        height: auto; 
-        background-color: rgba(255, 255, 255, 0.95);
-        backdrop-filter: blur(10px);
-        border: 1px solid rgba(128, 128, 128, 0.3); 
-        border-radius: 8px; 
-        z-index: 9999; 
-        font-size: 14px;
-        padding: 12px;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.15);
-        color: #000;
-    ">
-        <h4 style="margin: 0 0 10px 0; font-size: 16px; color: #000;">🅿️ Parking Legend</h4>
-        <div style="margin: 5px 0;">
-            <i class="fa fa-map-marker fa-2x" style="color: red;"></i>
-            <span style="margin-left: 10px;">Your Location</span>
-        </div>
-        <div style="margin: 5px 0;">
-            <i class="fa fa-circle" style="color: green; font-size: 18px;"></i>
-            <span style="margin-left: 10px;">< 200m away</span>
-        </div>
-        <div style="margin: 5px 0;">
-            <i class="fa fa-circle" style="color: orange; font-size: 18px;"></i>
-            <span style="margin-left: 10px;">200-500m away</span>
-        </div>
-        <div style="margin: 5px 0;">
-            <i class="fa fa-circle" style="color: blue; font-size: 18px;"></i>
-            <span style="margin-left: 10px;">> 500m away</span>
-        </div>
-    </div>
-    
-    <style>
-        @media (prefers-color-scheme: dark) {
-            .leaflet-container {
-                background: #1a1a1a !important;
-            }
-        }
-    </style>
-    '''
-    m.get_root().html.add_child(folium.Element(legend_html))
-    
-    # Add user location
-    if show_user and user_location:
-        folium.Marker(
-            user_location,
-            popup="Your Location",
-            icon=folium.Icon(color='red', icon='user', prefix='fa'),
-            tooltip="You are here"
-        ).add_to(m)
-    
-    # Add parking locations
-    for idx, row in parking_df.iterrows():
-        # Customize popup based on available fields
-        popup_text = f"<b>🅿️ Street Parking</b><br>"
-        
-        # Oslo-specific field names (Norwegian)
-        if 'GATENAVN' in row and pd.notna(row['GATENAVN']):
-            popup_text += f"<b>{row['GATENAVN']}</b><br>"
-        elif 'name' in row and pd.notna(row['name']):
-            popup_text += f"<b>{row['name']}</b><br>"
-        elif 'NAME' in row and pd.notna(row['NAME']):
-            popup_text += f"<b>{row['NAME']}</b><br>"
-        
-        if 'distance' in row:
-            popup_text += f"📍 {row['distance']:.0f}m away<br>"
-        
-        # Add capacity if available
-        if 'KAPASITET' in row and pd.notna(row['KAPASITET']):
-            popup_text += f"🚗 Capacity: {row['KAPASITET']} spaces<br>"
-        
-        # Add type if available
-        if 'TYPE' in row and pd.notna(row['TYPE']):
-            popup_text += f"📋 Type: {row['TYPE']}<br>"
-        
-        # Add resident zone if available
-        if 'beboerparkeringssone' in row and pd.notna(row['beboerparkeringssone']):
-            popup_text += f"🏘️ Resident Zone: {row['beboerparkeringssone']}<br>"
-        
-        # Add tariff information if available
-        if tariff_data:
-            takst_field = None
-            if 'takstgruppe1' in row and pd.notna(row['takstgruppe1']):
-                takst_field = row['takstgruppe1']
-            elif 'takstgruppe1_code' in row and pd.notna(row['takstgruppe1_code']):
-                takst_field = row['takstgruppe1_code']
-            
-            if takst_field:
-                tariff_info = get_tariff_info(takst_field, tariff_data)
-                if tariff_info:
-                    popup_text += f"<br><b>💰 Takstgruppe {takst_field}</b><br>"
-                    
-                    if 'avgiftstid' in tariff_info:
-                        popup_text += f"🕐 {tariff_info['avgiftstid']}<br>"
-                    
-                    if 'maks_tid' in tariff_info:
-                        popup_text += f"⏱️ Maks: {tariff_info['maks_tid']}<br>"
-                    
-                    # Show first few prices
-                    if 'prices_bensin_diesel' in tariff_info:
-                        prices = tariff_info['prices_bensin_diesel']
-                        popup_text += f"<br><b>Bensin/Diesel:</b><br>"
-                        count = 0
-                        for duration, price in prices.items():
-                            if duration != 'currency' and count < 3:
-                                popup_text += f"  {duration}: {price} kr<br>"
-                                count += 1
-                    
-                    popup_text += f"<small>Click parking for full details</small><br>"
-        
-        # Add comments if available
-        if 'KOMMENTAR' in row and pd.notna(row['KOMMENTAR']):
-            popup_text += f"<br>ℹ️ {row['KOMMENTAR']}<br>"
-        
-        # Color by distance if available
-        if 'distance' in row:
-            if row['distance'] < 200:
-                color = 'green'
-            elif row['distance'] < 500:
-                color = 'orange'
-            else:
-                color = 'blue'
-        else:
-            color = 'blue'
-        
-        # Get name for tooltip
-        name = row.get('GATENAVN', row.get('name', row.get('NAME', 'Parking')))
-        tooltip_text = f"{name}"
-        if 'distance' in row:
-            tooltip_text += f" - {row['distance']:.0f}m"
-        
-        folium.Marker(
-            [row['lat'], row['lon']],
-            popup=folium.Popup(popup_text, max_width=300),
-            icon=folium.Icon(color=color, icon='parking', prefix='fa'),
-            tooltip=tooltip_text
-        ).add_to(m)
-    
-    return m
+if st.experimental_get_query_params().get('debug'):
+    show_debug_page(data_manager())
+    st.stop()
 
 
 # Main app
 st.title("🅿️ Oslo Zone D Grünerløkka Parking Finder")
 
-# Load parking data
-parking_df = load_parking_data()
+# Take one data version for this whole run, so a reload in the background
+# never mixes old and new data
+data = data_manager().current
 
-if parking_df is None:
+if data is None:
     st.error("""
     ⚠️ Parking data not found!
     
@@ -438,10 +218,11 @@ if parking_df is None:
     """)
     st.stop()
 
+parking_df, parking_coords = data.parking_df, data.coords
 st.success(f"✓ Loaded {len(parking_df)} parking locations")
 
 # Load tariff data
-tariff_data = load_tariff_data()
+tariff_data = data.tariff_data
 if tariff_data:
     st.success(f"✓ Loaded tariff information for {len([k for k in tariff_data.keys() if not k.startswith('_')])} tariff groups")
 else:
@@ -479,6 +260,7 @@ location_method = st.radio(
 )
 
 user_location = None
+tracking = False
 
 if location_method == "📍 Use my current location (GPS)":
     st.info("""
@@ -494,6 +276,12 @@ if location_method == "📍 Use my current location (GPS)":
     if location and location.get("latitude") is not None:
         st.session_state.gps_lat = location["latitude"]
         st.session_state.gps_lon = location["longitude"]
+        # Keep the recent fixes, usable as a route below
+        trail = st.session_state.setdefault('gps_trail', [])
+        fix = (location["latitude"], location["longitude"])
+        if not trail or trail[-1] != fix:
+            trail.append(fix)
+            del trail[:-GPS_TRAIL_LENGTH]
     
     # ✅ FIX: Check if we have location saved in session state
     if 'gps_lat' in st.session_state and 'gps_lon' in st.session_state:
@@ -503,6 +291,8 @@ if location_method == "📍 Use my current location (GPS)":
         user_location = (user_lat, user_lon)
         
         st.success(f"✅ Location detected: {user_lat:.6f}, {user_lon:.6f}")
+        tracking = st.toggle("🛰️ Tracking mode", help="While you move, only nearby candidates are re-ranked and "
+                                                      "only changed markers are sent to the map")
         
         # Show on small map for confirmation
         col1, col2 = st.columns([3, 1])
@@ -569,133 +359,190 @@ else:
 # Number of results
 n_results = st.slider("Number of nearby parking spots to show", 5, 50, 10)
 
+# Planned stay, used for the cost estimate
+tariff_table = data.tariff_table
+col1, col2 = st.columns([3, 1])
+with col1:
+    stay_options = {format_minutes(minutes): minutes for minutes in [30, 60, 120, 180, 240, 480, 1440]}
+    stay_label = st.select_slider("⏱️ Planned stay", options=list(stay_options), value=format_minutes(60))
+    stay_minutes = stay_options[stay_label]
+with col2:
+    is_ev = st.toggle("⚡ Elbil")
+
+# Ranking and filters
+RANKINGS = {
+    "📍 Nearest": {'distance': 1.0},
+    "💰 Cheapest": {'distance': 0.1, 'cost': 10.0},
+    "⚖️ Balanced": {'distance': 1.0, 'cost': 5.0, 'capacity': 10.0},
+}
+with st.expander("🔎 Sort & filter"):
+    ranking = st.radio("Sort by", list(RANKINGS), horizontal=True)
+    min_capacity = st.number_input("Minimum number of spaces", min_value=0, max_value=50, value=0)
+    overnight = st.checkbox("🌙 Only spots without night parking ban")
+    free_only = st.checkbox("🆓 Only spots that are free right now")
+    by_street = st.checkbox("🛣️ One result per street", help="Group spots that share a street segment (strekningsid)")
+
+filters = []
+if min_capacity:
+    filters.append(capacity_at_least(min_capacity))
+if overnight:
+    filters.append(legal_overnight(data.availability))
+if free_only:
+    filters.append(free_now(data.availability))
+# Time-dependent filters change with the overnight period and the 15-minute slot
+filter_key = (min_capacity, overnight and overnight_start(), free_only and week_slot(oslo_now()))
+
+# Tracking keeps its candidates and map between GPS fixes
+tracker = st.session_state.setdefault('tracker', Tracker()) if tracking and not by_street else None
+if tracker is None:
+    st.session_state.pop('tracker', None)
+
 if user_location:
     # Find nearest parking
-    nearest = find_nearest_parking(user_location[0], user_location[1], parking_df, n_results)
+    # Scores, filters and the estimated cost of the planned stay in one pass
+    # Nearby repeat lookups only re-rank a cached candidate set
+    # With a street graph, preselect more candidates by straight-line score
+    # and re-rank them by walking distance
+    street_graph = data.street_graph
+    n_candidates = max(n_results, WALK_CANDIDATES) if street_graph is not None else n_results
+    update_started = time.perf_counter()
+    with stage('query.rank'):
+        if tracker is not None:
+            nearest = tracker.rank(
+                user_location[0], user_location[1], parking_df, n_candidates,
+                coords=parking_coords,
+                filters=filters,
+                query_key=(data.version, n_candidates, filter_key, ranking, stay_minutes, is_ev),
+                weights=RANKINGS[ranking],
+                tariff_table=tariff_table,
+                stay_minutes=stay_minutes,
+                fuel='elbil' if is_ev else 'bensin'
+            )
+        elif by_street:
+            # Each street segment is represented by its best spot
+            nearest = rank_segments(
+                user_location[0], user_location[1], parking_df, data.segments, n_candidates,
+                coords=parking_coords,
+                filters=filters,
+                weights=RANKINGS[ranking],
+                tariff_table=tariff_table,
+                stay_minutes=stay_minutes,
+                fuel='elbil' if is_ev else 'bensin'
+            )
+        else:
+            nearest = query_cache().rank(
+                user_location[0], user_location[1], parking_df, n_candidates,
+                coords=parking_coords,
+                filters=filters,
+                filter_key=filter_key,
+                weights=RANKINGS[ranking],
+                tariff_table=tariff_table,
+                stay_minutes=stay_minutes,
+                fuel='elbil' if is_ev else 'bensin',
+                version=data.version
+            )
+    if street_graph is not None:
+        with stage('query.walking'):
+            nearest = rerank_by_walking(user_location[0], user_location[1], nearest, street_graph, n_results,
+                                        distance_weight=RANKINGS[ranking].get('distance', 1.0))
     
     # Display results
-    st.subheader(f"🎯 {len(nearest)} Nearest Parking Spots")
+    what = "Streets" if by_street else "Parking Spots"
+    if ranking == "📍 Nearest":
+        st.subheader(f"🎯 {len(nearest)} Nearest {what}")
+    else:
+        st.subheader(f"🎯 {len(nearest)} Best {what} ({ranking})")
+    if street_graph is not None:
+        st.caption("🚶 Distances are walking distances along the streets")
     
     # Add color legend
-    st.markdown("""
-    <div style="
-        background: linear-gradient(135deg, rgba(0, 102, 204, 0.1) 0%, rgba(0, 102, 204, 0.05) 100%);
-        padding: 15px; 
-        border-radius: 10px; 
-        margin-bottom: 20px;
-        border: 1px solid rgba(0, 102, 204, 0.2);
-    ">
-        <h4 style="margin: 0 0 10px 0;">🎨 Color Guide</h4>
-        <div style="display: flex; gap: 20px; flex-wrap: wrap;">
-            <div>
-                <span style="color: red; font-size: 20px;">●</span>
-                <strong>Your Location</strong>
-            </div>
-            <div>
-                <span style="color: green; font-size: 20px;">●</span>
-                <strong>Very Close</strong> (&lt; 200m)
-            </div>
-            <div>
-                <span style="color: orange; font-size: 20px;">●</span>
-                <strong>Close</strong> (200-500m)
-            </div>
-            <div>
-                <span style="color: blue; font-size: 20px;">●</span>
-                <strong>Moderate</strong> (&gt; 500m)
-            </div>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(COLOR_LEGEND, unsafe_allow_html=True)
     
     # Create tabs for map and list views
     tab1, tab2 = st.tabs(["🗺️ Map View", "📋 List View"])
     
     with tab1:
+        map_mode = st.radio(
+            "Show on map",
+            ["🎯 Nearest spots", "🗺️ All parking (clustered)", "🧱 All parking (street polygons)"],
+            horizontal=True,
+            label_visibility="collapsed"
+        )
+        
         # Show map
-        m = create_map(user_location, nearest, tariff_data=tariff_data)
-        st_folium(m, width=None, height=500)
+        layer = None
+        with stage('map.create'):
+            if map_mode == "🎯 Nearest spots" and tracker is not None:
+                # Same base map every update; only the marker layer changes
+                m = create_base_map(tracker.map_center)
+                layer = tracker.marker_layer(user_location, nearest, tariff_data=tariff_data,
+                                             popup_fragments=data.popup_fragments)
+            elif map_mode == "🎯 Nearest spots":
+                m = create_map(user_location, nearest, tariff_data=tariff_data, popup_fragments=data.popup_fragments)
+            elif map_mode == "🗺️ All parking (clustered)":
+                m = create_overview_map(user_location, parking_df, mode='cluster', tariff_data=tariff_data)
+            else:
+                m = create_overview_map(user_location, parking_df, geometry=data.geometry, mode='polygons')
+        with stage('map.st_folium'):
+            if layer is not None:
+                st_folium(m, key='tracking_map', width=None, height=500, center=user_location,
+                          feature_group_to_add=layer)
+            else:
+                st_folium(m, width=None, height=500)
+        if tracker is not None:
+            update_ms = tracker.finish_update(update_started)
+            METRICS.record('track.update', update_ms)
+            summary = f"🛰️ Update {update_ms:.1f} ms (budget {UPDATE_BUDGET_MS:.0f} ms) · {len(tracker.candidates)} candidates"
+            if layer is not None:
+                diff = tracker.last_diff
+                summary += f" · markers +{len(diff.added)} −{len(diff.removed)} · {len(diff.recoloured)} recoloured"
+            st.caption(summary)
     
     with tab2:
-        # Show list of parking spots
-        for idx, row in nearest.iterrows():
-            distance_m = row['distance']
-            distance_str = f"{distance_m:.0f}m" if distance_m < 1000 else f"{distance_m/1000:.1f}km"
-            
-            # Determine color based on distance
-            if distance_m < 200:
-                badge_color = "#28a745"  # Green
-                distance_label = "Very Close"
-            elif distance_m < 500:
-                badge_color = "#fd7e14"  # Orange
-                distance_label = "Close"
-            else:
-                badge_color = "#007bff"  # Blue
-                distance_label = "Moderate"
-            
-            # Get name from Oslo-specific fields or fallbacks
-            name = row.get('GATENAVN', row.get('name', row.get('NAME', 'Street Parking')))
-            
-            # Get additional details
-            details = []
-            if 'KAPASITET' in row and pd.notna(row['KAPASITET']):
-                details.append(f"🚗 {row['KAPASITET']} spaces")
-            if 'TYPE' in row and pd.notna(row['TYPE']):
-                details.append(f"📋 {row['TYPE']}")
-            if 'beboerparkeringssone' in row and pd.notna(row['beboerparkeringssone']):
-                details.append(f"🏠 Zone {row['beboerparkeringssone']}")
-            if 'KOMMENTAR' in row and pd.notna(row['KOMMENTAR']):
-                details.append(f"ℹ️ {row['KOMMENTAR']}")
-            
-            details_str = ' • '.join(details) if details else 'Street parking'
-            
-            st.markdown(f"""
-            <div class="parking-card">
-                <h3 style="margin: 0 0 0.5rem 0; color: #0066cc;">
-                    🅿️ {name}
-                </h3>
-                <div style="display: flex; align-items: center; gap: 10px; margin-bottom: 0.5rem;">
-                    <span style="
-                        background-color: {badge_color}; 
-                        color: white; 
-                        padding: 4px 12px; 
-                        border-radius: 12px; 
-                        font-weight: bold;
-                        font-size: 0.9rem;
-                    ">
-                        {distance_label}
-                    </span>
-                    <span style="font-size: 1.1rem; font-weight: bold;">
-                        📍 {distance_str}
-                    </span>
-                </div>
-                <p style="margin: 0; opacity: 0.8;">
-                    {details_str}
-                </p>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Add pricing details if available
-            if tariff_data:
-                takst_field = None
-                if 'takstgruppe1' in row and pd.notna(row['takstgruppe1']):
-                    takst_field = row['takstgruppe1']
-                elif 'takstgruppe1_code' in row and pd.notna(row['takstgruppe1_code']):
-                    takst_field = row['takstgruppe1_code']
-                
-                if takst_field:
-                    tariff_info = get_tariff_info(takst_field, tariff_data)
-                    if tariff_info:
-                        # Check if this is resident parking
-                        is_resident = 'beboerparkeringssone' in row and pd.notna(row['beboerparkeringssone'])
-                        
-                        with st.expander(f"💰 Pricing Details (Takstgruppe {takst_field})"):
-                            pricing_text = format_pricing_info(tariff_info, is_resident)
-                            st.markdown(pricing_text)
-            
-            if st.button(f"Navigate to {name}", key=f"nav_{idx}"):
-                # Open Google Maps navigation
-                maps_url = f"https://www.google.com/maps/dir/?api=1&destination={row['lat']},{row['lon']}"
-                st.markdown(f"[🗺️ Open in Google Maps]({maps_url})")
+        with stage('list.render'):
+            # One component for the whole list; paging and navigation links run in the browser
+            items, pricing = parking_list_items(nearest, tariff_data, stay_minutes)
+            components.html(parking_list_html(items, pricing), height=LIST_HEIGHT, scrolling=True)
+
+        if by_street and len(nearest):
+            # Drill down into the spots of one street segment
+            labels = {
+                f"#{i + 1} · {item['distance']} · {item['details'].split(' • ')[0]}": segment
+                for i, (item, segment) in enumerate(zip(items, nearest['segment']))
+            }
+            choice = st.selectbox("🔍 Spots on this street", list(labels))
+            members = segment_members(user_location[0], user_location[1], parking_df, data.segments,
+                                      labels[choice], coords=parking_coords)
+            if tariff_table is not None:
+                members['cost'] = tariff_table.price_for(members['takstgruppe1'].to_numpy(), stay_minutes,
+                                                         fuel='elbil' if is_ev else 'bensin')
+            items, pricing = parking_list_items(members, tariff_data, stay_minutes)
+            components.html(parking_list_html(items, pricing), height=LIST_HEIGHT, scrolling=True)
+
+# Parking along a route instead of around one point
+with st.expander("🧭 Parking along a route"):
+    trail = st.session_state.get('gps_trail', [])
+    route_text = st.text_area(
+        "Route points, one \"lat, lon\" per line (e.g. from a planned route)",
+        value="\n".join(f"{lat:.6f}, {lon:.6f}" for lat, lon in trail) if len(trail) > 1 else "",
+        help="Filled with your GPS fixes when there are several"
+    )
+    corridor = st.slider("Max distance from the route (m)", 25, 500, 100, step=25)
+    if route_text.strip():
+        try:
+            route_lats, route_lons = parse_route(route_text)
+        except ValueError as e:
+            st.error(f"⚠️ {e}")
+        else:
+            with stage('query.route'):
+                along = parking_along_route(route_lats, route_lons, parking_df, data.index, corridor, filters)
+            st.caption(f"{len(along)} spots within {corridor} m of the route, in order along it")
+            if len(along):
+                if tariff_table is not None:
+                    along['cost'] = tariff_table.price_for(along['takstgruppe1'].to_numpy(), stay_minutes,
+                                                           fuel='elbil' if is_ev else 'bensin')
+                items, pricing = parking_list_items(along, tariff_data, stay_minutes)
+                components.html(parking_list_html(items, pricing), height=LIST_HEIGHT, scrolling=True)
 
 # Footer
 st.markdown("---")
@@ -704,3 +551,5 @@ st.markdown("""
     Made with ❤️ for Rawdooshy | Data from Oslo Municipality
 </div>
 """, unsafe_allow_html=True)
+
+METRICS.record('rerun', (time.perf_counter() - rerun_started) * 1000)
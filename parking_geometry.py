@@ -0,0 +1,210 @@
+"""
+Batched geometry reduction for ArcGIS features
+
+All parts (polygon rings, polyline paths, points) of all features are
+concatenated into one (M, 2) lon/lat vertex array with offset arrays, and
+per-feature locations are computed with `np.add.reduceat` instead of a
+Python loop per feature:
+
+- polygons: area-weighted centroid over all rings (holes subtract, since
+  ArcGIS stores them with the opposite winding)
+- polylines: point halfway along the first path
+- points: the point itself
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# Geometry kinds, one per feature
+GEOM_POINT = 0
+GEOM_PATH = 1
+GEOM_RING = 2
+
+GeometryBatch = namedtuple('GeometryBatch', [
+    'feature_index',  # position of each kept feature in the source list
+    'kinds',          # (N,) uint8 geometry kind
+    'vertices',       # (M, 2) float64 lon/lat
+    'part_offsets',   # (P + 1,) vertex offset of each part
+    'feature_parts',  # (N + 1,) part offset of each feature
+])
+
+
+def feature_parts(geom):
+    """(kind, parts) for one ArcGIS geometry, or None if it has no usable shape"""
+    if 'x' in geom and 'y' in geom:
+        return GEOM_POINT, [[[geom['x'], geom['y']]]]
+    if 'paths' in geom and len(geom['paths']) > 0 and len(geom['paths'][0]) > 0:
+        return GEOM_PATH, geom['paths']
+    if 'rings' in geom and len(geom['rings']) > 0 and len(geom['rings'][0]) > 0:
+        return GEOM_RING, geom['rings']
+    return None
+
+
+def collect_geometry(features):
+    """Concatenate the geometry of ArcGIS features into one GeometryBatch"""
+    feature_index, kinds = [], []
+    vertices, part_offsets, feature_offsets = [], [0], [0]
+    for i, feature in enumerate(features):
+        shape = feature_parts(feature.get('geometry') or {})
+        if shape is None:
+            continue
+        kind, parts = shape
+        feature_index.append(i)
+        kinds.append(kind)
+        for part in parts:
+            vertices.extend(part)
+            part_offsets.append(len(vertices))
+        feature_offsets.append(len(part_offsets) - 1)
+
+    return GeometryBatch(
+        feature_index=np.asarray(feature_index, dtype=np.int64),
+        kinds=np.asarray(kinds, dtype=np.uint8),
+        vertices=np.asarray(vertices, dtype=np.float64).reshape(-1, 2)[:, :2],
+        part_offsets=np.asarray(part_offsets, dtype=np.int64),
+        feature_parts=np.asarray(feature_offsets, dtype=np.int64),
+    )
+
+
+def _segment_reduce(values, offsets):
+    """Sum of `values` over each [offsets[i], offsets[i+1]) range; empty ranges give 0"""
+    starts = offsets[:-1]
+    sums = np.zeros(len(starts), dtype=np.float64)
+    nonempty = offsets[1:] > starts
+    if len(values) and nonempty.any():
+        sums[nonempty] = np.add.reduceat(values, starts[nonempty])
+    return sums
+
+
+def _part_ids(part_offsets, n_vertices):
+    """Part number of every vertex"""
+    return np.repeat(np.arange(len(part_offsets) - 1), np.diff(part_offsets))[:n_vertices]
+
+
+def polygon_centroids(vertices, part_offsets, feature_parts):
+    """
+    Area-weighted centroid of each feature's rings.
+    Features whose rings have no area fall back to the mean of their
+    vertices, ignoring the duplicated closing vertex.
+    """
+    n_vertices = len(vertices)
+    part_of = _part_ids(part_offsets, n_vertices)
+
+    # Next vertex within the same ring (wrapping to the ring start)
+    nxt = np.arange(1, n_vertices + 1)
+    last = part_offsets[1:] - 1
+    nonempty = part_offsets[1:] > part_offsets[:-1]
+    nxt[last[nonempty]] = part_offsets[:-1][nonempty]
+
+    # Work relative to each ring's first vertex to avoid cancellation
+    origin = vertices[part_offsets[:-1][part_of]] if n_vertices else vertices
+    x = vertices[:, 0] - origin[:, 0]
+    y = vertices[:, 1] - origin[:, 1]
+    x1, y1 = x[nxt], y[nxt]
+    cross = x * y1 - x1 * y
+
+    # Per ring: 2*area, and 6*area*centroid relative to the ring origin
+    area2 = _segment_reduce(cross, part_offsets)
+    cx6 = _segment_reduce((x + x1) * cross, part_offsets)
+    cy6 = _segment_reduce((y + y1) * cross, part_offsets)
+    ring_origin = vertices[part_offsets[:-1][nonempty]] if n_vertices else np.zeros((0, 2))
+    ox = np.zeros(len(area2))
+    oy = np.zeros(len(area2))
+    ox[nonempty] = ring_origin[:, 0]
+    oy[nonempty] = ring_origin[:, 1]
+
+    # Combine rings per feature: sum(A_i * C_i) / sum(A_i)
+    feat_area2 = _segment_reduce(area2, feature_parts)
+    feat_mx = _segment_reduce(cx6 / 3 + ox * area2, feature_parts)
+    feat_my = _segment_reduce(cy6 / 3 + oy * area2, feature_parts)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lon = feat_mx / feat_area2
+        lat = feat_my / feat_area2
+
+    degenerate = ~np.isfinite(lon) | ~np.isfinite(lat) | (np.abs(feat_area2) < 1e-18)
+    if degenerate.any():
+        mean_lon, mean_lat = _vertex_means(vertices, part_offsets, feature_parts)
+        lon[degenerate] = mean_lon[degenerate]
+        lat[degenerate] = mean_lat[degenerate]
+    return lon, lat
+
+
+def _vertex_means(vertices, part_offsets, feature_parts):
+    """Mean vertex per feature, skipping a ring's closing vertex if it repeats the first"""
+    n_vertices = len(vertices)
+    weight = np.ones(n_vertices)
+    starts, ends = part_offsets[:-1], part_offsets[1:]
+    closed = (ends - starts > 1)
+    closed[closed] = np.all(vertices[starts[closed]] == vertices[ends[closed] - 1], axis=1)
+    weight[ends[closed] - 1] = 0
+
+    feature_vertex_offsets = part_offsets[feature_parts]
+    count = _segment_reduce(weight, feature_vertex_offsets)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lon = _segment_reduce(vertices[:, 0] * weight, feature_vertex_offsets) / count
+        lat = _segment_reduce(vertices[:, 1] * weight, feature_vertex_offsets) / count
+    return lon, lat
+
+
+def path_midpoints(vertices, part_offsets, feature_parts):
+    """Point halfway along the first path of each feature"""
+    first_start = part_offsets[feature_parts[:-1]]
+    first_end = part_offsets[feature_parts[:-1] + 1]
+
+    # Segment lengths in a locally isotropic frame (lon scaled by cos(lat))
+    scale = np.cos(np.radians(vertices[:, 1])) if len(vertices) else np.ones(0)
+    dx = np.diff(vertices[:, 0]) * scale[:-1]
+    dy = np.diff(vertices[:, 1])
+    seg = np.hypot(dx, dy)
+    # Segments that bridge two parts do not exist
+    bridges = part_offsets[1:-1] - 1
+    seg[bridges[(bridges >= 0) & (bridges < len(seg))]] = 0
+    cumulative = np.concatenate([[0.0], np.cumsum(seg)])
+
+    start_len = cumulative[first_start]
+    end_len = cumulative[first_end - 1]
+    target = start_len + (end_len - start_len) / 2
+
+    # Segment containing the halfway point, clamped to the first path
+    seg_index = np.searchsorted(cumulative, target, side='right') - 1
+    seg_index = np.clip(seg_index, first_start, np.maximum(first_end - 2, first_start))
+    seg_start = vertices[seg_index]
+    seg_end = vertices[np.minimum(seg_index + 1, first_end - 1)]
+    seg_length = cumulative[np.minimum(seg_index + 1, first_end - 1)] - cumulative[seg_index]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(seg_length > 0, (target - cumulative[seg_index]) / seg_length, 0.0)
+    t = np.clip(t, 0.0, 1.0)[:, None]
+    point = seg_start + t * (seg_end - seg_start)
+    return point[:, 0], point[:, 1]
+
+
+def feature_locations(batch):
+    """Representative (lon, lat) arrays for every feature in a GeometryBatch"""
+    n = len(batch.kinds)
+    lon = np.empty(n)
+    lat = np.empty(n)
+
+    points = batch.kinds == GEOM_POINT
+    if points.any():
+        first_vertex = batch.part_offsets[batch.feature_parts[:-1][points]]
+        lon[points] = batch.vertices[first_vertex, 0]
+        lat[points] = batch.vertices[first_vertex, 1]
+
+    paths = batch.kinds == GEOM_PATH
+    if paths.any():
+        path_lon, path_lat = path_midpoints(batch.vertices, batch.part_offsets, batch.feature_parts)
+        lon[paths] = path_lon[paths]
+        lat[paths] = path_lat[paths]
+
+    rings = batch.kinds == GEOM_RING
+    if rings.any():
+        ring_lon, ring_lat = polygon_centroids(batch.vertices, batch.part_offsets, batch.feature_parts)
+        lon[rings] = ring_lon[rings]
+        lat[rings] = ring_lat[rings]
+    return lon, lat
+
+
+def attribute_columns(attribute_rows):
+    """Column name -> list of values, in first-seen column order"""
+    names = list(dict.fromkeys(name for attrs in attribute_rows for name in attrs))
+    return {name: [attrs.get(name) for attrs in attribute_rows] for name in names}
@@ -0,0 +1,272 @@
+"""
+Compiled columnar store for parking features
+
+`parking_data.json` is an ArcGIS REST dump that is mostly polygon vertices.
+This module compiles it once into a flat binary file:
+
+    b"PKSTORE1" | uint64 header length | JSON header | 64-byte aligned columns
+
+The header describes every column (dtype, shape, byte offset into the
+aligned data section). Attribute columns are typed from the layer's `fields`
+list, strings are dictionary encoded, and all geometry vertices live in one
+(M, 2) float64 buffer indexed by offset arrays. Opening the store memory-maps columns lazily, so memory
+only grows with the columns that are actually read.
+
+Usage:
+    python parking_store.py build [parking_data.json] [-o parking_data.pkstore]
+    python parking_store.py info [parking_data.pkstore]
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+import pandas as pd
+
+from parking_geometry import GeometryBatch, attribute_columns, collect_geometry, feature_locations
+
+MAGIC = b"PKSTORE1"
+FORMAT_VERSION = 2
+ALIGNMENT = 64
+
+DEFAULT_SOURCE = 'parking_data.json'
+DEFAULT_STORE = 'parking_data.pkstore'
+
+INTEGER_FIELD_TYPES = {
+    'esriFieldTypeOID',
+    'esriFieldTypeInteger',
+    'esriFieldTypeSmallInteger',
+    'esriFieldTypeDate',
+}
+FLOAT_FIELD_TYPES = {'esriFieldTypeDouble', 'esriFieldTypeSingle'}
+
+
+def _encode_column(values, field_type):
+    """Typed array plus header metadata for one attribute column"""
+    has_null = any(v is None for v in values)
+
+    if field_type in INTEGER_FIELD_TYPES and not has_null:
+        return np.asarray(values, dtype=np.int64), {'kind': 'numeric'}
+    if field_type in INTEGER_FIELD_TYPES or field_type in FLOAT_FIELD_TYPES:
+        # Nullable numbers load as float64/NaN, the same as pandas does from JSON
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64), {'kind': 'numeric'}
+
+    # Everything else is dictionary encoded; code -1 is null
+    categories = sorted({v for v in values if v is not None}, key=str)
+    lookup = {v: i for i, v in enumerate(categories)}
+    codes = np.array([-1 if v is None else lookup[v] for v in values], dtype=np.int32)
+    return codes, {'kind': 'category', 'categories': categories}
+
+
+def compile_parking_data(source=DEFAULT_SOURCE, target=DEFAULT_STORE):
+    """Compile an ArcGIS JSON dump into a columnar store. Returns the header."""
+    with open(source, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    features = data.get('features', [])
+    field_types = {field['name']: field.get('type') for field in data.get('fields', [])}
+
+    batch = collect_geometry(features)
+    lon, lat = feature_locations(batch)
+    attribute_rows = [features[i].get('attributes', {}) for i in batch.feature_index]
+
+    columns = {
+        'lat': (lat, {'kind': 'numeric'}),
+        'lon': (lon, {'kind': 'numeric'}),
+    }
+    for name, values in attribute_columns(attribute_rows).items():
+        columns[name] = _encode_column(values, field_types.get(name))
+
+    geometry = {
+        'kind': (batch.kinds, {}),
+        'vertices': (batch.vertices, {}),
+        'part_offsets': (batch.part_offsets, {}),
+        'feature_parts': (batch.feature_parts, {}),
+    }
+
+    metadata = {k: v for k, v in data.items() if k not in ('features', 'fields')}
+    return write_store(target, len(batch.kinds), columns, geometry, metadata)
+
+
+def _data_start(header_length):
+    """Columns start at the first aligned byte after the header"""
+    return -(-(len(MAGIC) + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+
+
+def write_store(target, n_features, columns, geometry, metadata=None):
+    """Write named arrays to `target` in the store layout. Returns the header."""
+    header = {
+        'version': FORMAT_VERSION,
+        'n_features': n_features,
+        'metadata': metadata or {},
+        'columns': {},
+        'geometry': {},
+    }
+
+    # Offsets are relative to the data section so the header can be
+    # serialized once without knowing its own length
+    buffers = []
+    offset = 0
+    for section, arrays in (('columns', columns), ('geometry', geometry)):
+        for name, (array, extra) in arrays.items():
+            array = np.ascontiguousarray(array)
+            header[section][name] = {
+                'dtype': array.dtype.str,
+                'shape': list(array.shape),
+                'offset': offset,
+                **extra,
+            }
+            buffers.append((offset, array))
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    data_start = _data_start(len(header_bytes))
+
+    tmp_path = f"{target}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for relative_offset, array in buffers:
+            f.seek(data_start + relative_offset)
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, target)
+    return header
+
+
+def read_header(path):
+    """Parsed header plus the absolute offset of the data section"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a parking store")
+        (length,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length).decode('utf-8'))
+    if header.get('version') != FORMAT_VERSION:
+        raise ValueError(f"{path} has store version {header.get('version')}, expected {FORMAT_VERSION}")
+    return header, _data_start(length)
+
+
+class ParkingStore:
+    """Read-only, memory-mapped view of a compiled store"""
+
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = path
+        self.header, self.data_start = read_header(path)
+        self.n_features = self.header['n_features']
+        self.metadata = self.header['metadata']
+        self._arrays = {}
+
+    @property
+    def column_names(self):
+        return list(self.header['columns'])
+
+    def _map(self, entry):
+        if entry['shape'][0] == 0:
+            return np.empty(entry['shape'], dtype=entry['dtype'])
+        return np.memmap(self.path, dtype=entry['dtype'], mode='r',
+                         offset=self.data_start + entry['offset'], shape=tuple(entry['shape']))
+
+    def raw(self, name):
+        """Stored array for a column (category columns return their codes)"""
+        key = ('columns', name)
+        if key not in self._arrays:
+            self._arrays[key] = self._map(self.header['columns'][name])
+        return self._arrays[key]
+
+    def column(self, name):
+        """Column as a pandas-ready array; strings come back as a Categorical"""
+        entry = self.header['columns'][name]
+        if entry['kind'] == 'category':
+            return pd.Categorical.from_codes(self.raw(name), categories=entry['categories'])
+        return self.raw(name)
+
+    def geometry(self, name):
+        """One of 'kind', 'vertices', 'part_offsets', 'feature_parts'"""
+        key = ('geometry', name)
+        if key not in self._arrays:
+            self._arrays[key] = self._map(self.header['geometry'][name])
+        return self._arrays[key]
+
+    def feature_vertices(self, i):
+        """List of (K, 2) lon/lat vertex arrays, one per part of feature i"""
+        parts = self.geometry('feature_parts')
+        offsets = self.geometry('part_offsets')
+        vertices = self.geometry('vertices')
+        return [vertices[offsets[p]:offsets[p + 1]] for p in range(parts[i], parts[i + 1])]
+
+    def geometry_batch(self):
+        """All geometry as a GeometryBatch aligned with the store's rows"""
+        return GeometryBatch(
+            feature_index=np.arange(self.n_features),
+            kinds=self.geometry('kind'),
+            vertices=self.geometry('vertices'),
+            part_offsets=self.geometry('part_offsets'),
+            feature_parts=self.geometry('feature_parts'),
+        )
+
+    def to_dataframe(self, columns=None):
+        """DataFrame of the requested columns (default: all), 'lat' and 'lon' first"""
+        if columns is None:
+            columns = self.column_names
+        else:
+            columns = ['lat', 'lon'] + [c for c in columns if c not in ('lat', 'lon')]
+        return pd.DataFrame({name: self.column(name) for name in columns}, copy=False)
+
+
+def load_parking_store(path=DEFAULT_STORE, columns=None):
+    """Load parking features from a compiled store, like `load_parking_data`"""
+    try:
+        return ParkingStore(path).to_dataframe(columns)
+    except FileNotFoundError:
+        return None
+
+
+def store_is_current(store_path=DEFAULT_STORE, source_path=DEFAULT_SOURCE):
+    """True if the store exists, has this format version and is at least as new as its JSON source"""
+    try:
+        store_mtime = os.stat(store_path).st_mtime_ns
+        read_header(store_path)
+    except (FileNotFoundError, ValueError):
+        return False
+    try:
+        return store_mtime >= os.stat(source_path).st_mtime_ns
+    except FileNotFoundError:
+        return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile or inspect the parking feature store")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="Compile an ArcGIS JSON dump")
+    build.add_argument('source', nargs='?', default=DEFAULT_SOURCE)
+    build.add_argument('-o', '--output', default=DEFAULT_STORE)
+
+    info = commands.add_parser('info', help="Describe a compiled store")
+    info.add_argument('path', nargs='?', default=DEFAULT_STORE)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        header = compile_parking_data(args.source, args.output)
+        size_in = os.path.getsize(args.source)
+        size_out = os.path.getsize(args.output)
+        print(f"✓ Compiled {header['n_features']} features: {args.source} ({size_in / 1024:.0f} KB) "
+              f"-> {args.output} ({size_out / 1024:.0f} KB)")
+        return 0
+
+    store = ParkingStore(args.path)
+    print(f"{args.path}: {store.n_features} features, store version {store.header['version']}")
+    for section in ('columns', 'geometry'):
+        print(f"\n{section}:")
+        for name, entry in store.header[section].items():
+            extra = f" ({len(entry['categories'])} categories)" if entry.get('kind') == 'category' else ''
+            print(f"  {name:28s} {entry['dtype']:>5s} {str(tuple(entry['shape'])):>12s}{extra}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,384 @@
+"""
+Streaming ingestion of ArcGIS JSON exports
+
+`json.load` on an export keeps the whole parsed document alive, several
+times the file size for an Oslo-wide layer. This module reads the file in
+fixed-size chunks and decodes one `features[]` element at a time with
+`json.JSONDecoder.raw_decode`, so only the current feature is ever a
+Python object. Attributes go straight into growable typed column buffers
+(strings dictionary-encoded) and geometry is reduced to a location per
+feature in blocks, unless the full geometry is asked for. Several zone
+exports can be merged into one frame; features are de-duplicated by
+objectid.
+
+Usage:
+    python parking_stream.py zone_d.json zone_e.json [--all-columns]
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from parking_core import FEATURE_COLUMNS, compact_features
+from parking_geometry import GeometryBatch, feature_locations, feature_parts
+
+CHUNK_CHARS = 1 << 16
+
+# A single value larger than this means the file is broken, not a big feature
+MAX_VALUE_CHARS = 64 << 20
+
+# Rough bytes of JSON per feature, to pre-size the buffers
+BYTES_PER_FEATURE = 2000
+
+# Features whose geometry is reduced together when it isn't kept
+REDUCE_BLOCK = 4096
+
+_WHITESPACE = ' \t\n\r'
+
+
+class StreamError(ValueError):
+    """The file is not an ArcGIS JSON export"""
+
+
+class FeatureStream:
+    """
+    Iterate over the `features` of an ArcGIS JSON file without loading it.
+    Other top-level members (url, fields, ...) are collected in `meta` as
+    they are passed; it is complete once iteration ends.
+    """
+
+    def __init__(self, path, chunk_chars=CHUNK_CHARS):
+        self.path = path
+        self.chunk_chars = chunk_chars
+        self.meta = {}
+        self._decoder = json.JSONDecoder()
+
+    def __iter__(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self._file = f
+            self._buf = ''
+            self._pos = 0
+            self._eof = False
+            yield from self._document()
+
+    def _fill(self):
+        """Read another chunk; False at end of file"""
+        if self._eof:
+            return False
+        chunk = self._file.read(self.chunk_chars)
+        if not chunk:
+            self._eof = True
+            return False
+        # Drop what has been consumed before appending
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """Next non-whitespace character (not consumed), or '' at end of file"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise StreamError(f"{self.path}: expected {' or '.join(repr(c) for c in chars)}, got {char!r}")
+        self._pos += 1
+        return char
+
+    def _value(self):
+        """Decode one JSON value, reading more chunks until it is complete"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                if len(self._buf) - self._pos > MAX_VALUE_CHARS:
+                    raise StreamError(f"{self.path}: invalid JSON near offset {e.pos}") from None
+                if self._fill():
+                    continue
+                raise StreamError(f"{self.path}: {e}") from None
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self._buf) and not self._eof and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def _document(self):
+        self._expect('{')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == 'features':
+                yield from self._features()
+            else:
+                self.meta[key] = self._value()
+            if self._expect(',}') == '}':
+                return
+
+    def _features(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(',]') == ']':
+                return
+
+
+class _Column:
+    """Growable attribute column: float64 with NaN for numbers, int32 codes for strings"""
+
+    def __init__(self, capacity):
+        self.kind = None
+        self.values = None
+        self.capacity = capacity
+        self.all_int = True
+        self.categories = {}
+
+    def _allocate(self, kind):
+        self.kind = kind
+        if kind == 'number':
+            self.values = np.full(self.capacity, np.nan)
+        elif kind == 'string':
+            self.values = np.full(self.capacity, -1, dtype=np.int32)
+        else:
+            self.values = np.full(self.capacity, None, dtype=object)
+
+    def grow(self, capacity):
+        if self.values is not None:
+            fill = np.nan if self.kind == 'number' else (-1 if self.kind == 'string' else None)
+            grown = np.full(capacity, fill, dtype=self.values.dtype)
+            grown[:len(self.values)] = self.values
+            self.values = grown
+        self.capacity = capacity
+
+    def _to_objects(self, n):
+        """Mixed types: fall back to a plain object column"""
+        old_kind, old = self.kind, self.values
+        self._allocate('object')
+        if old_kind == 'number':
+            numbers = old[:n]
+            self.values[:n] = [None if np.isnan(v) else (int(v) if self.all_int else float(v)) for v in numbers]
+        elif old_kind == 'string':
+            names = list(self.categories)
+            self.values[:n] = [None if c < 0 else names[c] for c in old[:n]]
+
+    def set(self, row, value):
+        if value is None:
+            return
+        is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+        kind = 'number' if is_number else ('string' if isinstance(value, str) else 'object')
+        if self.kind is None:
+            self._allocate(kind)
+        elif kind != self.kind and self.kind != 'object':
+            self._to_objects(row)
+        if self.kind == 'number':
+            self.values[row] = value
+            if not isinstance(value, int):
+                self.all_int = False
+        elif self.kind == 'string':
+            code = self.categories.get(value)
+            if code is None:
+                code = self.categories[value] = len(self.categories)
+            self.values[row] = code
+        else:
+            self.values[row] = value
+
+    def finish(self, n):
+        """The column as pandas would have built it from the raw values"""
+        if self.kind is None:
+            return np.full(n, None, dtype=object)
+        if self.kind == 'number':
+            values = self.values[:n]
+            return values.astype(np.int64) if self.all_int and not np.isnan(values).any() else values
+        if self.kind == 'string':
+            # Object column of shared str objects; compact_features makes categoricals
+            names = np.array(list(self.categories) + [None], dtype=object)
+            return names[self.values[:n]]
+        return self.values[:n]
+
+
+class _GeometryBuffer:
+    """Growable GeometryBatch arrays"""
+
+    def __init__(self, capacity):
+        self.vertices = np.empty((capacity * 8, 2))
+        self.part_offsets = np.zeros(capacity * 2 + 1, dtype=np.int64)
+        self.feature_parts = np.zeros(capacity + 1, dtype=np.int64)
+        self.kinds = np.zeros(capacity, dtype=np.uint8)
+        self.n_vertices = 0
+        self.n_parts = 0
+        self.n_features = 0
+
+    @staticmethod
+    def _grown(array, needed):
+        if needed <= len(array):
+            return array
+        grown = np.empty((max(needed, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def add(self, kind, parts):
+        n_new = sum(len(part) for part in parts)
+        self.vertices = self._grown(self.vertices, self.n_vertices + n_new)
+        self.part_offsets = self._grown(self.part_offsets, self.n_parts + len(parts) + 1)
+        self.feature_parts = self._grown(self.feature_parts, self.n_features + 2)
+        self.kinds = self._grown(self.kinds, self.n_features + 1)
+        for part in parts:
+            points = np.asarray(part, dtype=np.float64).reshape(len(part), -1)[:, :2]
+            self.vertices[self.n_vertices:self.n_vertices + len(points)] = points
+            self.n_vertices += len(points)
+            self.n_parts += 1
+            self.part_offsets[self.n_parts] = self.n_vertices
+        self.kinds[self.n_features] = kind
+        self.n_features += 1
+        self.feature_parts[self.n_features] = self.n_parts
+
+    def batch(self):
+        return GeometryBatch(
+            feature_index=np.arange(self.n_features),
+            kinds=self.kinds[:self.n_features].copy(),
+            vertices=self.vertices[:self.n_vertices].copy(),
+            part_offsets=self.part_offsets[:self.n_parts + 1].copy(),
+            feature_parts=self.feature_parts[:self.n_features + 1].copy(),
+        )
+
+
+class ParkingIngest:
+    """
+    Accumulates features into column buffers. `columns` limits the
+    attributes kept (None keeps all); with `keep_geometry` the full
+    GeometryBatch is kept, otherwise only a location per feature.
+    """
+
+    def __init__(self, columns=FEATURE_COLUMNS, keep_geometry=False, capacity=1024):
+        self._wanted = None if columns is None else set(columns)
+        self.columns = None if columns is None else list(columns)
+        self.keep_geometry = keep_geometry
+        self.capacity = capacity
+        self.n = 0
+        self.lat = np.full(capacity, np.nan)
+        self.lon = np.full(capacity, np.nan)
+        self.attributes = {}
+        self.seen_ids = set()
+        self.duplicates = 0
+        self.geometry = _GeometryBuffer(capacity)
+        self._reduced = 0  # features whose location has been computed
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * self.capacity)
+        for name in ('lat', 'lon'):
+            grown = np.full(capacity, np.nan)
+            grown[:self.n] = getattr(self, name)[:self.n]
+            setattr(self, name, grown)
+        for column in self.attributes.values():
+            column.grow(capacity)
+        self.capacity = capacity
+
+    def add(self, feature):
+        """Append one feature; returns False if it has no geometry or is a duplicate"""
+        shape = feature_parts(feature.get('geometry') or {})
+        if shape is None:
+            return False
+        attributes = feature.get('attributes') or {}
+        objectid = attributes.get('objectid')
+        if objectid is not None:
+            if objectid in self.seen_ids:
+                self.duplicates += 1
+                return False
+            self.seen_ids.add(objectid)
+
+        if self.n >= self.capacity:
+            self._grow(self.n + 1)
+        row = self.n
+        for name, value in attributes.items():
+            if self._wanted is not None and name not in self._wanted:
+                continue
+            column = self.attributes.get(name)
+            if column is None:
+                column = self.attributes[name] = _Column(self.capacity)
+            column.set(row, value)
+        self.geometry.add(*shape)
+        self.n += 1
+
+        if not self.keep_geometry and self.geometry.n_features >= REDUCE_BLOCK:
+            self._reduce()
+        return True
+
+    def _reduce(self):
+        """Locate the buffered features and, unless geometry is kept, drop their vertices"""
+        if self.geometry.n_features == self._reduced and not self.keep_geometry:
+            return
+        batch = self.geometry.batch()
+        lon, lat = feature_locations(batch)
+        if self.keep_geometry:
+            self.lat[:self.n], self.lon[:self.n] = lat, lon
+            return
+        self.lat[self._reduced:self.n], self.lon[self._reduced:self.n] = lat, lon
+        self._reduced = self.n
+        self.geometry = _GeometryBuffer(min(self.capacity, REDUCE_BLOCK))
+
+    def add_file(self, path, chunk_chars=CHUNK_CHARS):
+        """Stream every feature of one export in; returns the file's top-level metadata"""
+        stream = FeatureStream(path, chunk_chars)
+        estimate = self.n + os.path.getsize(path) // BYTES_PER_FEATURE
+        if estimate > self.capacity:
+            self._grow(estimate)
+        for feature in stream:
+            self.add(feature)
+        return stream.meta
+
+    def result(self, coordinate_dtype=np.float32):
+        """(compact DataFrame, GeometryBatch or None)"""
+        self._reduce()
+        frame = {'lat': self.lat[:self.n], 'lon': self.lon[:self.n]}
+        frame.update((name, column.finish(self.n)) for name, column in self.attributes.items())
+        df = pd.DataFrame(frame)
+        df = compact_features(df, list(self.attributes) if self.columns is None else self.columns,
+                              coordinate_dtype=coordinate_dtype)
+        return df, (self.geometry.batch() if self.keep_geometry else None)
+
+
+def stream_parking_data(paths, columns=FEATURE_COLUMNS, keep_geometry=False, coordinate_dtype=np.float32):
+    """
+    Load one or more ArcGIS JSON exports with bounded memory.
+    Returns (compact DataFrame, GeometryBatch or None); rows are in file
+    order, with later duplicates of an objectid dropped.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    ingest = ParkingIngest(columns, keep_geometry)
+    for path in paths:
+        ingest.add_file(path)
+    return ingest.result(coordinate_dtype)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream one or more ArcGIS exports into a parking DataFrame")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--all-columns', action='store_true', help="Keep every attribute, not just the app's")
+    args = parser.parse_args(argv)
+
+    ingest = ParkingIngest(None if args.all_columns else FEATURE_COLUMNS)
+    for path in args.paths:
+        ingest.add_file(path)
+    df, _ = ingest.result()
+    print(f"✓ {len(df)} features from {len(args.paths)} file(s), {ingest.duplicates} duplicates dropped, "
+          f"{df.memory_usage(deep=True).sum() / 1e6:.2f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
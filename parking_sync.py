@@ -0,0 +1,294 @@
+"""
+Incremental refresh of parking_data.json from the Gateparkering layer
+
+Instead of downloading the whole layer again, a sync asks the ArcGIS REST
+service only for features edited since the last sync (`last_edited_date`),
+fetched page by page with `resultOffset`, plus the list of object ids still
+in the layer to detect deletions. Changes are merged into the local file by
+`globalid`, and a running process can patch its DataFrame, coordinate
+arrays and spatial index in place with `patch_parking_state`.
+
+Usage:
+    python parking_sync.py [--data parking_data.json] [--url <layer url>] [--page-size 1000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import requests
+
+from parking_core import features_to_dataframe
+from parking_store import DEFAULT_STORE, compile_parking_data
+
+PAGE_SIZE = 1000
+TIMEOUT_S = 30
+
+# Edits can be committed with a timestamp slightly before our last sync;
+# re-asking for a small overlap is cheap since unchanged features are skipped
+OVERLAP_MS = 10 * 60 * 1000
+
+SyncChanges = namedtuple('SyncChanges', [
+    'added',    # features new to the local copy
+    'updated',  # features whose last_edited_date changed
+    'removed',  # globalids no longer in the layer
+])
+
+
+class SyncError(RuntimeError):
+    """The ArcGIS service returned an error or an unusable response"""
+
+
+def arcgis_timestamp(ms):
+    """SQL timestamp literal (UTC, whole seconds) for an epoch-milliseconds value"""
+    when = datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+    return f"TIMESTAMP '{when:%Y-%m-%d %H:%M:%S}'"
+
+
+def query_layer(url, params, session=None):
+    """One `/query` request against a MapServer/FeatureServer layer"""
+    http = session or requests
+    response = http.get(f"{url.rstrip('/')}/query", params={'f': 'json', **params}, timeout=TIMEOUT_S)
+    response.raise_for_status()
+    payload = response.json()
+    if 'error' in payload:
+        error = payload['error']
+        raise SyncError(f"{error.get('code')}: {error.get('message')}")
+    return payload
+
+
+def fetch_features(url, where, page_size=PAGE_SIZE, session=None):
+    """All features matching `where`, fetched in pages of `resultOffset`/`resultRecordCount`"""
+    features = []
+    offset = 0
+    while True:
+        page = query_layer(url, {
+            'where': where,
+            'outFields': '*',
+            'outSR': 4326,
+            'returnGeometry': 'true',
+            'orderByFields': 'objectid',
+            'resultOffset': offset,
+            'resultRecordCount': page_size,
+        }, session)
+        batch = page.get('features', [])
+        features.extend(batch)
+        offset += len(batch)
+        # The server may cap pages below page_size (maxRecordCount)
+        if not batch or not (page.get('exceededTransferLimit') or len(batch) == page_size):
+            return features
+
+
+def fetch_object_ids(url, where, session=None):
+    """Object ids of every feature currently matching `where`"""
+    payload = query_layer(url, {'where': where, 'returnIdsOnly': 'true'}, session)
+    if 'objectIds' not in payload:
+        raise SyncError("returnIdsOnly response has no 'objectIds'")
+    return set(payload['objectIds'] or [])
+
+
+def _edited_ms(feature):
+    attrs = feature.get('attributes', {})
+    return attrs.get('last_edited_date') or attrs.get('created_date') or 0
+
+
+def last_sync_ms(data):
+    """Newest edit time already in the local copy"""
+    if data.get('last_edited_max'):
+        return data['last_edited_max']
+    return max((_edited_ms(f) for f in data.get('features', [])), default=0)
+
+
+def merge_features(features, edited, live_ids=None):
+    """
+    Merge edited features into `features` by globalid.
+    Updated features keep their position, new ones are appended, and when
+    `live_ids` is given, features whose objectid is not in it are dropped.
+    Returns (merged features, SyncChanges).
+    """
+    positions = {f['attributes'].get('globalid'): i for i, f in enumerate(features)}
+    merged = list(features)
+    added, updated = [], []
+
+    for feature in edited:
+        key = feature.get('attributes', {}).get('globalid')
+        i = positions.get(key)
+        if i is None:
+            positions[key] = len(merged)
+            merged.append(feature)
+            added.append(feature)
+        elif _edited_ms(merged[i]) != _edited_ms(feature) or merged[i].get('geometry') != feature.get('geometry'):
+            merged[i] = feature
+            updated.append(feature)
+
+    removed = []
+    if live_ids is not None:
+        kept = []
+        for feature in merged:
+            if feature['attributes'].get('objectid') in live_ids:
+                kept.append(feature)
+            else:
+                removed.append(feature['attributes'].get('globalid'))
+        merged = kept
+
+    return merged, SyncChanges(added, updated, removed)
+
+
+def write_json_atomic(path, data):
+    """Write JSON next to `path` and rename it into place, so readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def sync_parking_data(data_path='parking_data.json', url=None, where=None, page_size=PAGE_SIZE,
+                      store_path=DEFAULT_STORE, session=None):
+    """
+    Fetch edits since the last sync and merge them into `data_path`.
+    The compiled store is rebuilt when one exists. Returns SyncChanges.
+    """
+    with open(data_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    url = url or data['url']
+    where = where or data.get('filter') or '1=1'
+
+    since = last_sync_ms(data)
+    edited_where = f"({where}) AND last_edited_date >= {arcgis_timestamp(max(since - OVERLAP_MS, 0))}"
+    edited = fetch_features(url, edited_where, page_size, session)
+    live_ids = fetch_object_ids(url, where, session)
+
+    features, changes = merge_features(data.get('features', []), edited, live_ids)
+    data['features'] = features
+    data['last_edited_max'] = max([since] + [_edited_ms(f) for f in edited])
+    data['synced_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    if any(changes):
+        write_json_atomic(data_path, data)
+        if store_path and os.path.exists(store_path):
+            compile_parking_data(data_path, store_path)
+    return changes
+
+
+def patch_parking_state(df, coords, index, changes):
+    """
+    Apply SyncChanges to loaded data without rebuilding it.
+    Updated rows are overwritten in place, removed rows become tombstones
+    (NaN location, dropped from the index) and added rows are appended.
+    `index` is patched in place; returns the (DataFrame, coords) to use.
+    """
+    positions = pd.Series(np.arange(len(df)), index=df['globalid'].to_numpy())
+    positions = positions[~positions.index.duplicated()]
+
+    removed = positions.reindex(changes.removed).dropna().to_numpy(dtype=np.intp)
+    if len(removed):
+        _make_writable(df, ['lat', 'lon'])
+        df.iloc[removed, [df.columns.get_loc('lat'), df.columns.get_loc('lon')]] = np.nan
+        for name in ('lat_rad', 'lon_rad', 'cos_lat'):
+            coords[name][removed] = np.nan
+        index.remove(removed)
+
+    rows = features_to_dataframe(changes.updated + changes.added)
+    rows = rows.reindex(columns=df.columns)
+    target = positions.reindex(rows['globalid']).to_numpy()
+    existing = ~np.isnan(target)
+
+    if existing.any():
+        at = target[existing].astype(np.intp)
+        _make_writable(df, df.columns)
+        for name in df.columns:
+            _assign(df, name, at, rows[name].to_numpy()[existing])
+        _set_coordinates(coords, at, rows['lat'].to_numpy()[existing], rows['lon'].to_numpy()[existing])
+        index.upsert(at, rows['lat'].to_numpy()[existing], rows['lon'].to_numpy()[existing])
+
+    if (~existing).any():
+        appended = rows[~existing]
+        at = np.arange(len(df), len(df) + len(appended))
+        dtypes = df.dtypes
+        df = df.reset_index(drop=True).reindex(np.arange(len(df) + len(appended)))
+        for name in df.columns:
+            _assign(df, name, at, appended[name].to_numpy())
+            # Growing the frame pads with NaN; keep int columns int when nothing is missing
+            if dtypes[name].kind in 'iu' and df[name].notna().all():
+                df[name] = df[name].astype(dtypes[name])
+        lat = appended['lat'].to_numpy(dtype=np.float64)
+        lon = appended['lon'].to_numpy(dtype=np.float64)
+        lat_rad, lon_rad = np.radians(lat), np.radians(lon)
+        coords = {
+            'lat_rad': np.concatenate([coords['lat_rad'], lat_rad]),
+            'lon_rad': np.concatenate([coords['lon_rad'], lon_rad]),
+            'cos_lat': np.concatenate([coords['cos_lat'], np.cos(lat_rad)]),
+        }
+        index.upsert(at, lat, lon)
+
+    return df, coords
+
+
+def _make_writable(df, columns):
+    """Copy columns that are read-only views (e.g. memory-mapped from the store) before patching"""
+    for name in columns:
+        column = df[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            data = column.array.codes
+        else:
+            data = column.to_numpy()
+        if not data.flags.writeable:
+            df[name] = column.copy()
+
+
+def _assign(df, name, positions, values):
+    """Overwrite rows of one column, widening its dtype only when the new values need it"""
+    column = df[name]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        new = pd.Index(values).dropna().difference(column.cat.categories)
+        if len(new):
+            df[name] = column.cat.add_categories(new)
+    elif column.dtype.kind in 'iuf':
+        values = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+        if column.dtype.kind != 'f' and not np.array_equal(values, np.round(values)):
+            # Nullable ints load as float64/NaN, the same as a fresh load would
+            df[name] = column.astype(np.float64)
+        else:
+            values = values.astype(column.dtype)
+    df.iloc[positions, df.columns.get_loc(name)] = values
+
+
+def _set_coordinates(coords, positions, lat, lon):
+    lat_rad = np.radians(np.asarray(lat, dtype=np.float64))
+    coords['lat_rad'][positions] = lat_rad
+    coords['lon_rad'][positions] = np.radians(np.asarray(lon, dtype=np.float64))
+    coords['cos_lat'][positions] = np.cos(lat_rad)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch parking features edited since the last sync")
+    parser.add_argument('--data', default='parking_data.json')
+    parser.add_argument('--url', help="Layer URL (default: the 'url' stored in the data file)")
+    parser.add_argument('--where', help="Layer filter (default: the 'filter' stored in the data file)")
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    parser.add_argument('--store', default=DEFAULT_STORE)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        changes = sync_parking_data(args.data, args.url, args.where, args.page_size, args.store)
+    except (requests.RequestException, SyncError) as e:
+        print(f"❌ Sync failed: {e}", file=sys.stderr)
+        return 1
+    print(f"✓ {len(changes.added)} added, {len(changes.updated)} updated, {len(changes.removed)} removed "
+          f"in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
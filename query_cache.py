@@ -0,0 +1,184 @@
+"""
+Shared cache of ranked parking results for repeated nearby lookups
+
+Queries are keyed by the geohash cell of the position plus everything else
+that affects the ranking. On a miss the whole dataset is scored once from
+the cell centre, and every feature that could be in the top n for *any*
+position inside the cell is kept: with score = w * distance + g(feature)
+and r the largest centre-to-corner distance of the cell, a feature can
+only rank in the top n somewhere in the cell if its centre score is within
+2 * w * r of the n-th best centre score. Hits re-rank just those candidates
+for the exact position, so results are identical to `rank_parking` priced
+at the time the entry was built (candidates and hits use the same start).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from parking_core import rank_parking, score_parking
+from spatial_index import haversine_many
+from tariff_engine import oslo_now
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Precision 7 cells are about 150 m x 76 m at Oslo's latitude
+GEOHASH_PRECISION = 7
+
+MAX_ENTRIES = 4096
+# Prices depend on the time of day, so candidate sets expire
+TTL_S = 60.0
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Standard base32 geohash of a point"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            bit = lon >= mid
+            lon_range[0 if bit else 1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            bit = lat >= mid
+            lat_range[0 if bit else 1] = mid
+        value = (value << 1) | bit
+        bits += 1
+        even = not even
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def geohash_bounds(geohash):
+    """(min_lat, min_lon, max_lat, max_lon) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lon_range if even else lat_range
+            target[1 - bit] = (target[0] + target[1]) / 2
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def cell_centre_and_radius(geohash):
+    """Centre of a geohash cell and the largest distance (m) from it to the cell's corners"""
+    min_lat, min_lon, max_lat, max_lon = geohash_bounds(geohash)
+    lat, lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+    corners = haversine_many(lat, lon, np.array([min_lat, min_lat, max_lat, max_lat]),
+                             np.array([min_lon, max_lon, min_lon, max_lon]))
+    # Small margin for floating point
+    return lat, lon, float(corners.max()) * 1.0001 + 0.01
+
+
+def candidate_rows(lat, lon, radius, df, n, coords=None, filters=(), weights=None,
+                   tariff_table=None, stay_minutes=60, fuel='bensin', start=None):
+    """
+    Rows (and their coordinates) that can rank in the top n for any position
+    within `radius` meters of (lat, lon). Filters are applied here, so the
+    candidates only need re-ranking.
+    """
+    weights = weights or {'distance': 1.0}
+    score, _, _ = score_parking(lat, lon, df, coords, filters, weights, tariff_table, stay_minutes, fuel, start)
+
+    finite = np.isfinite(score)
+    if finite.sum() >= n:
+        threshold = np.partition(score[finite], n - 1)[n - 1] + 2 * weights.get('distance', 1.0) * radius
+        positions = np.flatnonzero(finite & (score <= threshold))
+    else:
+        # Rows scoring inf (no known price) only matter when there are too few others
+        positions = np.flatnonzero(~np.isnan(score))
+
+    if coords is None:
+        candidate_coords = None
+    else:
+        candidate_coords = {name: array[positions] for name, array in coords.items()}
+    return df.iloc[positions], candidate_coords
+
+
+class QueryCache:
+    """
+    Thread-safe LRU + TTL cache of candidate sets, shared by all sessions.
+
+    `filter_key` must identify the `filters` (they are functions, so they
+    can't be hashed by value), and `version` the data the DataFrame came from.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl_s=TTL_S, precision=GEOHASH_PRECISION):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'entries': len(self._entries),
+            'evictions': self.evictions,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def rank(self, user_lat, user_lon, df, n=10, coords=None, filters=(), filter_key=(), weights=None,
+             tariff_table=None, stay_minutes=60, fuel='bensin', start=None, version=None):
+        """
+        Same result as `rank_parking(...)`, served from the cache when
+        possible. Without `start`, prices are for the time the entry was
+        built (at most `ttl_s` ago), which is also used for selecting the
+        candidates, so the candidate bound holds.
+        """
+        weights = weights or {'distance': 1.0}
+        geohash = geohash_encode(user_lat, user_lon, self.precision)
+        key = (version, id(df), geohash, n, filter_key, tuple(sorted(weights.items())),
+               stay_minutes, fuel, tariff_table is not None, start)
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+
+        if entry is None:
+            lat, lon, radius = cell_centre_and_radius(geohash)
+            # Prices depend on the start time: candidates and every re-rank use the same one
+            priced_at = start or oslo_now()
+            entry = (now + self.ttl_s, priced_at) + candidate_rows(
+                lat, lon, radius, df, n, coords, filters, weights, tariff_table, stay_minutes, fuel, priced_at)
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+
+        _, priced_at, candidates, candidate_coords = entry
+        return rank_parking(user_lat, user_lon, candidates, n, coords=candidate_coords, weights=weights,
+                            tariff_table=tariff_table, stay_minutes=stay_minutes, fuel=fuel, start=priced_at)
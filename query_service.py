@@ -0,0 +1,348 @@
+"""
+JSON HTTP query service for parking lookups
+
+A small Tornado service that loads the parking data, spatial index and
+tariff engine once and answers queries from many concurrent clients,
+using the same functions as the Streamlit app:
+
+    GET /nearest?lat=59.92&lon=10.76&n=10       nearest parking
+        [&rank=nearest|cheapest|balanced]      scoring (see RANKINGS)
+        [&min_capacity=3&overnight=1&free=1]   filters (free = no charge right now)
+        [&stay=120&fuel=bensin|elbil]          cost of the planned stay
+        [&group=street]                        one result per street segment
+    GET /street/{strekningsid}[?lat=&lon=]     every spot of one street segment
+    GET /route?path=lat,lon;lat,lon;...        parking along a route, in order
+        [&width=100] (+ filters)               (or POST {"points": [[lat, lon], ...]})
+    GET /tariff/{takstgruppe}                  tariff group details
+    GET /health                                dataset summary
+
+With --sync-interval the service periodically pulls edits from the
+ArcGIS layer (see parking_sync.py) and patches its data in place.
+
+Usage:
+    python query_service.py [--port 8765] [--data parking_data.json] [--sync-interval 600]
+"""
+import argparse
+import json
+import math
+import time
+import traceback
+
+import numpy as np
+import tornado.ioloop
+import tornado.web
+
+from availability import AvailabilityModel, free_now, legal_overnight, overnight_start, week_slot
+from parking_core import (
+    FEATURE_COLUMNS,
+    capacity_at_least,
+    integer_columns,
+    load_tariff_data,
+    parking_along_route,
+    parse_route,
+    prepare_coordinates,
+)
+from parking_store import DEFAULT_STORE, load_parking_store, store_is_current
+from parking_stream import stream_parking_data
+from parking_sync import patch_parking_state, sync_parking_data
+from query_cache import QueryCache
+from spatial_index import ParkingIndex
+from street_segments import build_segments, rank_segments, segment_members, segment_position
+from tariff_engine import TariffTable, oslo_now
+
+RANKINGS = {
+    'nearest': {'distance': 1.0},
+    'cheapest': {'distance': 0.1, 'cost': 10.0},
+    'balanced': {'distance': 1.0, 'cost': 5.0, 'capacity': 10.0},
+}
+
+# Columns returned for each result
+RESULT_FIELDS = ['objectid', 'globalid', 'lat', 'lon', 'distance', 'cost',
+                 'beregnet_antall', 'takstgruppe1', 'beboerparkeringssone',
+                 'strekningsid', 'segment_spaces', 'segment_spots', 'segment_takstgruppe', 'chainage']
+
+MAX_RESULTS = 100
+MAX_ROUTE_POINTS = 5000
+MAX_ROUTE_WIDTH_M = 1000
+MAX_STAY_MINUTES = 7 * 24 * 60
+
+
+class ServiceState:
+    """Everything loaded once at startup and shared by all requests"""
+
+    def __init__(self, data_path='parking_data.json', store_path=DEFAULT_STORE,
+                 tariff_path='takstgruppe_lookup.json'):
+        columns = FEATURE_COLUMNS + ['globalid']
+        if store_path and store_is_current(store_path, data_path):
+            self.parking_df = load_parking_store(store_path, columns=columns)
+        else:
+            # Full-precision coordinates, since they are returned to clients
+            self.parking_df, _ = stream_parking_data(data_path, columns, coordinate_dtype=np.float64)
+
+        self.coords = prepare_coordinates(self.parking_df)
+        self.index = ParkingIndex.from_dataframe(self.parking_df)
+        self.tariff_data = load_tariff_data(tariff_path)
+        self.tariff_table = TariffTable(self.tariff_data) if self.tariff_data else None
+        self.last_sync = None
+        self.version = 1
+        self.query_cache = QueryCache()
+        self.segments = build_segments(self.parking_df)
+        self.availability = AvailabilityModel(self.parking_df, self.tariff_table)
+
+    def apply_changes(self, changes):
+        """Patch the loaded data with SyncChanges; call from the IOLoop thread"""
+        self.parking_df, self.coords = patch_parking_state(self.parking_df, self.coords, self.index, changes)
+        self.version += 1
+        self.query_cache.clear()
+        self.segments = build_segments(self.parking_df)
+        self.availability = AvailabilityModel(self.parking_df, self.tariff_table)
+
+
+def _json_value(value):
+    if value is None:
+        return None
+    if isinstance(value, (np.integer, np.floating)):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def records(df):
+    """Result rows as JSON-ready dicts"""
+    fields = [f for f in RESULT_FIELDS if f in df]
+    df = integer_columns(df[fields])
+    return [
+        {field: _json_value(value) for field, value in zip(fields, row)}
+        for row in zip(*(df[field].to_numpy(dtype=object, na_value=None) for field in fields))
+    ]
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, state):
+        self.state = state
+
+    def write_json(self, payload, status=200):
+        self.set_status(status)
+        self.set_header('Content-Type', 'application/json; charset=utf-8')
+        self.finish(json.dumps(payload, ensure_ascii=False))
+
+    def write_error(self, status_code, **kwargs):
+        self.write_json({'error': self._reason}, status=status_code)
+
+    def get_float(self, name, default=None, minimum=None, maximum=None):
+        """A finite number parameter, within [minimum, maximum] when given"""
+        value = self.get_argument(name, None)
+        if value is None:
+            if default is None:
+                raise tornado.web.HTTPError(400, reason=f"missing parameter '{name}'")
+            return default
+        try:
+            number = float(value)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason=f"'{name}' must be a number") from None
+        if not math.isfinite(number):
+            raise tornado.web.HTTPError(400, reason=f"'{name}' must be a finite number")
+        if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+            raise tornado.web.HTTPError(400, reason=f"'{name}' must be between {minimum} and {maximum}")
+        return number
+
+    def get_position(self, default_lat=None, default_lon=None):
+        """(lat, lon) from the 'lat' / 'lon' parameters, in degrees"""
+        return (self.get_float('lat', default_lat, minimum=-90, maximum=90),
+                self.get_float('lon', default_lon, minimum=-180, maximum=180))
+
+    def get_stay(self):
+        """Planned stay in minutes (default one hour), at most a week"""
+        return int(self.get_float('stay', 60, minimum=0, maximum=MAX_STAY_MINUTES))
+
+    def get_filters(self):
+        """(filter predicates, cache key for them) from min_capacity / overnight / free"""
+        filters = []
+        min_capacity = self.get_float('min_capacity', 0)
+        if min_capacity:
+            filters.append(capacity_at_least(min_capacity))
+        overnight = self.get_argument('overnight', '0') in ('1', 'true')
+        if overnight:
+            filters.append(legal_overnight(self.state.availability))
+        free = self.get_argument('free', '0') in ('1', 'true')
+        if free:
+            filters.append(free_now(self.state.availability))
+        return filters, (min_capacity, overnight and overnight_start(), free and week_slot(oslo_now()))
+
+
+class NearestHandler(BaseHandler):
+    def get(self):
+        lat, lon = self.get_position()
+        n = int(min(max(self.get_float('n', 10), 1), MAX_RESULTS))
+        ranking = self.get_argument('rank', 'nearest')
+        if ranking not in RANKINGS:
+            raise tornado.web.HTTPError(400, reason=f"'rank' must be one of {', '.join(RANKINGS)}")
+        fuel = self.get_argument('fuel', 'bensin')
+        if fuel not in ('bensin', 'elbil'):
+            raise tornado.web.HTTPError(400, reason="'fuel' must be bensin or elbil")
+        stay = self.get_stay()
+
+        filters, filter_key = self.get_filters()
+
+        state = self.state
+        by_street = self.get_argument('group', None) == 'street'
+        if by_street:
+            result = rank_segments(lat, lon, state.parking_df, state.segments, n, coords=state.coords,
+                                   filters=filters, weights=RANKINGS[ranking], tariff_table=state.tariff_table,
+                                   stay_minutes=stay, fuel=fuel)
+        elif ranking == 'nearest' and not filters:
+            # Plain distance queries only touch nearby grid cells
+            positions, distances = state.index.knn(lat, lon, n)
+            result = state.parking_df.iloc[positions].copy()
+            result['distance'] = distances
+            if state.tariff_table is not None and 'takstgruppe1' in result:
+                result['cost'] = state.tariff_table.price_for(result['takstgruppe1'].to_numpy(), stay, fuel=fuel)
+        else:
+            result = state.query_cache.rank(lat, lon, state.parking_df, n, coords=state.coords, filters=filters,
+                                            filter_key=filter_key,
+                                            weights=RANKINGS[ranking], tariff_table=state.tariff_table,
+                                            stay_minutes=stay, fuel=fuel, version=state.version)
+
+        self.write_json({'lat': lat, 'lon': lon, 'rank': ranking, 'results': records(result)})
+
+
+class RouteHandler(BaseHandler):
+    """Parking along a polyline, in order along it"""
+
+    def get(self):
+        try:
+            lats, lons = parse_route(self.get_argument('path', ''))
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, reason=f"'path': {e}") from None
+        self.answer(lats, lons)
+
+    def post(self):
+        try:
+            points = np.asarray(json.loads(self.request.body)['points'], dtype=np.float64)
+        except (ValueError, KeyError, TypeError):
+            points = None
+        if points is None or points.ndim != 2 or points.shape[1] != 2:
+            raise tornado.web.HTTPError(400, reason="body must be {\"points\": [[lat, lon], ...]}")
+        self.answer(points[:, 0], points[:, 1])
+
+    def answer(self, lats, lons):
+        if not len(lats):
+            raise tornado.web.HTTPError(400, reason="route has no points")
+        if len(lats) > MAX_ROUTE_POINTS:
+            raise tornado.web.HTTPError(400, reason=f"route has more than {MAX_ROUTE_POINTS} points")
+        if not (np.all(np.abs(lats) <= 90) and np.all(np.abs(lons) <= 180)):
+            raise tornado.web.HTTPError(400, reason="route points must be finite lat, lon in degrees")
+        width = self.get_float('width', 100, minimum=1, maximum=MAX_ROUTE_WIDTH_M)
+        stay = self.get_stay()
+        fuel = self.get_argument('fuel', 'bensin')
+        if fuel not in ('bensin', 'elbil'):
+            raise tornado.web.HTTPError(400, reason="'fuel' must be bensin or elbil")
+        filters, _ = self.get_filters()
+        state = self.state
+        result = parking_along_route(lats, lons, state.parking_df, state.index, width, filters)
+        if state.tariff_table is not None and 'takstgruppe1' in result:
+            result['cost'] = state.tariff_table.price_for(result['takstgruppe1'].to_numpy(), stay, fuel=fuel)
+        self.write_json({'points': len(lats), 'width': width, 'results': records(result.head(MAX_RESULTS))})
+
+
+class StreetHandler(BaseHandler):
+    """Drill-down: every spot of one street segment, nearest first when lat/lon are given"""
+
+    def get(self, strekningsid):
+        state = self.state
+        try:
+            segment = segment_position(state.segments, strekningsid)
+        except ValueError:
+            segment = -1
+        if segment < 0:
+            raise tornado.web.HTTPError(404, reason=f"unknown strekningsid '{strekningsid}'")
+        table = state.segments.table
+        lat, lon = self.get_position(table['lat'].iat[segment], table['lon'].iat[segment])
+        members = segment_members(lat, lon, state.parking_df, state.segments, segment, coords=state.coords)
+        self.write_json({
+            'strekningsid': _json_value(table['strekningsid'].iat[segment]),
+            'spaces': _json_value(table['beregnet_antall'].iat[segment]),
+            'spots': _json_value(table['n_spots'].iat[segment]),
+            'takstgruppe1': _json_value(table['takstgruppe1'].iat[segment]) if 'takstgruppe1' in table else None,
+            'results': records(members),
+        })
+
+
+class TariffHandler(BaseHandler):
+    def get(self, group):
+        table = self.state.tariff_table
+        index = table.lookup([group])[0] if table is not None else -1
+        if index < 0:
+            raise tornado.web.HTTPError(404, reason=f"unknown takstgruppe '{group}'")
+        self.write_json({
+            'takstgruppe': table.groups[index],
+            **table.info[index],
+            'max_minutes': _json_value(table.max_minutes[index]),
+            'paid_windows': table.windows[index],
+        })
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        state = self.state
+        self.write_json({
+            'features': int(state.index.valid.sum()),
+            'last_sync': state.last_sync,
+            'query_cache': state.query_cache.stats(),
+            'tariff_groups': len(state.tariff_table) if state.tariff_table is not None else 0,
+        })
+
+
+def make_app(state):
+    return tornado.web.Application([
+        (r'/nearest', NearestHandler, {'state': state}),
+        (r'/route', RouteHandler, {'state': state}),
+        (r'/street/([^/]+)', StreetHandler, {'state': state}),
+        (r'/tariff/([^/]+)', TariffHandler, {'state': state}),
+        (r'/health', HealthHandler, {'state': state}),
+    ])
+
+
+async def sync_once(state, data_path, store_path, url=None):
+    """Fetch edits on a worker thread, then patch state between requests"""
+    loop = tornado.ioloop.IOLoop.current()
+    try:
+        changes = await loop.run_in_executor(None, lambda: sync_parking_data(data_path, url, store_path=store_path))
+    except Exception:
+        traceback.print_exc()
+        return
+    if any(changes):
+        state.apply_changes(changes)
+    state.last_sync = {
+        'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'added': len(changes.added),
+        'updated': len(changes.updated),
+        'removed': len(changes.removed),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parking query service")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--address', default='127.0.0.1')
+    parser.add_argument('--data', default='parking_data.json')
+    parser.add_argument('--store', default=DEFAULT_STORE)
+    parser.add_argument('--tariffs', default='takstgruppe_lookup.json')
+    parser.add_argument('--sync-interval', type=float, default=0,
+                        help="Seconds between incremental syncs from the ArcGIS layer (0: off)")
+    parser.add_argument('--sync-url', help="Layer URL (default: the 'url' stored in the data file)")
+    args = parser.parse_args(argv)
+
+    state = ServiceState(args.data, args.store, args.tariffs)
+    make_app(state).listen(args.port, address=args.address)
+    if args.sync_interval > 0:
+        tornado.ioloop.PeriodicCallback(
+            lambda: sync_once(state, args.data, args.store, args.sync_url), args.sync_interval * 1000
+        ).start()
+    print(f"✓ Serving {len(state.parking_df)} parking locations on http://{args.address}:{args.port}")
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == '__main__':
+    main()
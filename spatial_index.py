@@ -0,0 +1,387 @@
+"""
+Spatial index for parking features
+
+Points are projected with a Lambert azimuthal equal-area projection centred
+on Oslo and bucketed into a uniform square grid. Queries only touch the grid
+cells that can contain an answer, so latency depends on local density rather
+than on the total number of features.
+"""
+from math import radians, sin, cos, sqrt
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+
+# Projection centre (Oslo sentrum)
+OSLO_LAT = 59.9139
+OSLO_LON = 10.7522
+
+# Aim for this many features per grid cell when the cell size is automatic
+TARGET_PER_CELL = 8
+
+
+def project(lat, lon, lat0=OSLO_LAT, lon0=OSLO_LON):
+    """
+    Spherical Lambert azimuthal equal-area projection.
+    Returns (x, y) in meters relative to (lat0, lon0); accepts scalars or arrays.
+    """
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    phi0 = radians(lat0)
+    lam0 = radians(lon0)
+
+    cos_lat = np.cos(lat)
+    dlon = lon - lam0
+    cos_dlon = np.cos(dlon)
+    denom = 1 + sin(phi0) * np.sin(lat) + cos(phi0) * cos_lat * cos_dlon
+    k = np.sqrt(2 / denom)
+    x = EARTH_RADIUS_M * k * cos_lat * np.sin(dlon)
+    y = EARTH_RADIUS_M * k * (cos(phi0) * np.sin(lat) - sin(phi0) * cos_lat * cos_dlon)
+    return x, y
+
+
+def haversine_many(lat, lon, lats, lons):
+    """Haversine distance in meters from one point to arrays of points"""
+    lat1 = radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlon = np.radians(lons) - radians(lon)
+    a = np.sin(dlat / 2) ** 2 + cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def haversine_pairs(lat1, lon1, lat2, lon2):
+    """Element-wise haversine distance in meters between two arrays of points"""
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def haversine_edges(coords, sources, targets):
+    """Length in meters of each (source, target) edge between rows of a (lat, lon) array"""
+    return haversine_pairs(coords[sources, 0], coords[sources, 1], coords[targets, 0], coords[targets, 1])
+
+
+class ParkingIndex:
+    """
+    Uniform grid over projected coordinates.
+
+    Positions returned by queries are row positions into the arrays (or
+    DataFrame) the index was built from. Distances are haversine meters so
+    they agree with `find_nearest_parking`.
+    """
+
+    def __init__(self, lats, lons, cell_size=None):
+        self.lats = np.ascontiguousarray(lats, dtype=np.float64)
+        self.lons = np.ascontiguousarray(lons, dtype=np.float64)
+        self.x, self.y = project(self.lats, self.lons)
+        self.valid = np.ones(len(self.lats), dtype=bool)
+
+        if cell_size is None:
+            cell_size = self._auto_cell_size()
+        self.cell_size = float(cell_size)
+        self._build_cells()
+
+    @classmethod
+    def from_dataframe(cls, df, cell_size=None):
+        """Build from `load_parking_data` output (needs 'lat' and 'lon')"""
+        return cls(df['lat'].to_numpy(), df['lon'].to_numpy(), cell_size=cell_size)
+
+    def __len__(self):
+        return int(self.valid.sum())
+
+    def _auto_cell_size(self):
+        if len(self.x) < 2:
+            return 100.0
+        area = max(np.ptp(self.x), 1.0) * max(np.ptp(self.y), 1.0)
+        return max(sqrt(area * TARGET_PER_CELL / len(self.x)), 1.0)
+
+    def _cell_of(self, x, y):
+        return int(np.floor(x / self.cell_size)), int(np.floor(y / self.cell_size))
+
+    def _build_cells(self):
+        cx = np.floor(self.x / self.cell_size).astype(np.int64)
+        cy = np.floor(self.y / self.cell_size).astype(np.int64)
+        self.cells = {}
+        if len(cx) == 0:
+            self.cell_bounds = (0, 0, 0, 0)
+            return
+
+        # Group positions by cell with one sort instead of per-point appends
+        order = np.lexsort((cy, cx))
+        keys = np.stack([cx[order], cy[order]], axis=1)
+        starts = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+        for group in np.split(order, starts):
+            first = group[0]
+            self.cells[(int(cx[first]), int(cy[first]))] = group
+        self.cell_bounds = (int(cx.min()), int(cy.min()), int(cx.max()), int(cy.max()))
+
+    def upsert(self, positions, lats, lons):
+        """
+        Insert or move features in place, without rebuilding the grid.
+        Positions past the current end extend the index.
+        """
+        positions = np.asarray(positions, dtype=np.intp)
+        if not len(positions):
+            return
+        size = int(positions.max()) + 1
+        if size > len(self.lats):
+            grow = size - len(self.lats)
+            self.lats = np.concatenate([self.lats, np.full(grow, np.nan)])
+            self.lons = np.concatenate([self.lons, np.full(grow, np.nan)])
+            self.x = np.concatenate([self.x, np.full(grow, np.nan)])
+            self.y = np.concatenate([self.y, np.full(grow, np.nan)])
+            self.valid = np.concatenate([self.valid, np.zeros(grow, dtype=bool)])
+
+        # Arrays may be read-only views of a memory-mapped store
+        for name in ('lats', 'lons', 'x', 'y', 'valid'):
+            if not getattr(self, name).flags.writeable:
+                setattr(self, name, getattr(self, name).copy())
+
+        self._detach(positions[self.valid[positions]])
+        xs, ys = project(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+        self.lats[positions] = lats
+        self.lons[positions] = lons
+        self.x[positions] = xs
+        self.y[positions] = ys
+        self.valid[positions] = True
+
+        min_cx, min_cy, max_cx, max_cy = self.cell_bounds if self.cells else (None,) * 4
+        for position, x, y in zip(positions, xs, ys):
+            cell = self._cell_of(x, y)
+            members = self.cells.get(cell)
+            self.cells[cell] = np.append(members, position) if members is not None else np.array([position])
+            if min_cx is None:
+                min_cx, max_cx, min_cy, max_cy = cell[0], cell[0], cell[1], cell[1]
+            min_cx, max_cx = min(min_cx, cell[0]), max(max_cx, cell[0])
+            min_cy, max_cy = min(min_cy, cell[1]), max(max_cy, cell[1])
+        self.cell_bounds = (min_cx, min_cy, max_cx, max_cy)
+
+    def remove(self, positions):
+        """Drop features from query results; their positions are not reused"""
+        positions = np.asarray(positions, dtype=np.intp)
+        positions = positions[positions < len(self.valid)]
+        self._detach(positions[self.valid[positions]])
+        self.valid[positions] = False
+
+    def _detach(self, positions):
+        """Take currently indexed positions out of their grid cells"""
+        for position in positions:
+            cell = self._cell_of(self.x[position], self.y[position])
+            members = self.cells[cell]
+            members = members[members != position]
+            if len(members):
+                self.cells[cell] = members
+            else:
+                del self.cells[cell]
+
+    def _ring_cells(self, cx, cy, r):
+        """Cells at Chebyshev distance exactly r from (cx, cy)"""
+        if r == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-r, r + 1):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+        for dy in range(-r + 1, r):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+
+    def _gather(self, cells):
+        parts = [self.cells[c] for c in cells if c in self.cells]
+        if not parts:
+            return np.empty(0, dtype=np.intp)
+        positions = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        return positions[self.valid[positions]]
+
+    def _max_ring(self, cx, cy):
+        min_cx, min_cy, max_cx, max_cy = self.cell_bounds
+        return max(cx - min_cx, max_cx - cx, cy - min_cy, max_cy - cy, 0)
+
+    def knn(self, lat, lon, k):
+        """
+        k nearest features to (lat, lon).
+        Returns (positions, distances_m), nearest first.
+        """
+        if k <= 0 or not self.cells:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+
+        qx, qy = project(lat, lon)
+        cx, cy = self._cell_of(qx, qy)
+        max_ring = self._max_ring(cx, cy)
+
+        # Rings closer than the occupied cells are empty: start at the first one that can hit
+        min_cx, min_cy, max_cx, max_cy = self.cell_bounds
+        r = max(min_cx - cx, cx - max_cx, min_cy - cy, cy - max_cy, 0)
+
+        found = []
+        n_found = 0
+        visited = 0
+        while True:
+            # Far from the data, rings are large and mostly empty; once they
+            # have cost more than scanning every occupied cell, scan everything
+            visited += 8 * r or 1
+            if visited > len(self.cells):
+                candidates = np.flatnonzero(self.valid)
+                break
+
+            positions = self._gather(self._ring_cells(cx, cy, r))
+            if len(positions):
+                found.append(positions)
+                n_found += len(positions)
+
+            # Every unvisited cell is at least r * cell_size away from the query;
+            # the slack covers projected vs. haversine distance differences
+            if n_found >= k or r >= max_ring:
+                candidates = np.concatenate(found) if found else np.empty(0, dtype=np.intp)
+                d2 = (self.x[candidates] - qx) ** 2 + (self.y[candidates] - qy) ** 2
+                if r >= max_ring:
+                    break
+                kth = np.partition(d2, k - 1)[k - 1]
+                if sqrt(kth) * 1.001 + 1.0 <= r * self.cell_size:
+                    break
+            r += 1
+
+        distances = haversine_many(lat, lon, self.lats[candidates], self.lons[candidates])
+        k = min(k, len(candidates))
+        if k < len(candidates):
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(distances[top], kind='stable')]
+        return candidates[top], distances[top]
+
+    def within_radius(self, lat, lon, meters):
+        """
+        Features within `meters` of (lat, lon).
+        Returns (positions, distances_m), nearest first.
+        """
+        if not self.cells:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+
+        qx, qy = project(lat, lon)
+        # Small slack so projection error never drops a boundary feature
+        reach = meters * 1.001 + 1.0
+        min_cx, min_cy = self._cell_of(qx - reach, qy - reach)
+        max_cx, max_cy = self._cell_of(qx + reach, qy + reach)
+        candidates = self._gather_block(min_cx, min_cy, max_cx, max_cy)
+
+        distances = haversine_many(lat, lon, self.lats[candidates], self.lons[candidates])
+        keep = distances <= meters
+        candidates, distances = candidates[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')
+        return candidates[order], distances[order]
+
+    def bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Positions of features inside a lat/lon bounding box"""
+        if not self.cells:
+            return np.empty(0, dtype=np.intp)
+
+        # Project the box outline; the projected box is slightly curved,
+        # so sample edge midpoints too and filter exactly on lat/lon below
+        lats = np.array([min_lat, min_lat, max_lat, max_lat, min_lat, max_lat, (min_lat + max_lat) / 2, (min_lat + max_lat) / 2])
+        lons = np.array([min_lon, max_lon, min_lon, max_lon, (min_lon + max_lon) / 2, (min_lon + max_lon) / 2, min_lon, max_lon])
+        xs, ys = project(lats, lons)
+        pad = self.cell_size * 0.01 + 1.0
+        min_cx, min_cy = self._cell_of(xs.min() - pad, ys.min() - pad)
+        max_cx, max_cy = self._cell_of(xs.max() + pad, ys.max() + pad)
+        candidates = self._gather_block(min_cx, min_cy, max_cx, max_cy)
+
+        lat_c = self.lats[candidates]
+        lon_c = self.lons[candidates]
+        keep = (lat_c >= min_lat) & (lat_c <= max_lat) & (lon_c >= min_lon) & (lon_c <= max_lon)
+        return np.sort(candidates[keep])
+
+    def along_route(self, lats, lons, meters, batch=256):
+        """
+        Features within `meters` of a polyline given by vertex lats/lons.
+        Returns (positions, distances_m, chainage_m) ordered by chainage, the
+        distance along the route to the closest point (ties: nearest first).
+        Point-to-segment distances are computed in the projected plane in
+        batches of `batch` route segments; the reported distance is haversine
+        to that closest point.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        if not self.cells or not len(lats):
+            return np.empty(0, dtype=np.intp), np.empty(0), np.empty(0)
+        if len(lats) == 1:
+            positions, distances = self.within_radius(lats[0], lons[0], meters)
+            return positions, distances, np.zeros(len(positions))
+
+        # Route segments, projected
+        vx, vy = project(lats, lons)
+        ax, ay, bx, by = vx[:-1], vy[:-1], vx[1:], vy[1:]
+        seg_len = haversine_pairs(lats[:-1], lons[:-1], lats[1:], lons[1:])
+        chain_start = np.concatenate([[0.0], np.cumsum(seg_len)[:-1]])
+
+        # Candidates: grid cells touched by any segment's padded bounding box
+        reach = meters * 1.001 + 1.0
+        min_cx = np.floor((np.minimum(ax, bx) - reach) / self.cell_size).astype(np.int64)
+        min_cy = np.floor((np.minimum(ay, by) - reach) / self.cell_size).astype(np.int64)
+        max_cx = np.floor((np.maximum(ax, bx) + reach) / self.cell_size).astype(np.int64)
+        max_cy = np.floor((np.maximum(ay, by) + reach) / self.cell_size).astype(np.int64)
+        b_min_cx, b_min_cy, b_max_cx, b_max_cy = self.cell_bounds
+        min_cx, min_cy = np.maximum(min_cx, b_min_cx), np.maximum(min_cy, b_min_cy)
+        max_cx, max_cy = np.minimum(max_cx, b_max_cx), np.minimum(max_cy, b_max_cy)
+        inside = (min_cx <= max_cx) & (min_cy <= max_cy)
+        width = np.where(inside, max_cx - min_cx + 1, 0)
+        height = np.where(inside, max_cy - min_cy + 1, 0)
+        counts = width * height
+        if not counts.sum():
+            return np.empty(0, dtype=np.intp), np.empty(0), np.empty(0)
+        owner = np.repeat(np.arange(len(counts)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = min_cx[owner] + local // height[owner]
+        cell_y = min_cy[owner] + local % height[owner]
+        cells = np.unique(np.stack([cell_x, cell_y], axis=1), axis=0)
+        candidates = np.unique(self._gather(map(tuple, cells.tolist())))
+        if not len(candidates):
+            return np.empty(0, dtype=np.intp), np.empty(0), np.empty(0)
+
+        # Closest route segment per candidate, in batches of segments
+        px, py = self.x[candidates][:, None], self.y[candidates][:, None]
+        best_d2 = np.full(len(candidates), np.inf)
+        best_seg = np.zeros(len(candidates), dtype=np.int64)
+        best_t = np.zeros(len(candidates))
+        for first in range(0, len(ax), batch):
+            sl = slice(first, first + batch)
+            dx, dy = bx[sl] - ax[sl], by[sl] - ay[sl]
+            length2 = dx * dx + dy * dy
+            with np.errstate(invalid='ignore', divide='ignore'):
+                t = ((px - ax[sl]) * dx + (py - ay[sl]) * dy) / length2
+            t = np.clip(np.nan_to_num(t), 0.0, 1.0)
+            d2 = (px - (ax[sl] + t * dx)) ** 2 + (py - (ay[sl] + t * dy)) ** 2
+            nearest = np.argmin(d2, axis=1)
+            rows = np.arange(len(candidates))
+            better = d2[rows, nearest] < best_d2
+            best_d2[better] = d2[rows, nearest][better]
+            best_seg[better] = first + nearest[better]
+            best_t[better] = t[rows, nearest][better]
+
+        keep = best_d2 <= reach * reach
+        candidates, best_seg, best_t = candidates[keep], best_seg[keep], best_t[keep]
+        # Haversine to the closest point, interpolated along the segment
+        closest_lat = lats[best_seg] + best_t * (lats[best_seg + 1] - lats[best_seg])
+        closest_lon = lons[best_seg] + best_t * (lons[best_seg + 1] - lons[best_seg])
+        distances = haversine_pairs(self.lats[candidates], self.lons[candidates], closest_lat, closest_lon)
+        chainage = chain_start[best_seg] + best_t * seg_len[best_seg]
+
+        keep = distances <= meters
+        candidates, distances, chainage = candidates[keep], distances[keep], chainage[keep]
+        order = np.lexsort((distances, chainage))
+        return candidates[order], distances[order], chainage[order]
+
+    def _gather_block(self, min_cx, min_cy, max_cx, max_cy):
+        # Clip to occupied cells so huge query boxes stay cheap
+        b_min_cx, b_min_cy, b_max_cx, b_max_cy = self.cell_bounds
+        min_cx, min_cy = max(min_cx, b_min_cx), max(min_cy, b_min_cy)
+        max_cx, max_cy = min(max_cx, b_max_cx), min(max_cy, b_max_cy)
+        if min_cx > max_cx or min_cy > max_cy:
+            return np.empty(0, dtype=np.intp)
+
+        n_block = (max_cx - min_cx + 1) * (max_cy - min_cy + 1)
+        if n_block > len(self.cells):
+            cells = [c for c in self.cells if min_cx <= c[0] <= max_cx and min_cy <= c[1] <= max_cy]
+        else:
+            cells = ((i, j) for i in range(min_cx, max_cx + 1) for j in range(min_cy, max_cy + 1))
+        return self._gather(cells)
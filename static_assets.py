@@ -0,0 +1,114 @@
+"""
+Build-time asset step for the app's images
+
+`python static_assets.py` resizes and recompresses each source image to
+the size the page shows it at, writes it to `static/` under a
+content-fingerprinted name (`cartoon.3f9a1c2b7d.jpg`) and records the
+mapping in `static/manifest.json`. With `server.enableStaticServing` the
+app then references the image by URL instead of inlining it into every
+rerun; the `?v=` fingerprint makes the server send a long-lived
+Cache-Control header, and a new image gets a new name.
+
+Usage:
+    python static_assets.py [--static-dir static]
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+
+from PIL import Image, ImageOps
+
+STATIC_DIR = 'static'
+MANIFEST = 'manifest.json'
+# Where Streamlit serves ./static when server.enableStaticServing is on
+STATIC_URL = 'app/static'
+
+# Source image -> (width, height) in pixels; 2x the 50 px CSS size for high-DPI phones
+ASSETS = {
+    'cartoon.JPG': (100, 100),
+}
+JPEG_QUALITY = 82
+
+
+def thumbnail_bytes(source, size):
+    """Square-cropped, resized, progressive JPEG of an image"""
+    with Image.open(source) as image:
+        image = ImageOps.fit(ImageOps.exif_transpose(image).convert('RGB'), size, Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        return buffer.getvalue()
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def build_assets(assets=ASSETS, static_dir=STATIC_DIR):
+    """Write fingerprinted thumbnails and the manifest; remove superseded builds. Returns the manifest."""
+    os.makedirs(static_dir, exist_ok=True)
+    manifest = {}
+    for source, size in assets.items():
+        data = thumbnail_bytes(source, size)
+        stem = os.path.splitext(os.path.basename(source))[0].lower()
+        name = f"{stem}.{fingerprint(data)}.jpg"
+        with open(os.path.join(static_dir, name), 'wb') as f:
+            f.write(data)
+        for old in os.listdir(static_dir):
+            if old != name and old.startswith(stem + '.') and old.endswith('.jpg'):
+                os.remove(os.path.join(static_dir, old))
+        manifest[source] = name
+
+    with open(os.path.join(static_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def asset_url(source, static_dir=STATIC_DIR):
+    """
+    Cacheable URL of a built asset, or None if it hasn't been built (or the
+    build is older than the source image)
+    """
+    try:
+        with open(os.path.join(static_dir, MANIFEST), 'r', encoding='utf-8') as f:
+            name = json.load(f)[source]
+        built = os.path.join(static_dir, name)
+        if os.path.getmtime(built) < os.path.getmtime(source):
+            return None
+    except (FileNotFoundError, KeyError, json.JSONDecodeError):
+        return None
+    version = name.rsplit('.', 2)[-2]
+    return f"{STATIC_URL}/{name}?v={version}"
+
+
+def thumbnail_data_uri(source):
+    """Fallback when assets aren't built: the thumbnail inlined, still far smaller than the original"""
+    data = thumbnail_bytes(source, ASSETS.get(source, (100, 100)))
+    return "data:image/jpeg;base64," + base64.b64encode(data).decode('ascii')
+
+
+def compact_html(text):
+    """Drop CSS comments and collapse whitespace, so a fragment goes out as one short line"""
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    return re.sub(r'\s*([{};])\s*', r'\1', text).replace('> <', '><').strip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build fingerprinted static assets for the app")
+    parser.add_argument('--static-dir', default=STATIC_DIR)
+    args = parser.parse_args(argv)
+
+    manifest = build_assets(static_dir=args.static_dir)
+    for source, name in manifest.items():
+        size = os.path.getsize(os.path.join(args.static_dir, name))
+        print(f"✓ {source} ({os.path.getsize(source) / 1024:.0f} KB) -> {args.static_dir}/{name} ({size / 1024:.1f} KB)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
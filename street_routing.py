@@ -0,0 +1,260 @@
+"""
+Walking distances over a local street graph
+
+`python street_routing.py build area.osm` turns an OpenStreetMap XML extract
+(e.g. exported from openstreetmap.org or cut with osmium) into a compact
+CSR graph of walkable ways, `street_graph.npz`. When that file exists the
+app snaps every parking location to its nearest graph node once, and
+re-ranks the haversine-preselected candidates by walking distance with a
+single Dijkstra run from the user's position that stops as soon as every
+candidate node is settled.
+
+Usage:
+    python street_routing.py build area.osm [-o street_graph.npz]
+    python street_routing.py info [street_graph.npz]
+"""
+import argparse
+import heapq
+import sys
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from spatial_index import ParkingIndex, haversine_edges
+
+DEFAULT_GRAPH = 'street_graph.npz'
+
+# OSM highway types people can walk along
+WALKABLE_HIGHWAYS = {
+    'footway', 'pedestrian', 'path', 'steps', 'living_street', 'residential', 'service',
+    'unclassified', 'tertiary', 'tertiary_link', 'secondary', 'secondary_link',
+    'primary', 'primary_link', 'cycleway', 'track', 'corridor', 'crossing',
+}
+NO_FOOT = {'no', 'private'}
+
+# Candidates re-ranked by walking distance in the app
+WALK_CANDIDATES = 50
+
+
+def is_walkable(tags):
+    if tags.get('foot') in ('yes', 'designated'):
+        return True
+    return (tags.get('highway') in WALKABLE_HIGHWAYS
+            and tags.get('foot') not in NO_FOOT and tags.get('access') not in NO_FOOT)
+
+
+def _osm_elements(osm_path):
+    """
+    Stream the top-level elements of an OSM XML file as (element, [nd ref, ...],
+    {k: v}). Each element is dropped from the tree once it has been handled,
+    so the parsed tree never grows.
+    """
+    context = ET.iterparse(osm_path, events=('start', 'end'))
+    _, root = next(context)
+    refs, tags = [], {}
+    for event, element in context:
+        if event != 'end':
+            continue
+        if element.tag == 'nd':
+            refs.append(int(element.get('ref')))
+        elif element.tag == 'tag':
+            tags[element.get('k')] = element.get('v')
+        elif element.tag in ('node', 'way', 'relation'):
+            yield element, refs, tags
+            # Child <tag>/<nd> elements belong to the element that just ended
+            refs, tags = [], {}
+            root.clear()
+
+
+def parse_osm_ways(osm_path):
+    """
+    Read an OSM XML file in two streaming passes and return (node coordinates
+    {id: (lat, lon)}, walkable ways [[node id, ...], ...]). The first pass
+    collects the walkable ways, the second only the nodes they reference, so
+    memory grows with the walkable network, not with the file.
+    """
+    ways = [refs for element, refs, tags in _osm_elements(osm_path)
+            if element.tag == 'way' and is_walkable(tags)]
+    wanted = {node for way in ways for node in way}
+    nodes = {}
+    for element, _, _ in _osm_elements(osm_path):
+        if element.tag == 'node':
+            node = int(element.get('id'))
+            if node in wanted:
+                nodes[node] = (float(element.get('lat')), float(element.get('lon')))
+    return nodes, ways
+
+
+def build_street_graph(osm_path, target=DEFAULT_GRAPH):
+    """Compile walkable ways from an OSM extract into an undirected CSR graph file"""
+    nodes, ways = parse_osm_ways(osm_path)
+
+    ids = {}
+    sources, targets = [], []
+    for way in ways:
+        way = [n for n in way if n in nodes]
+        for a, b in zip(way, way[1:]):
+            if a != b:
+                sources.append(ids.setdefault(a, len(ids)))
+                targets.append(ids.setdefault(b, len(ids)))
+
+    sources = np.array(sources, dtype=np.int64)
+    targets = np.array(targets, dtype=np.int64)
+
+    # Keep the largest connected network, so nothing snaps onto an isolated path
+    keep = largest_component(len(ids), sources, targets)
+    renumber = np.full(len(ids), -1, dtype=np.int64)
+    renumber[keep] = np.arange(len(keep))
+    kept_edges = (renumber[sources] >= 0) & (renumber[targets] >= 0)
+    sources, targets = renumber[sources[kept_edges]], renumber[targets[kept_edges]]
+    osm_ids = np.fromiter(ids, dtype=np.int64, count=len(ids))[keep]
+
+    coords = np.array([nodes[osm_id] for osm_id in osm_ids.tolist()], dtype=np.float64).reshape(-1, 2)
+    lengths = haversine_edges(coords, sources, targets)
+
+    # Both directions, sorted by source -> CSR
+    tail = np.concatenate([sources, targets])
+    head = np.concatenate([targets, sources])
+    weight = np.concatenate([lengths, lengths])
+    order = np.argsort(tail, kind='stable')
+    indptr = np.zeros(len(coords) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tail, minlength=len(coords)), out=indptr[1:])
+
+    np.savez_compressed(
+        target,
+        lat=coords[:, 0],
+        lon=coords[:, 1],
+        indptr=indptr,
+        indices=head[order].astype(np.int32),
+        weights=weight[order].astype(np.float32),
+        osm_ids=osm_ids,
+    )
+    return len(coords), len(sources)
+
+
+def largest_component(n_nodes, sources, targets):
+    """Sorted node numbers of the largest connected component (union-find)"""
+    parent = list(range(n_nodes))
+
+    def root(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in zip(sources.tolist(), targets.tolist()):
+        ra, rb = root(a), root(b)
+        if ra != rb:
+            parent[ra] = rb
+    roots = np.array([root(x) for x in range(n_nodes)], dtype=np.int64)
+    if not len(roots):
+        return roots
+    return np.flatnonzero(roots == np.bincount(roots).argmax())
+
+
+class StreetGraph:
+    """Read-only CSR street graph with nearest-node snapping"""
+
+    def __init__(self, lat, lon, indptr, indices, weights):
+        self.lat = lat
+        self.lon = lon
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.node_index = ParkingIndex(lat, lon)
+        # Python lists make the Dijkstra inner loop several times faster than array indexing
+        self._indptr = indptr.tolist()
+        self._indices = indices.tolist()
+        self._weights = weights.astype(np.float64).tolist()
+
+    @classmethod
+    def load(cls, path=DEFAULT_GRAPH):
+        with np.load(path) as data:
+            return cls(data['lat'], data['lon'], data['indptr'], data['indices'], data['weights'])
+
+    def __len__(self):
+        return len(self.lat)
+
+    def snap(self, lats, lons):
+        """Nearest graph node and the straight-line distance to it, for each point"""
+        nodes = np.empty(len(lats), dtype=np.int32)
+        distances = np.empty(len(lats), dtype=np.float32)
+        for i, (lat, lon) in enumerate(zip(lats, lons)):
+            found, dist = self.node_index.knn(lat, lon, 1)
+            nodes[i], distances[i] = (found[0], dist[0]) if len(found) else (-1, np.inf)
+        return nodes, distances
+
+    def distances_to(self, source, targets, limit=np.inf):
+        """
+        Shortest-path meters from node `source` to each of `targets`
+        (inf if unreachable or beyond `limit`). Dijkstra stops as soon as
+        every target is settled.
+        """
+        remaining = set(int(t) for t in targets if t >= 0)
+        found = {}
+        indptr, indices, weights = self._indptr, self._indices, self._weights
+        best = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap and remaining:
+            dist, node = heapq.heappop(heap)
+            if dist > limit:
+                break
+            if dist > best[node]:
+                continue
+            if node in remaining:
+                found[node] = dist
+                remaining.discard(node)
+            for e in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[e]
+                candidate = dist + weights[e]
+                if candidate < best.get(neighbour, np.inf):
+                    best[neighbour] = candidate
+                    heapq.heappush(heap, (candidate, neighbour))
+        return np.array([found.get(int(t), np.inf) for t in targets], dtype=np.float64)
+
+
+def rerank_by_walking(user_lat, user_lon, ranked, graph, n, distance_weight=1.0, detour_limit=4.0):
+    """
+    Replace haversine distance with walking distance in `ranked` (rows with
+    'street_node', 'street_snap_m', 'distance' and 'score') and return the n best.
+    The straight-line distance is kept as 'straight_distance'. Spots that
+    can't be reached through the graph rank last.
+    """
+    if ranked.empty:
+        return ranked
+    (user_node,), (user_snap,) = graph.snap([user_lat], [user_lon])
+    straight = ranked['distance'].to_numpy()
+    limit = detour_limit * float(straight.max()) + 2 * float(user_snap) + 500
+    on_graph = graph.distances_to(int(user_node), ranked['street_node'].to_numpy(), limit=limit)
+    walking = on_graph + float(user_snap) + ranked['street_snap_m'].to_numpy(dtype=np.float64)
+
+    result = ranked.copy()
+    result['straight_distance'] = straight
+    result['distance'] = walking
+    result['score'] = result['score'].to_numpy() + distance_weight * (walking - straight)
+    order = np.argsort(np.where(np.isfinite(walking), result['score'].to_numpy(), np.inf), kind='stable')
+    return result.iloc[order[:n]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the walking street graph")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="Compile an OSM XML extract")
+    build.add_argument('source')
+    build.add_argument('-o', '--output', default=DEFAULT_GRAPH)
+    info = commands.add_parser('info', help="Summarize a compiled graph")
+    info.add_argument('path', nargs='?', default=DEFAULT_GRAPH)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        n_nodes, n_edges = build_street_graph(args.source, args.output)
+        print(f"✓ {n_nodes} nodes, {n_edges} street segments -> {args.output}")
+    else:
+        graph = StreetGraph.load(args.path)
+        print(f"{args.path}: {len(graph)} nodes, {len(graph.indices) // 2} street segments, "
+              f"lat {graph.lat.min():.4f}-{graph.lat.max():.4f}, lon {graph.lon.min():.4f}-{graph.lon.max():.4f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+Street segments: parking features grouped by `strekningsid`
+
+Oslo splits a street's parking into several polygons that share one
+`strekningsid`. `build_segments` groups them once per dataset: total
+capacity, number of spots, dominant tariff and zone (by capacity),
+merged geometry and a centre. Features without a `strekningsid` are a
+segment of their own.
+
+`rank_segments` answers "nearest parking" with one result per street: each
+segment is represented by its best-scoring spot, so there are no
+near-duplicate pins along the same street, and `segment_members` drills
+down into the spots of one segment.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from parking_core import haversine_vector, nearest_indices, prepare_coordinates, score_parking
+from parking_geometry import GeometryBatch, feature_locations
+from spatial_index import haversine_edges
+
+StreetSegments = namedtuple('StreetSegments', [
+    'table',           # DataFrame, one row per segment (see build_segments)
+    'member_offsets',  # (S + 1,) offsets into member_rows
+    'member_rows',     # (N,) parking_df positions, grouped by segment
+    'segment_of',      # (N,) segment number of every parking_df row
+    'geometry',        # GeometryBatch with one multi-part feature per segment, or None
+])
+
+
+def _ranges(starts, ends):
+    """Concatenation of arange(s, e) for every (s, e) pair"""
+    lengths = ends - starts
+    if not len(lengths):
+        return np.empty(0, dtype=np.int64)
+    shift = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return shift + np.arange(lengths.sum())
+
+
+def _dominant(segment_of, values, weights, n_segments):
+    """Per segment, the value with the largest total weight (None if all are missing)"""
+    result = np.full(n_segments, None, dtype=object)
+    frame = pd.DataFrame({'segment': segment_of, 'value': values, 'weight': weights}).dropna(subset=['value'])
+    if len(frame):
+        totals = frame.groupby(['segment', 'value'], observed=True)['weight'].sum().reset_index()
+        best = totals.sort_values(['segment', 'weight'], ascending=[True, False]).drop_duplicates('segment')
+        result[best['segment'].to_numpy()] = best['value'].to_numpy(dtype=object)
+    return result
+
+
+def merge_geometry(batch, member_offsets, member_rows):
+    """One feature per segment holding every part of its members"""
+    part_starts = batch.feature_parts[member_rows]
+    part_ends = batch.feature_parts[member_rows + 1]
+    parts = _ranges(part_starts, part_ends)
+    vertex_index = _ranges(batch.part_offsets[parts], batch.part_offsets[parts + 1])
+    part_lengths = batch.part_offsets[parts + 1] - batch.part_offsets[parts]
+    parts_per_member = np.concatenate([[0], np.cumsum(part_ends - part_starts)])
+    return GeometryBatch(
+        feature_index=np.arange(len(member_offsets) - 1),
+        kinds=batch.kinds[member_rows[member_offsets[:-1]]],
+        vertices=batch.vertices[vertex_index],
+        part_offsets=np.concatenate([[0], np.cumsum(part_lengths)]).astype(np.int64),
+        feature_parts=parts_per_member[member_offsets].astype(np.int64),
+    )
+
+
+def build_segments(parking_df, geometry=None):
+    """
+    Group parking_df rows by 'strekningsid'. `geometry`, if given, must be
+    aligned with parking_df rows. The table has, per segment:
+    strekningsid (nullable Int64, missing for single features), lat/lon
+    (centre of the merged geometry, else the capacity-weighted mean),
+    beregnet_antall (total spaces), n_spots, takstgruppe1 / beboerparkeringssone (dominant by
+    capacity), nattparkeringsforbud ('Ja' if any spot has the ban) and
+    radius_m (centre to the farthest member).
+    """
+    n = len(parking_df)
+    ids = parking_df['strekningsid'].to_numpy(dtype=np.float64) if 'strekningsid' in parking_df else np.full(n, np.nan)
+    # Features without an id get a unique negative key each
+    keys = np.where(np.isnan(ids), -1.0 - np.arange(n), ids)
+    unique_keys, segment_of = np.unique(keys, return_inverse=True)
+    n_segments = len(unique_keys)
+
+    member_rows = np.argsort(segment_of, kind='stable')
+    member_offsets = np.zeros(n_segments + 1, dtype=np.int64)
+    np.cumsum(np.bincount(segment_of, minlength=n_segments), out=member_offsets[1:])
+
+    capacity = (parking_df['beregnet_antall'].to_numpy(dtype=np.float64) if 'beregnet_antall' in parking_df
+                else np.full(n, np.nan))
+    lat = parking_df['lat'].to_numpy(dtype=np.float64)
+    lon = parking_df['lon'].to_numpy(dtype=np.float64)
+    located = np.isfinite(lat) & np.isfinite(lon)
+    # Spots with unknown capacity still count once for the centre and the dominant values
+    weight = np.where(np.isnan(capacity), 1.0, np.maximum(capacity, 1.0)) * located
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total_weight = np.bincount(segment_of, weights=weight, minlength=n_segments)
+        centre_lat = np.bincount(segment_of, weights=np.where(located, lat, 0) * weight, minlength=n_segments) / total_weight
+        centre_lon = np.bincount(segment_of, weights=np.where(located, lon, 0) * weight, minlength=n_segments) / total_weight
+
+    merged = None
+    if geometry is not None and len(geometry.kinds) == n:
+        merged = merge_geometry(geometry, member_offsets, member_rows)
+        merged_lon, merged_lat = feature_locations(merged)
+        ok = np.isfinite(merged_lat) & np.isfinite(merged_lon)
+        centre_lat[ok], centre_lon[ok] = merged_lat[ok], merged_lon[ok]
+
+    points = np.column_stack([np.concatenate([centre_lat, lat]), np.concatenate([centre_lon, lon])])
+    member_distance = haversine_edges(points, segment_of, n_segments + np.arange(n))
+    radius = np.zeros(n_segments)
+    np.maximum.at(radius, segment_of[located], member_distance[located])
+
+    table = {
+        'strekningsid': pd.arrays.IntegerArray(np.maximum(unique_keys, 0).astype(np.int64), unique_keys < 0),
+        'lat': centre_lat,
+        'lon': centre_lon,
+        'beregnet_antall': np.rint(np.bincount(segment_of, weights=np.nan_to_num(capacity),
+                                               minlength=n_segments)).astype(np.int64),
+        'n_spots': np.bincount(segment_of, weights=located, minlength=n_segments).astype(np.int32),
+        'radius_m': radius.astype(np.float32),
+    }
+    for name in ('takstgruppe1', 'beboerparkeringssone'):
+        if name in parking_df:
+            table[name] = pd.Categorical(_dominant(segment_of, parking_df[name].to_numpy(dtype=object),
+                                                   weight, n_segments))
+    if 'nattparkeringsforbud' in parking_df:
+        banned = np.bincount(segment_of, weights=(parking_df['nattparkeringsforbud'] == 'Ja').to_numpy(),
+                             minlength=n_segments) > 0
+        table['nattparkeringsforbud'] = pd.Categorical(np.where(banned, 'Ja', None))
+
+    return StreetSegments(
+        table=pd.DataFrame(table),
+        member_offsets=member_offsets,
+        member_rows=member_rows,
+        segment_of=segment_of,
+        geometry=merged,
+    )
+
+
+def rank_segments(user_lat, user_lon, df, segments, n=10, coords=None, filters=(), weights=None,
+                  tariff_table=None, stay_minutes=60, fuel='bensin', start=None):
+    """
+    Like `rank_parking`, but one result per street segment: each segment is
+    represented by its best-scoring spot that passes `filters`. Returns
+    those parking_df rows with 'distance', 'score', 'cost' (if priced) and
+    'segment', 'segment_spaces', 'segment_spots', 'segment_takstgruppe'.
+    """
+    score, distances, costs = score_parking(user_lat, user_lon, df, coords, filters, weights,
+                                            tariff_table, stay_minutes, fuel, start)
+
+    # Best member per segment: sort members by (segment, score), take each segment's first
+    member_score = np.nan_to_num(score[segments.member_rows], nan=np.inf, posinf=np.finfo(np.float64).max)
+    order = np.lexsort((member_score, segments.segment_of[segments.member_rows]))
+    best_rows = segments.member_rows[order[segments.member_offsets[:-1]]]
+
+    segment_score = score[best_rows]
+    included = ~np.isnan(segment_score)
+    top = nearest_indices(np.where(included, segment_score, np.inf), min(n, int(included.sum())))
+    rows = best_rows[top]
+
+    table = segments.table
+    ranked = df.iloc[rows].copy()
+    ranked['distance'] = distances[rows]
+    ranked['score'] = score[rows]
+    if costs is not None:
+        ranked['cost'] = costs[rows]
+    ranked['segment'] = top
+    ranked['segment_spaces'] = table['beregnet_antall'].to_numpy()[top]
+    ranked['segment_spots'] = table['n_spots'].to_numpy()[top]
+    if 'takstgruppe1' in table:
+        ranked['segment_takstgruppe'] = table['takstgruppe1'].to_numpy()[top]
+    return ranked
+
+
+def segment_members(user_lat, user_lon, df, segments, segment, coords=None):
+    """Drill-down: the located spots of one segment, nearest first, with 'distance'"""
+    rows = segments.member_rows[segments.member_offsets[segment]:segments.member_offsets[segment + 1]]
+    members = df.iloc[rows]
+    member_coords = ({name: array[rows] for name, array in coords.items()} if coords is not None
+                     else prepare_coordinates(members))
+    distances = haversine_vector(user_lat, user_lon, member_coords)
+    order = np.argsort(np.where(np.isfinite(distances), distances, np.inf), kind='stable')
+    order = order[np.isfinite(distances[order])]
+    result = members.iloc[order].copy()
+    result['distance'] = distances[order]
+    return result
+
+
+def segment_position(segments, strekningsid):
+    """Segment number for a strekningsid, or -1"""
+    ids = segments.table['strekningsid'].to_numpy(dtype=np.float64, na_value=np.nan)
+    found = np.flatnonzero(ids == float(strekningsid))
+    return int(found[0]) if len(found) else -1
@@ -0,0 +1,311 @@
+"""
+Tariff engine for Oslo parking tariff groups (takstgrupper)
+
+Loads `takstgruppe_lookup.json` once into typed arrays:
+
+- duration breakpoints (minutes) and a (groups x breakpoints) price table
+  per fuel type, NaN where a group has no price for that duration
+- maximum parking time per group (`maks_tid`), inf for "Ubegrenset"
+- paid-hours windows parsed from `avgiftstid`, stored as a cumulative
+  count of paid minutes over the week so "paid minutes between T and
+  T + X" is two array lookups
+
+`TariffTable.price` then answers "what does X minutes from time T cost"
+for many spots at once without Python loops.
+"""
+import json
+import re
+from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+FUEL_COLUMNS = {
+    'bensin': 'prices_bensin_diesel',
+    'elbil': 'prices_elbil',
+}
+
+WEEKDAYS = ['man', 'tir', 'ons', 'tor', 'fre', 'lør', 'søn']
+
+_WINDOW_RE = re.compile(
+    r'(\d{1,2})(?::(\d{2}))?\s*-\s*(\d{1,2})(?::(\d{2}))?\s*(?:\(([^)]*)\))?'
+)
+_DURATION_RE = re.compile(r'(\d+)\s*(min|minutt|minutter|t|time|timer|h|dag|dager|døgn)\b')
+
+
+def oslo_now():
+    """Current local time in Oslo (naive), which is what paid hours refer to"""
+    try:
+        return datetime.now(ZoneInfo('Europe/Oslo')).replace(tzinfo=None)
+    except ZoneInfoNotFoundError:
+        return datetime.now()
+
+
+def format_minutes(minutes):
+    """60 -> '1 time', 150 -> '2 t 30 min', 2880 -> '2 døgn'"""
+    minutes = int(minutes)
+    if minutes % MINUTES_PER_DAY == 0:
+        return f"{minutes // MINUTES_PER_DAY} døgn"
+    hours, rest = divmod(minutes, 60)
+    if not hours:
+        return f"{rest} min"
+    if rest:
+        return f"{hours} t {rest} min"
+    return f"{hours} time" if hours == 1 else f"{hours} timer"
+
+
+def parse_days(text):
+    """Weekday numbers (0 = Monday) for 'man-fre', 'lør', 'man, ons' and similar"""
+    if not text:
+        return list(range(7))
+    days = []
+    for chunk in re.split(r'\s*(?:,|\bog\b)\s*', text.strip().lower()):
+        if not chunk:
+            continue
+        if '-' in chunk:
+            first, last = (part.strip()[:3] for part in chunk.split('-', 1))
+            start, end = WEEKDAYS.index(first), WEEKDAYS.index(last)
+            days.extend(range(start, end + 1) if start <= end else [*range(start, 7), *range(0, end + 1)])
+        else:
+            days.append(WEEKDAYS.index(chunk[:3]))
+    return sorted(set(days))
+
+
+def parse_avgiftstid(text):
+    """
+    Parse an `avgiftstid` string into paid windows.
+    Returns a list of (weekday, start_minute, end_minute) with end > start,
+    e.g. "Kl. 13:00-20:00 (man-fre) og 09:00-20:00 (lør)".
+    Raises ValueError for text it does not understand.
+    """
+    if text is None:
+        raise ValueError("no avgiftstid")
+    cleaned = text.strip().lower()
+    if cleaned in ('døgnet rundt', 'hele døgnet', 'alltid'):
+        return [(day, 0, MINUTES_PER_DAY) for day in range(7)]
+
+    cleaned = re.sub(r'^kl\.?\s*', '', cleaned)
+    windows = []
+    for chunk in re.split(r'\s+og\s+', cleaned):
+        match = _WINDOW_RE.fullmatch(chunk.strip())
+        if not match:
+            raise ValueError(f"unrecognised avgiftstid: {text!r}")
+        h1, m1, h2, m2, days = match.groups()
+        start = int(h1) * 60 + int(m1 or 0)
+        end = int(h2) * 60 + int(m2 or 0)
+        if not (0 <= start <= MINUTES_PER_DAY and 0 <= end <= MINUTES_PER_DAY):
+            raise ValueError(f"unrecognised avgiftstid: {text!r}")
+        try:
+            day_list = parse_days(days)
+        except ValueError:
+            raise ValueError(f"unrecognised weekdays in avgiftstid: {text!r}") from None
+        for day in day_list:
+            if end > start:
+                windows.append((day, start, end))
+            elif end < start:
+                # Crosses midnight, e.g. 22-06
+                windows.append((day, start, MINUTES_PER_DAY))
+                windows.append(((day + 1) % 7, 0, end))
+    return windows
+
+
+def parse_duration_minutes(text):
+    """'2 timer' -> 120, '28 dager' -> 40320, 'Ubegrenset' -> inf, unknown -> nan"""
+    if text is None:
+        return np.nan
+    cleaned = str(text).strip().lower()
+    if cleaned.startswith('ubegrenset'):
+        return np.inf
+    match = _DURATION_RE.search(cleaned)
+    if not match:
+        return np.nan
+    value, unit = int(match.group(1)), match.group(2)
+    if unit.startswith('min'):
+        return float(value)
+    if unit in ('t', 'time', 'timer', 'h'):
+        return value * 60.0
+    return value * float(MINUTES_PER_DAY)
+
+
+def parse_price_key(key):
+    """'1h' -> 60, '30m' -> 30, anything else -> None"""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([hm])', key.strip().lower())
+    if not match:
+        return None
+    value = float(match.group(1))
+    return value * 60 if match.group(2) == 'h' else value
+
+
+def normalize_group(value):
+    """Tariff group key as used in the lookup file (2300, 2300.0, '2300' -> '2300')"""
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else str(int(value))
+    text = str(value).strip()
+    try:
+        return str(int(float(text)))
+    except ValueError:
+        return text or None
+
+
+class TariffTable:
+    """Typed, preparsed view of the tariff lookup"""
+
+    def __init__(self, tariff_data):
+        self.groups = [key for key, value in tariff_data.items()
+                       if not key.startswith('_') and isinstance(value, dict)]
+        self.group_index = {group: i for i, group in enumerate(self.groups)}
+        self.info = [tariff_data[group] for group in self.groups]
+        n = len(self.groups)
+
+        numeric = sorted((float(group), i) for i, group in enumerate(self.groups) if group.isdigit())
+        self._numeric_codes = np.array([code for code, _ in numeric], dtype=np.float64)
+        self._numeric_index = np.array([i for _, i in numeric], dtype=np.int64)
+
+        # Union of all duration breakpoints, then one price row per group
+        breakpoints = set()
+        for info in self.info:
+            for column in FUEL_COLUMNS.values():
+                for key in info.get(column, {}):
+                    minutes = parse_price_key(key)
+                    if minutes:
+                        breakpoints.add(minutes)
+        self.breakpoints = np.array(sorted(breakpoints), dtype=np.float64)
+
+        self.prices = {}
+        self.currency = []
+        for fuel, column in FUEL_COLUMNS.items():
+            table = np.full((n, len(self.breakpoints)), np.nan)
+            for g, info in enumerate(self.info):
+                for key, price in info.get(column, {}).items():
+                    minutes = parse_price_key(key)
+                    if minutes:
+                        table[g, np.searchsorted(self.breakpoints, minutes)] = price
+            self.prices[fuel] = table
+        for info in self.info:
+            prices = info.get('prices_bensin_diesel') or info.get('prices_elbil') or {}
+            self.currency.append(prices.get('currency', 'NOK'))
+
+        self.max_minutes = np.array([parse_duration_minutes(info.get('maks_tid', 'Ubegrenset')) for info in self.info])
+
+        # Paid windows -> per-minute weekly calendar -> cumulative paid minutes
+        self.windows = []
+        self.has_windows = np.zeros(n, dtype=bool)
+        paid = np.zeros((n, MINUTES_PER_WEEK), dtype=bool)
+        for g, info in enumerate(self.info):
+            try:
+                windows = parse_avgiftstid(info.get('avgiftstid'))
+            except ValueError:
+                windows = None
+            self.windows.append(windows)
+            if windows is None:
+                continue
+            self.has_windows[g] = True
+            for day, start, end in windows:
+                paid[g, day * MINUTES_PER_DAY + start:day * MINUTES_PER_DAY + end] = True
+        self.paid_cumulative = np.zeros((n, MINUTES_PER_WEEK + 1), dtype=np.int32)
+        np.cumsum(paid, axis=1, out=self.paid_cumulative[:, 1:])
+        self.paid_per_week = self.paid_cumulative[:, -1]
+
+    @classmethod
+    def from_file(cls, filepath='takstgruppe_lookup.json'):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def __len__(self):
+        return len(self.groups)
+
+    def lookup(self, values):
+        """Group index per value (takstgruppe1 codes as int/float/str); -1 if unknown"""
+        values = np.asarray(values)
+        if values.dtype.kind in 'iuf':
+            # Numeric codes: one searchsorted against the numeric group keys
+            codes = values.astype(np.float64).ravel()
+            if not len(self._numeric_codes):
+                return np.full(len(codes), -1, dtype=np.int64)
+            index = np.searchsorted(self._numeric_codes, codes).clip(0, len(self._numeric_codes) - 1)
+            found = self._numeric_codes[index] == codes
+            return np.where(found, self._numeric_index[index], -1)
+
+        # Mixed/object values: normalize each distinct value once
+        uniques, inverse = np.unique(values.astype(str).ravel(), return_inverse=True)
+        mapped = np.array([self.group_index.get(normalize_group(u), -1) if u not in ('None', 'nan') else -1
+                           for u in uniques], dtype=np.int64)
+        return mapped[inverse]
+
+    def get(self, group):
+        """Raw tariff dict for one group, or None"""
+        index = self.group_index.get(normalize_group(group))
+        return None if index is None else self.info[index]
+
+    def paid_minutes(self, group_index, start, minutes):
+        """
+        Minutes inside paid hours during [start, start + minutes) for each group.
+        `start` is a naive datetime in Oslo local time; arrays broadcast.
+        """
+        group_index = np.asarray(group_index)
+        minutes = np.asarray(minutes, dtype=np.int64)
+        week_minute = start.weekday() * MINUTES_PER_DAY + start.hour * 60 + start.minute
+
+        g = np.where(group_index >= 0, group_index, 0)
+        full_weeks, remainder = np.divmod(minutes, MINUTES_PER_WEEK)
+        end = week_minute + remainder
+        cumulative = self.paid_cumulative
+        wrapped = end > MINUTES_PER_WEEK
+        end_in_week = np.where(wrapped, MINUTES_PER_WEEK, end)
+        paid = cumulative[g, end_in_week] - cumulative[g, week_minute]
+        paid = paid + np.where(wrapped, cumulative[g, np.where(wrapped, end - MINUTES_PER_WEEK, 0)], 0)
+        paid = paid + full_weeks * self.paid_per_week[g]
+        return np.where(group_index >= 0, paid, 0)
+
+    def price(self, group_index, minutes, start=None, fuel='bensin'):
+        """
+        Cost of parking `minutes` from `start` (default: now in Oslo) per group index.
+
+        Only minutes inside the paid window are charged. Prices are linear
+        between the published breakpoints (0 min -> 0 kr, 1h, 2h, ...) and
+        extend the last step's rate beyond the longest one. NaN means the
+        price is unknown, or the stay has more paid minutes than `maks_tid`
+        allows (the limit only applies while parking is paid).
+        """
+        if start is None:
+            start = oslo_now()
+        group_index = np.asarray(group_index)
+        minutes = np.broadcast_to(np.asarray(minutes, dtype=np.float64), group_index.shape)
+        table = self.prices[fuel]
+        known = group_index >= 0
+        g = np.where(known, group_index, 0)
+
+        charged = self.paid_minutes(group_index, start, minutes.astype(np.int64)).astype(np.float64)
+        cost = np.full(group_index.shape, np.nan)
+
+        for row in np.unique(g[known]):
+            mask = known & (g == row)
+            available = ~np.isnan(table[row])
+            if not available.any():
+                continue
+            xs = np.concatenate([[0.0], self.breakpoints[available]])
+            ys = np.concatenate([[0.0], table[row][available]])
+            cost[mask] = np.interp(charged[mask], xs, ys)
+            beyond = mask & (charged > xs[-1])
+            if beyond.any():
+                slope = (ys[-1] - ys[-2]) / (xs[-1] - xs[-2])
+                cost[beyond] = ys[-1] + (charged[beyond] - xs[-1]) * slope
+
+        # Nothing to pay outside paid hours, even without a price table
+        free = known & self.has_windows[g] & (charged == 0)
+        cost[free] = 0.0
+        too_long = known & (charged > self.max_minutes[g])
+        cost[too_long] = np.nan
+        cost[~known] = np.nan
+        return cost
+
+    def price_for(self, takstgrupper, minutes, start=None, fuel='bensin'):
+        """`price` for raw takstgruppe1 values, e.g. a DataFrame column"""
+        return self.price(self.lookup(takstgrupper), minutes, start=start, fuel=fuel)
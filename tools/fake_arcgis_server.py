@@ -0,0 +1,118 @@
+"""
+Local stand-in for the ArcGIS REST layer, for trying out parking_sync.py
+
+Serves a JSON dump (same format as parking_data.json) at
+`/<layer>/query`, supporting what the sync uses: `where` with a
+`last_edited_date >= TIMESTAMP '...'` clause, `resultOffset` /
+`resultRecordCount` pages capped at `--max-records`, and `returnIdsOnly`.
+Other `where` clauses are ignored; the dump is assumed to match them.
+`--edit/--delete/--add` simulate changes made in the layer since the dump.
+
+Usage:
+    python tools/fake_arcgis_server.py [--data parking_data.json] [--port 8766] [--edit 5 --delete 2 --add 3]
+    python parking_sync.py --url http://127.0.0.1:8766/layer
+"""
+import argparse
+import copy
+import json
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+import tornado.ioloop
+import tornado.web
+
+EDITED_SINCE = re.compile(r"last_edited_date\s*(>=|>)\s*TIMESTAMP\s*'([^']+)'", re.IGNORECASE)
+
+
+def simulate_changes(features, edit=0, delete=0, add=0, seed=0):
+    """Copy of `features` with some edited (moved a few meters), deleted and added"""
+    rng = np.random.default_rng(seed)
+    features = copy.deepcopy(features)
+    now_ms = int(time.time() * 1000)
+
+    def shift(feature, dlat, dlon):
+        for ring in feature['geometry'].get('rings', []):
+            for point in ring:
+                point[0] += dlon
+                point[1] += dlat
+
+    for i in rng.choice(len(features), min(edit, len(features)), replace=False):
+        shift(features[i], rng.uniform(-1e-4, 1e-4), rng.uniform(-2e-4, 2e-4))
+        features[i]['attributes'].update(last_edited_date=now_ms, last_edited_user='sync-test')
+
+    next_id = max(f['attributes']['objectid'] for f in features) + 1
+    for i in rng.choice(len(features), min(add, len(features)), replace=False):
+        feature = copy.deepcopy(features[i])
+        shift(feature, rng.uniform(-2e-3, 2e-3), rng.uniform(-4e-3, 4e-3))
+        feature['attributes'].update(objectid=next_id, globalid='{' + str(uuid.uuid4()).upper() + '}',
+                                     created_date=now_ms, last_edited_date=now_ms)
+        features.append(feature)
+        next_id += 1
+
+    for i in sorted(rng.choice(len(features), min(delete, len(features)), replace=False), reverse=True):
+        del features[i]
+    return features
+
+
+class QueryHandler(tornado.web.RequestHandler):
+    def initialize(self, features, max_records):
+        self.features = features
+        self.max_records = max_records
+
+    def get(self, layer):
+        where = self.get_argument('where', '1=1')
+        features = self.features
+        match = EDITED_SINCE.search(where)
+        if match:
+            since = datetime.strptime(match.group(2), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+            since_ms = since.timestamp() * 1000
+            if match.group(1) == '>':
+                features = [f for f in features if (f['attributes'].get('last_edited_date') or 0) > since_ms]
+            else:
+                features = [f for f in features if (f['attributes'].get('last_edited_date') or 0) >= since_ms]
+
+        if self.get_argument('returnIdsOnly', 'false') == 'true':
+            self.write({'objectIdFieldName': 'objectid',
+                        'objectIds': [f['attributes']['objectid'] for f in features]})
+            return
+
+        offset = int(self.get_argument('resultOffset', 0))
+        count = min(int(self.get_argument('resultRecordCount', self.max_records)), self.max_records)
+        page = features[offset:offset + count]
+        self.write({
+            'geometryType': 'esriGeometryPolygon',
+            'spatialReference': {'wkid': 4326},
+            'features': page,
+            'exceededTransferLimit': offset + count < len(features),
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='parking_data.json')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--max-records', type=int, default=200, help="Server page size cap (maxRecordCount)")
+    parser.add_argument('--edit', type=int, default=0)
+    parser.add_argument('--delete', type=int, default=0)
+    parser.add_argument('--add', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.data, 'r', encoding='utf-8') as f:
+        features = json.load(f)['features']
+    features = simulate_changes(features, args.edit, args.delete, args.add, args.seed)
+    features.sort(key=lambda f: f['attributes']['objectid'])
+
+    app = tornado.web.Application([
+        (r'/([^/]+)/query', QueryHandler, {'features': features, 'max_records': args.max_records}),
+    ])
+    app.listen(args.port, address='127.0.0.1')
+    print(f"✓ Serving {len(features)} features on http://127.0.0.1:{args.port}/layer")
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == '__main__':
+    main()